@@ -1,13 +1,12 @@
+import asyncio
 import logging
 from os import makedirs
-from typing import Any
 from os.path import join
-from collections.abc import Callable, Awaitable
+from weakref import WeakKeyDictionary
 
-from flask import Flask, has_app_context
+from flask import Flask, request, has_app_context, has_request_context
 from celery import Celery
-from aiogram import Bot, Dispatcher, BaseMiddleware
-from aiogram.types import Update
+from aiogram import Bot, Dispatcher
 from flask_limiter import Limiter
 from sqlalchemy.orm import sessionmaker, scoped_session
 from flask_sqlalchemy import SQLAlchemy
@@ -15,16 +14,23 @@ from flask_limiter.util import get_remote_address
 from cryptography.fernet import Fernet
 from aiogram.dispatcher.router import Router
 from aiogram.fsm.storage.redis import RedisStorage
+from aiogram.client.session.aiohttp import AiohttpSession
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 
 from .config import LS_INDEX, BOT_TOKEN, LOGS_PATH
 from .config import LS_RETRY_CNT, REDIS_ADDRESS
 from .config import CONFIG_RETRY_CNT, FERNET_PRIVATE_KEY
 from .config import RUN_METHOD_RETRY_CNT, Flask_Config
+from .config import BOT_SESSION_POOL_SIZE
+from .config import ASYNC_VIEWS_LIMIT
 from .utils.ton_client import TonClient
+from .utils.async_runner import AsyncRunner
+from .utils.redis_client import close_redis
 
 _app = None
 _session_factory = None
 _Session = None
+_async_engines = WeakKeyDictionary()
 
 _lidum_logger = None
 _bot_logger = None
@@ -33,6 +39,9 @@ db = SQLAlchemy()
 fernet = Fernet(FERNET_PRIVATE_KEY)
 limiter = Limiter(get_remote_address, storage_uri=REDIS_ADDRESS, default_limits=["5 per second"])
 
+# Общий цикл событий асинхронных обработчиков Flask
+views_runner = AsyncRunner(max_concurrency=ASYNC_VIEWS_LIMIT, on_stop=close_redis)
+
 client = TonClient(is_testnet=Flask_Config.TESTNET,
                    ls_index=LS_INDEX,
                    ls_retry_cnt=LS_RETRY_CNT,
@@ -91,33 +100,43 @@ def get_session(app: Flask):
     return _session_factory, _Session
 
 
-def create_bot(app: Flask):
-    """Создает экземпляр Telegram-бота, работающий в контексте app."""
+def get_async_session():
+    """Возвращает новую асинхронную сессию базы данных для текущего цикла событий.
 
-    bot = Bot(token=BOT_TOKEN)
+    Соединения asyncpg привязаны к циклу событий, поэтому для каждого цикла создается свой
+    движок с пулом соединений. Асинхронные обработчики Flask выполняются в общем цикле
+    `views_runner`, поэтому используют один пул соединений на процесс.
+    """
 
-    storage = RedisStorage.from_url(REDIS_ADDRESS)
-    dp = Dispatcher(storage=storage)
+    engine = _async_engines.get(asyncio.get_running_loop())
 
-    router = Router()
-    dp.include_router(router)
+    if engine is None:
+        engine = create_async_engine(
+            Flask_Config.SQLALCHEMY_ASYNC_DATABASE_URI,
+            pool_size=20,
+            max_overflow=10,
+            pool_timeout=30,
+            pool_recycle=1800,
+        )
+
+        _async_engines[asyncio.get_running_loop()] = engine
 
-    class AppContextMiddleware(BaseMiddleware):
+    return AsyncSession(bind=engine, expire_on_commit=False)
 
-        def __init__(self, app: Flask):
-            self.app = app
-            super().__init__()
 
-        async def __call__(
-            self,
-            handler: Callable[[Update, dict[str, Any]], Awaitable[Any]],
-            event: Update,
-            data: dict[str, Any],
-        ):
-            with self.app.app_context():
-                return await handler(event, data)
+def create_bot():
+    """Создает экземпляр Telegram-бота.
 
-    dp.update.middleware(AppContextMiddleware(app))
+    Все запросы бота к Bot API выполняются через одну сессию с пулом соединений.
+    """
+
+    bot = Bot(token=BOT_TOKEN, session=AiohttpSession(limit=BOT_SESSION_POOL_SIZE))
+
+    storage = RedisStorage.from_url(REDIS_ADDRESS)
+    dp = Dispatcher(storage=storage)
+
+    router = Router()
+    dp.include_router(router)
 
     return bot, dp, router
 
@@ -131,6 +150,8 @@ def create_celery(app: Flask):
         "broker_url": app.config["CELERY_BROKER_URL"],
         "result_backend": app.config["CELERY_RESULT_BACKEND"],
         "broker_connection_retry_on_startup": app.config["CELERY_BROKER_CONNECTION_RETRY_ON_STARTUP"],
+        "worker_pool": app.config["CELERY_WORKER_POOL"],
+        "worker_concurrency": app.config["CELERY_WORKER_CONCURRENCY"],
     })
 
     TaskBase = celery.Task
@@ -159,10 +180,31 @@ def get_app():
     return _app
 
 
+class LidumFlask(Flask):
+    """Flask, выполняющий асинхронные обработчики в общем цикле событий `views_runner`.
+
+    По умолчанию каждый асинхронный обработчик выполняется в новом цикле событий, и
+    клиенты, привязанные к циклу (движок базы данных, Redis), создаются заново на каждый
+    запрос. В общем цикле они создаются один раз на процесс. Тело JSON-запроса читается
+    заранее в потоке запроса, чтобы не блокировать общий цикл.
+    """
+
+    def async_to_sync(self, func):
+
+        def wrapper(*args, **kwargs):
+
+            if has_request_context() and request.is_json:
+                request.get_json(silent=True)
+
+            return views_runner.run(func(*args, **kwargs))
+
+        return wrapper
+
+
 def create_app():
     """Создает экземпляр Flask и инициализирует необходимые части приложения."""
 
-    app = Flask(__name__)
+    app = LidumFlask(__name__)
     app.config.from_object(Flask_Config)
 
     limiter.init_app(app)
@@ -1,4 +1,5 @@
-from datetime import datetime, timezone
+import asyncio
+from datetime import timedelta
 
 from aiogram import types
 from aiogram.types import BotCommand, CallbackQuery
@@ -6,43 +7,46 @@ from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
-from .. import get_app, create_bot, get_loggers, get_session
+from .. import get_app, create_bot, get_loggers, get_async_session
 from ..config import APP_NAME, ADMIN_IDS, BOT_USERNAME
-from ..utils.db import Telegram_User, tg_users, event_by_id
-from ..utils.db import tg_user_by_id, event_ids_by_tg_id
-from ..utils.db import add_database_entries
+from ..config import WEBHOOK_URL, NEWSLETTER_ACTIVE_DAYS
+from ..config import BOT_UPDATES_CONCURRENCY
+from ..utils.db import utc_now
+from ..utils.async_db import tg_user_ids, events_by_tg_id
+from ..utils.user_touches import touch_tg_user
+from ..utils.redis_client import close_redis
 from .newsletter import Newsletter, Newsletter_Form
+from .broadcast import Broadcast, BroadcastRunningError, active_broadcasts
+from .webhook import UpdatesLimiter, run_webhook, delete_webhook
 from ..utils.crypto import encrypt
 
 app = get_app()
-Session = get_session(app)[1]
-bot, dp, router = create_bot(app)
+bot, dp, router = create_bot()
 logger = get_loggers()[1]
 
 newsletter = Newsletter(bot)
+running_newsletters = set()
 
 
 @router.callback_query(lambda c: c.data == "events_handler")
 async def events_handler(callback: CallbackQuery):
 
     user_id = callback.message.chat.id
-    session = Session()
+    session = get_async_session()
 
     try:
-        event_ids = event_ids_by_tg_id(telegram_id=user_id, session=session)
+        events = await events_by_tg_id(telegram_id=user_id, session=session)
 
         markup = InlineKeyboardBuilder()
 
-        if event_ids == []:
+        if events == []:
             markup.button(text="Back", callback_data="back_to_start")
             await callback.message.edit_text(text="You do not have any created events", reply_markup=markup.as_markup())
 
         else:
-            for id in event_ids:
-                event = event_by_id(event_id=id, session=session)
-
+            for event in events:
                 markup.button(text=event.event_name,
-                              url=f"https://t.me/{BOT_USERNAME}/{APP_NAME}?startapp=minter-{encrypt(id)}")
+                              url=f"https://t.me/{BOT_USERNAME}/{APP_NAME}?startapp=minter-{encrypt(event.id)}")
 
             markup.button(text="Back", callback_data="back_to_start")
             markup.adjust(1)
@@ -53,7 +57,7 @@ async def events_handler(callback: CallbackQuery):
         logger.error(f"Error when displaying the list of events: {e}")
 
     finally:
-        session.close()
+        await session.close()
 
 
 @router.callback_query(lambda c: c.data == "cancel_newsletter")
@@ -61,24 +65,93 @@ async def cancel_newsletter(callback: CallbackQuery):
     await newsletter.delete_preview_msg()
 
 
-@router.callback_query(lambda c: c.data == "send_newsletter")
+@router.callback_query(lambda c: c.data and c.data.startswith("send_newsletter:"))
 async def send_newslwetter(callback: CallbackQuery):
 
-    session = Session()
+    segment = callback.data.split(":")[1]
+
+    try:
+        broadcast = await newsletter.create_broadcast(segment)
+
+    except Exception as e:
+        logger.error(f"Error creating the newsletter: {e}")
+        await callback.answer(text="The newsletter could not be started.")
+        return
+
+    # Рассылка выполняется в отдельной задаче, чтобы не занимать обработчик обновлений
+    # и сессию базы данных на всё время рассылки
+    start_newsletter(broadcast.broadcast_id)
+
+    await callback.answer(text="The newsletter has been started.")
+
+
+def newsletter_recipients(segment: str | None, session):
+    """Возвращает части id получателей рассылки для группы пользователей:
+    `authors` — авторы событий, `active` — заходившие в бота за последние
+    `NEWSLETTER_ACTIVE_DAYS` дней, иначе все пользователи."""
+
+    match segment:
+
+        case "authors":
+            return tg_user_ids(session, authors_only=True)
+
+        case "active":
+            return tg_user_ids(session, entered_since=utc_now() - timedelta(days=NEWSLETTER_ACTIVE_DAYS))
+
+        case _:
+            return tg_user_ids(session)
+
+
+def newsletter_report(stats: dict[str, int]):
+    return (f"The newsletter has been sent. Sent: {stats['sent']}, failed: {stats['failed']}, "
+            f"blocked the bot: {stats['blocked']}.")
+
+
+async def run_newsletter(broadcast_id: str):
+    """Выполняет новую или продолжает прерванную рассылку и сообщает о её завершении в
+    чат, из которого она была запущена. Получатели читаются в собственной сессии базы
+    данных."""
+
+    session = get_async_session()
 
     try:
-        tg_users_ids = [user.id for user in tg_users(session)]
+        broadcast = Broadcast(bot, broadcast_id=broadcast_id)
+        payload = await broadcast.payload()
+
+        if payload is None:
+            logger.error(f"The message of the newsletter {broadcast_id} was not found")
+            return
+
+        logger.info(f"Running the newsletter {broadcast_id}")
 
-        await newsletter.send_newsletter(tg_users_ids)
+        stats = await broadcast.run(newsletter_recipients(payload.get("segment"), session))
 
-        await callback.message.delete()
-        await callback.message.answer(text="The newsletter has been sent.")
+        await bot.delete_message(chat_id=payload["from_chat_id"], message_id=payload["message_id"])
+        await bot.send_message(chat_id=payload["from_chat_id"], text=newsletter_report(stats))
+
+    except BroadcastRunningError:
+        logger.info(f"The newsletter {broadcast_id} is already running in another process")
 
     except Exception as e:
-        logger.error(f"Error sending the newsletter: {e}")
+        logger.error(f"Error running the newsletter {broadcast_id}: {e}")
 
     finally:
-        session.close()
+        await session.close()
+
+
+def start_newsletter(broadcast_id: str):
+    """Запускает рассылку в фоновой задаче."""
+
+    task = asyncio.create_task(run_newsletter(broadcast_id))
+
+    running_newsletters.add(task)
+    task.add_done_callback(running_newsletters.discard)
+
+
+async def resume_newsletters():
+
+    for broadcast_id in await active_broadcasts():
+        start_newsletter(broadcast_id)
 
 
 @router.message(Newsletter_Form.newsletter_state)
@@ -86,7 +159,9 @@ async def set_newsletter_data(message: types.Message, state: FSMContext):
 
     markup = InlineKeyboardBuilder()
 
-    markup.button(text="Send", callback_data="send_newsletter")
+    markup.button(text="Send to everyone", callback_data="send_newsletter:all")
+    markup.button(text="Send to authors", callback_data="send_newsletter:authors")
+    markup.button(text=f"Send to active in {NEWSLETTER_ACTIVE_DAYS} days", callback_data="send_newsletter:active")
     markup.button(text="Cancel", callback_data="cancel_newsletter")
 
     markup.adjust(1)
@@ -141,27 +216,11 @@ async def admin_message(message: types.Message, edit: bool = False):
 
 async def start_message(message: types.Message, edit: bool = False):
 
-    session = Session()
+    session = get_async_session()
 
     try:
-        user_id = message.chat.id
-        user = tg_user_by_id(telegram_id=user_id, session=session)
-
         # Запись id пользователя в БД
-        if user is None:
-
-            new_tg_user = Telegram_User(
-                id=user_id,
-                username=message.chat.username,
-            )
-
-            add_database_entries(entries=new_tg_user, session=session)
-
-        else:
-            user.last_enter = datetime.now(timezone.utc)
-            user.username = message.chat.username
-
-            session.commit()
+        await touch_tg_user(telegram_id=message.chat.id, username=message.chat.username, session=session)
 
         markup = InlineKeyboardBuilder()
 
@@ -182,7 +241,7 @@ async def start_message(message: types.Message, edit: bool = False):
         logger.error(f"Error sending the start message: {e}")
 
     finally:
-        session.close()
+        await session.close()
 
 
 @router.callback_query(lambda c: c.data == "back_to_admin")
@@ -216,5 +275,19 @@ async def set_commands():
 
 if __name__ == "__main__":
     logger.info("Bot started")
+
+    # Ограничение количества одновременно обрабатываемых обновлений, ожидаемое при остановке
+    updates_limiter = UpdatesLimiter(BOT_UPDATES_CONCURRENCY)
+    dp.update.outer_middleware(updates_limiter)
+    dp["updates_limiter"] = updates_limiter
+
     dp.startup.register(set_commands)
-    dp.run_polling(bot)
+    dp.startup.register(resume_newsletters)
+    dp.shutdown.register(close_redis)
+
+    if WEBHOOK_URL:
+        run_webhook(bot, dp)
+
+    else:
+        dp.startup.register(delete_webhook)
+        dp.run_polling(bot)
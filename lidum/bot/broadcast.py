@@ -0,0 +1,330 @@
+import json
+import time
+import asyncio
+from collections.abc import AsyncIterable
+
+from aiogram import Bot
+from aiogram.types import InlineKeyboardMarkup
+from redis.exceptions import LockError
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError
+
+from ..config import BROADCAST_RATE, BROADCAST_CONCURRENCY
+from ..config import BROADCAST_MAX_RETRIES
+from ..utils.redis_client import get_redis
+
+# Результаты отправки сообщения пользователю
+SENT = "sent"
+FAILED = "failed"
+BLOCKED = "blocked"
+
+# Множество идентификаторов незавершенных рассылок
+ACTIVE_BROADCASTS_KEY = "lidum:broadcasts"
+
+# Время хранения прогресса завершенной рассылки в секундах
+PROGRESS_TTL = 7 * 24 * 60 * 60
+
+# Время жизни блокировки запущенной рассылки в секундах. Пока рассылка идет, блокировка
+# продлевается, а после падения процесса освобождается сама
+RUN_LOCK_TTL = 60
+
+
+class BroadcastRunningError(Exception):
+    """Рассылка уже выполняется в этом или другом процессе."""
+
+
+class TokenBucket:
+    """Ограничение частоты запросов по алгоритму token bucket, общее для всех
+    отправителей рассылки.
+
+    :param float rate: Количество запросов в секунду.
+    :param int capacity: Максимальное количество запросов, отправляемых подряд без ожидания.
+    """
+
+    def __init__(self, rate: float, capacity: int = 1):
+
+        self.rate = rate
+        self.capacity = capacity
+
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._paused_until = 0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Ожидает, пока можно будет отправить очередной запрос."""
+
+        async with self._lock:
+
+            while True:
+                now = time.monotonic()
+
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, delay: float):
+        """Приостанавливает все запросы на `delay` секунд, например после ответа 429."""
+
+        self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        self._tokens = 0
+
+
+class Broadcast:
+    """Рассылка копии сообщения пользователям бота.
+
+    Сообщения отправляются `concurrency` параллельными отправителями с общим ограничением
+    частоты `rate` сообщений в секунду. При ответе 429 все отправители ждут `retry_after`
+    секунд. Сообщение рассылки, получившие его пользователи и счетчики результатов
+    хранятся в Redis, поэтому прерванная рассылка при повторном запуске продолжается с
+    того же места. Одновременно рассылка выполняется только один раз: запуск защищен
+    блокировкой в Redis по идентификатору рассылки.
+
+    :param Bot bot: Экземпляр бота.
+    :param str broadcast_id: Идентификатор рассылки.
+    :param float rate: Максимальное количество сообщений в секунду.
+    :param int concurrency: Количество одновременно отправляемых сообщений.
+    :param int max_retries: Максимальное количество повторов сообщения после ответа 429.
+
+    Examples:
+    ```python
+    broadcast = Broadcast(bot, broadcast_id=f"{chat_id}:{message_id}")
+
+    await broadcast.create(from_chat_id=chat_id, message_id=message_id)
+    stats = await broadcast.run(tg_user_ids(session))
+    ```
+    """
+
+    def __init__(self,
+                 bot: Bot,
+                 broadcast_id: str,
+                 rate: float = BROADCAST_RATE,
+                 concurrency: int = BROADCAST_CONCURRENCY,
+                 max_retries: int = BROADCAST_MAX_RETRIES):
+
+        self.bot = bot
+        self.broadcast_id = broadcast_id
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+
+        self.bucket = TokenBucket(rate)
+
+    async def create(self,
+                     from_chat_id: int,
+                     message_id: int,
+                     reply_markup: InlineKeyboardMarkup | None = None,
+                     segment: str | None = None):
+        """Сохраняет сообщение рассылки и отмечает рассылку незавершенной.
+
+        :param int from_chat_id: Чат с сообщением рассылки.
+        :param int message_id: Идентификатор сообщения рассылки.
+        :param InlineKeyboardMarkup | None reply_markup: Кнопки сообщения рассылки.
+        :param str | None segment: Название группы получателей, нужное для продолжения
+            рассылки.
+        """
+        payload = {
+            "from_chat_id": from_chat_id,
+            "message_id": message_id,
+            "reply_markup": reply_markup.model_dump_json(exclude_none=True) if reply_markup else None,
+            "segment": segment,
+        }
+
+        redis = get_redis()
+
+        await redis.set(self._key("payload"), json.dumps(payload), nx=True)
+        await redis.sadd(ACTIVE_BROADCASTS_KEY, self.broadcast_id)
+
+    async def payload(self):
+        """Возвращает сохраненное сообщение рассылки, либо None."""
+
+        payload = await get_redis().get(self._key("payload"))
+        return json.loads(payload) if payload is not None else None
+
+    async def run(self, users_ids: AsyncIterable[list[int]]):
+        """Отправляет сообщение рассылки пользователям, которые его еще не получили.
+
+        Пользователи читаются по частям по мере отправки, поэтому в памяти находится не
+        больше нескольких частей.
+
+        :param AsyncIterable[list[int]] users_ids: Части id пользователей.
+        :return: Количество отправленных, неотправленных сообщений и пользователей,
+            заблокировавших бота, вида `{"sent": 0, "failed": 0, "blocked": 0}`.
+        :rtype: dict[str, int]
+
+        :raise ValueError: Если сообщение рассылки не сохранено.
+        :raise BroadcastRunningError: Если рассылка уже выполняется.
+        """
+        payload = await self.payload()
+
+        if payload is None:
+            raise ValueError(f"The message of the broadcast {self.broadcast_id} was not found")
+
+        # Пустая клавиатура, чтобы копия не унаследовала кнопки исходного сообщения
+        if payload["reply_markup"] is not None:
+            reply_markup = InlineKeyboardMarkup.model_validate_json(payload["reply_markup"])
+
+        else:
+            reply_markup = InlineKeyboardMarkup(inline_keyboard=[])
+
+        lock = get_redis().lock(self._key("running"), timeout=RUN_LOCK_TTL)
+
+        if not await lock.acquire(blocking=False):
+            raise BroadcastRunningError(f"The broadcast {self.broadcast_id} is already running")
+
+        heartbeat = asyncio.create_task(self._keep_lock(lock))
+        sending = asyncio.create_task(self._run(users_ids, payload, reply_markup))
+
+        try:
+            # Блокировка продлевается, пока идет рассылка. Если продлить её не удалось,
+            # рассылка останавливается, чтобы её не продолжил параллельно другой процесс
+            await asyncio.wait({heartbeat, sending}, return_when=asyncio.FIRST_COMPLETED)
+
+            if heartbeat.done():
+                sending.cancel()
+                await asyncio.gather(sending, return_exceptions=True)
+                heartbeat.result()
+
+            await sending
+            return await self._finish()
+
+        finally:
+            heartbeat.cancel()
+            sending.cancel()
+
+            try:
+                await lock.release()
+
+            except LockError:
+                pass
+
+    async def _run(self, users_ids: AsyncIterable[list[int]], payload: dict, reply_markup: InlineKeyboardMarkup):
+        """Передает пользователей отправителям через ограниченную очередь. Если один из
+        отправителей или чтение пользователей завершается ошибкой, остальные задачи
+        отменяются, поэтому чтение не зависает на заполненной очереди."""
+
+        queue = asyncio.Queue(maxsize=self.concurrency * 2)
+
+        async def sender():
+
+            while (user_id := await queue.get()) is not None:
+                result = await self._send(user_id, payload, reply_markup)
+                await self._record(user_id, result)
+
+        async def producer():
+
+            async for chunk in users_ids:
+
+                for user_id in await self._pending(chunk):
+                    await queue.put(user_id)
+
+            for _ in range(self.concurrency):
+                await queue.put(None)
+
+        tasks = [asyncio.create_task(producer())]
+        tasks += [asyncio.create_task(sender()) for _ in range(self.concurrency)]
+
+        try:
+            await asyncio.gather(*tasks)
+
+        except BaseException:
+
+            for task in tasks:
+                task.cancel()
+
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    async def _keep_lock(self, lock):
+        """Продлевает блокировку запущенной рассылки.
+
+        :raise LockError: Если блокировка уже истекла или занята другим процессом.
+        """
+
+        while True:
+            await asyncio.sleep(RUN_LOCK_TTL / 3)
+
+            try:
+                await lock.reacquire()
+
+            except Exception as e:
+                print(f"Failed to extend the lock of the broadcast {self.broadcast_id}, stopping it: {e}")
+                raise
+
+    async def _pending(self, users_ids: list[int]):
+        """Возвращает пользователей, которым сообщение еще не отправлялось."""
+
+        if not users_ids:
+            return []
+
+        done = await get_redis().smismember(self._key("done"), users_ids)
+        return [user_id for user_id, is_done in zip(users_ids, done) if not is_done]
+
+    async def _send(self, user_id: int, payload: dict, reply_markup: InlineKeyboardMarkup):
+        """Отправляет копию сообщения пользователю и возвращает результат отправки."""
+
+        for _ in range(self.max_retries + 1):
+            await self.bucket.acquire()
+
+            try:
+                await self.bot.copy_message(
+                    chat_id=user_id,
+                    from_chat_id=payload["from_chat_id"],
+                    message_id=payload["message_id"],
+                    reply_markup=reply_markup,
+                )
+
+                return SENT
+
+            except TelegramRetryAfter as e:
+                self.bucket.pause(e.retry_after)
+
+            except TelegramForbiddenError:
+                return BLOCKED
+
+            except Exception as e:
+                print(f"Failed to send a message to the user {user_id}: {e}")
+                return FAILED
+
+        print(f"Failed to send a message to the user {user_id}: too many requests")
+        return FAILED
+
+    async def _record(self, user_id: int, result: str):
+        """Сохраняет результат отправки сообщения пользователю."""
+
+        async with get_redis().pipeline(transaction=True) as pipe:
+            pipe.sadd(self._key("done"), user_id)
+            pipe.hincrby(self._key("stats"), result, 1)
+            await pipe.execute()
+
+    async def _finish(self):
+        """Отмечает рассылку завершенной и возвращает её итоговую статистику."""
+
+        redis = get_redis()
+        stats = await redis.hgetall(self._key("stats"))
+
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.srem(ACTIVE_BROADCASTS_KEY, self.broadcast_id)
+
+            for name in ("payload", "done", "stats"):
+                pipe.expire(self._key(name), PROGRESS_TTL)
+
+            await pipe.execute()
+
+        return {result: int(stats.get(result.encode(), 0)) for result in (SENT, FAILED, BLOCKED)}
+
+    def _key(self, name: str):
+        return f"lidum:broadcast:{self.broadcast_id}:{name}"
+
+
+async def active_broadcasts():
+    """Возвращает идентификаторы незавершенных рассылок."""
+
+    return [broadcast_id.decode() for broadcast_id in await get_redis().smembers(ACTIVE_BROADCASTS_KEY)]
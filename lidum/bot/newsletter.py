@@ -3,6 +3,8 @@ from aiogram.types import Message, InlineKeyboardMarkup
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
 
+from .broadcast import Broadcast
+
 
 class Newsletter_Form(StatesGroup):
     newsletter_state = State()
@@ -73,73 +75,36 @@ class Newsletter:
 
         await self.bot.delete_message(chat_id=self.chat_id, message_id=preview_msg_id)
 
-    async def send_newsletter(self, users_ids):
+    async def create_broadcast(self, segment: str | None = None):
+        """Сохраняет рассылку предпросмотрового сообщения с кнопками исходного сообщения
+        и возвращает её. Сама рассылка запускается отдельно, см. `Broadcast.run`.
 
-        message = self.message
+        :param segment: Название группы получателей.
+        :rtype: Broadcast
+
+        :raise ValueError: Если предпросмотровое сообщение не найдено, например если
+            рассылка уже запущена.
+        """
 
         data = await self.state.get_data()
+        preview_msg_id = data.get("preview_msg_id")
 
-        newsletter_text = data.get("newsletter_text")
-        newsletter_photo = data.get("newsletter_photo")
-        newsletter_caption = data.get("newsletter_caption")
-        newsletter_video = data.get("newsletter_video")
-        newsletter_audio = data.get("newsletter_audio")
-        newsletter_animation = data.get("newsletter_audio")
-
-        bot = self.bot
-
-        for user_id in users_ids:
-
-            try:
-                if newsletter_text:
-                    await bot.send_message(
-                        chat_id=user_id,
-                        text=newsletter_text,
-                        entities=message.entities,
-                        reply_markup=self.user_msg_markup,
-                    )
-
-                elif newsletter_photo:
-                    await bot.send_photo(
-                        chat_id=user_id,
-                        photo=newsletter_photo,
-                        caption=newsletter_caption,
-                        caption_entities=message.caption_entities,
-                        reply_markup=self.user_msg_markup,
-                    )
-
-                elif newsletter_video:
-                    await bot.send_video(
-                        chat_id=user_id,
-                        video=newsletter_video,
-                        caption=newsletter_caption,
-                        caption_entities=message.caption_entities,
-                        reply_markup=self.user_msg_markup,
-                    )
-
-                elif newsletter_audio:
-                    await bot.send_audio(
-                        chat_id=user_id,
-                        audio=newsletter_audio,
-                        caption=newsletter_caption,
-                        caption_entities=message.caption_entities,
-                        reply_markup=self.user_msg_markup,
-                    )
-
-                elif newsletter_animation:
-                    await bot.send_animation(
-                        chat_id=user_id,
-                        animation=newsletter_animation,
-                        caption=newsletter_caption,
-                        caption_entities=message.caption_entities,
-                        reply_markup=self.user_msg_markup,
-                    )
-
-            except Exception as e:
-                print(f"Failed to send a message to the user {user_id}: {e}")
+        if preview_msg_id is None:
+            raise ValueError("The preview message of the newsletter was not found")
+
+        broadcast = Broadcast(self.bot, broadcast_id=f"{self.chat_id}:{preview_msg_id}")
+
+        await broadcast.create(
+            from_chat_id=self.chat_id,
+            message_id=preview_msg_id,
+            reply_markup=self.user_msg_markup,
+            segment=segment,
+        )
 
         await self.state.clear()
 
+        return broadcast
+
     async def _text_state(self):
 
         message = self.message
@@ -0,0 +1,111 @@
+import asyncio
+import logging
+from typing import Any
+from collections.abc import Callable, Awaitable
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher, BaseMiddleware
+from aiogram.types import Update
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+from ..config import WEBHOOK_URL, WEBHOOK_HOST, WEBHOOK_PATH
+from ..config import WEBHOOK_PORT, WEBHOOK_SECRET
+from ..config import BOT_SHUTDOWN_TIMEOUT
+
+# Максимальное количество одновременных соединений Telegram с вебхуком
+WEBHOOK_MAX_CONNECTIONS = 100
+
+logger = logging.getLogger("bot")
+
+
+class UpdatesLimiter(BaseMiddleware):
+    """Ограничивает количество одновременно обрабатываемых обновлений бота.
+
+    Обновления сверх `limit` ждут своей очереди, а не создают неограниченное количество
+    задач. Ограничитель также считает обрабатываемые обновления, чтобы при остановке
+    бота дождаться их завершения.
+
+    :param int limit: Максимальное количество одновременно обрабатываемых обновлений.
+    """
+
+    def __init__(self, limit: int):
+
+        self._semaphore = asyncio.Semaphore(limit)
+        self._in_flight = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: dict[str, Any],
+    ):
+        self._in_flight += 1
+        self._idle.clear()
+
+        try:
+            async with self._semaphore:
+                return await handler(event, data)
+
+        finally:
+            self._in_flight -= 1
+
+            if self._in_flight == 0:
+                self._idle.set()
+
+    async def drain(self, timeout: float):
+        """Ожидает завершения обработки всех обновлений, но не дольше `timeout` секунд.
+
+        :return: Завершилась ли обработка всех обновлений.
+        :rtype: bool
+        """
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+
+        except asyncio.TimeoutError:
+            return False
+
+        return True
+
+
+def run_webhook(bot: Bot, dp: Dispatcher):
+    """Запускает бота в режиме вебхука на aiohttp-сервере.
+
+    Обновления принимаются по адресу `WEBHOOK_URL` + `WEBHOOK_PATH` и обрабатываются в
+    фоне, поэтому Telegram сразу получает ответ. При остановке сервер перестает
+    принимать обновления и ждет завершения уже принятых не дольше
+    `BOT_SHUTDOWN_TIMEOUT` секунд, после чего закрывает сессию бота.
+    """
+
+    async def set_webhook(bot: Bot):
+        await bot.set_webhook(
+            url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+
+    async def drain_updates(app: web.Application):
+        logger.info("Waiting for the bot updates to be processed...")
+
+        if not await dp["updates_limiter"].drain(BOT_SHUTDOWN_TIMEOUT):
+            logger.error(f"The bot updates were not processed in {BOT_SHUTDOWN_TIMEOUT} seconds")
+
+    dp.startup.register(set_webhook)
+
+    app = web.Application()
+
+    # Ожидание обновлений регистрируется раньше закрытия сессии бота обработчиком вебхука
+    app.on_shutdown.append(drain_updates)
+
+    SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=WEBHOOK_SECRET).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+
+    web.run_app(app, host=WEBHOOK_HOST, port=WEBHOOK_PORT, shutdown_timeout=BOT_SHUTDOWN_TIMEOUT)
+
+
+async def delete_webhook(bot: Bot):
+    """Удаляет вебхук, чтобы бот мог получать обновления через long polling."""
+
+    await bot.delete_webhook()
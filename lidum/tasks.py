@@ -1,19 +1,35 @@
-import asyncio
+import time
 
 from sqlalchemy import create_engine
+from celery.signals import worker_shutdown
+from celery.signals import worker_process_shutdown
 from sqlalchemy.orm import sessionmaker
 from celery.exceptions import MaxRetriesExceededError
 
 from . import client, get_app, create_celery
 from .utils import tasks_statuses
-from .config import MINT_ATTEMPS_CNT, MINT_RETRY_DELAY
-from .config import TRANSFER_ATTEMPS_CNT, TRANSFER_RETRY_DELAY
-from .config import TRANSACTION_ATTEMPS_CNT
-from .config import TRANSACTION_RETRY_DELAY
+from .config import DIRECT_MINT, MINT_ATTEMPS_CNT
+from .config import MINT_RETRY_DELAY, ASYNC_TASKS_LIMIT
+from .config import CLAIMS_BATCH_SIZE, CLAIMS_BATCH_WINDOW
+from .config import TRANSACTION_TIMEOUT, TRANSFER_ATTEMPS_CNT
+from .config import TRANSFER_RETRY_DELAY
+from .config import USER_TOUCH_WRITE_BEHIND
+from .config import USER_TOUCH_FLUSH_INTERVAL
+from .config import TRANSACTIONS_SWEEP_INTERVAL
 from .utils.db import tg_user_by_id, author_by_tg_id
-from .utils.db import transaction_by_id
+from .utils.db import upsert_tg_users, unconfirmed_transactions
+from .utils.db import update_transactions_statuses
+from .utils.path import get_nft_image_path
+from .utils.image import process_upload
+from .utils.claims import claims_cnt, pop_claims, push_claim
+from .utils.claims import release_flush, reserve_flush
+from .utils.convert import hash_to_hex, utc_timestamp
 from .utils.convert import address_to_friendly
-from .utils.ton_client import get_transaction_data
+from .utils.metadata import create_metadata
+from .utils.ton_client import account_transactions
+from .utils.async_runner import AsyncRunner
+from .utils.redis_client import close_redis
+from .utils.user_touches import pop_touches, restore_touches
 
 app = get_app()
 celery = create_celery(app)
@@ -28,69 +44,205 @@ engine = create_engine(
 
 session_factory = sessionmaker(bind=engine)
 
+# Допустимое расхождение времени транзакции в блокчейне и записи в базе данных
+TRANSACTION_TIME_MARGIN = 60
 
-@celery.task(queue="transactions_test",
-             bind=True,
-             max_retries=TRANSACTION_ATTEMPS_CNT,
-             default_retry_delay=TRANSACTION_RETRY_DELAY)
-def process_transaction(self, transaction_id: int):
-    """Запускает фоновую задачу на проверку статуса транзакции. Обновляет статус этой
-    транзакции в базе данных после окончания задачи.
 
-    :param transaction_id: Идентификатор транзакции в базе данных
+async def close_clients():
+    """Закрывает клиентов TON и Redis цикла событий процесса воркера."""
+
+    await client.close()
+    await close_redis()
+
+
+runner = AsyncRunner(max_concurrency=ASYNC_TASKS_LIMIT, on_stop=close_clients)
+
+
+def run_async(coro):
+    """Выполняет корутину клиента TON в общем цикле событий процесса воркера."""
+
+    return runner.run(coro)
+
+
+@worker_shutdown.connect
+@worker_process_shutdown.connect
+def stop_runner(**kwargs):
+    """Закрывает клиентов и останавливает цикл событий при остановке воркера."""
+
+    runner.stop()
+
+
+@celery.task(queue="transactions_test")
+def sweep_transactions():
+    """Периодическая задача проверки статусов всех неподтвержденных транзакций.
+
+    В базе данных хранится хэш внешнего сообщения, которое кошелек пользователя
+    подписал и отправил через TON Connect. Это сообщение входит в транзакцию кошелька
+    отправителя, поэтому для каждого отправителя последние транзакции запрашиваются
+    постранично одним обходом и сопоставляются с транзакциями из базы данных по хэшу
+    входящего сообщения, после чего статусы обновляются одним запросом. Транзакции, не
+    найденные в блокчейне за `TRANSACTION_TIMEOUT` секунд, помечаются как `CRUSHED`.
     """
 
-    print(f"Processing transaction {transaction_id}...")
     session = session_factory()
 
     try:
-        transaction = transaction_by_id(transaction_id=transaction_id, session=session)
+        transactions = unconfirmed_transactions(session=session)
 
-        if transaction is None:
-            print(f"Transaction with id {transaction_id} was not found")
-            session.close()
+        if not transactions:
             return
 
-        hash = transaction.hash
-        # amount = transaction.amount
-        # source_address = transaction.source_address
-        # destination_address = transaction.destination_address
-        is_testnet = transaction.is_testnet
+        print(f"Checking {len(transactions)} unconfirmed transactions...")
+
+        # Группировка транзакций по отправителю и сети
+        groups = {}
+
+        for transaction in transactions:
+            groups.setdefault((transaction.source_address, transaction.is_testnet), []).append(transaction)
+
+        statuses = {}
+        deadline = time.time() - TRANSACTION_TIMEOUT
+
+        for (source_address, is_testnet), group in groups.items():
+            created_at = [utc_timestamp(transaction.created_at) for transaction in group]
+
+            try:
+                chain_transactions = account_transactions(
+                    account=source_address,
+                    is_testnet=is_testnet,
+                    since_utime=int(min(created_at)) - TRANSACTION_TIME_MARGIN,
+                )
+
+            except Exception as e:
+                print(f"Error when getting transactions of the wallet {source_address}: {e}")
+                continue
+
+            results = {
+                hash_to_hex(chain_transaction.in_msg.hash): chain_transaction.success
+                for chain_transaction in chain_transactions if chain_transaction.in_msg is not None
+            }
+
+            for transaction, transaction_created_at in zip(group, created_at):
+
+                try:
+                    success = results.get(hash_to_hex(transaction.hash))
+
+                except ValueError:
+                    print(f"The transaction {transaction.id} has an invalid hash {transaction.hash}")
+                    success = None
+
+                if success is True:
+                    statuses[transaction.id] = tasks_statuses.SUCCESS
+
+                elif success is False:
+                    statuses[transaction.id] = tasks_statuses.FAILED
+
+                elif transaction_created_at < deadline:
+                    statuses[transaction.id] = tasks_statuses.CRUSHED
+
+        update_transactions_statuses(statuses=statuses, session=session)
+        session.commit()
+
+        if statuses:
+            print(f"Statuses of {len(statuses)} transactions have been updated")
 
     except Exception as e:
-        print(f"Error when trying to find a transaction {transaction_id}: {e}")
+        print(f"Error when checking unconfirmed transactions: {e}")
+
+    finally:
         session.close()
+
+
+@celery.task(queue="transactions_test")
+def flush_user_touches():
+    """Периодическая задача записи накопленных входов пользователей в базу данных одним
+    запросом. Используется при включенном `USER_TOUCH_WRITE_BEHIND`."""
+
+    users = pop_touches()
+
+    if not users:
         return
 
+    session = session_factory()
+
     try:
-        print(f"Attempt {self.request.retries} / {TRANSACTION_ATTEMPS_CNT}...")
+        upsert_tg_users(users=users, session=session)
 
-        transaction.status = tasks_statuses.PENDING
-        session.commit()
+    except Exception as e:
+        print(f"Error when writing the entries of {len(users)} users: {e}")
+        restore_touches(users)
+
+    finally:
+        session.close()
 
-        transaction_data = get_transaction_data(hash=hash, is_testnet=is_testnet)
 
-        if transaction_data.success:
-            transaction.status = tasks_statuses.SUCCESS
-            print(f"Transaction with id {transaction_id} was successful!")
+celery.conf.beat_schedule = {
+    "sweep-transactions": {
+        "task": sweep_transactions.name,
+        "schedule": TRANSACTIONS_SWEEP_INTERVAL,
+    },
+}
 
-        else:
-            transaction.status = tasks_statuses.FAILED
-            print(f"Transaction with id {transaction_id} was unsuccessful!")
+if USER_TOUCH_WRITE_BEHIND:
+    celery.conf.beat_schedule["flush-user-touches"] = {
+        "task": flush_user_touches.name,
+        "schedule": USER_TOUCH_FLUSH_INTERVAL,
+    }
 
-        session.commit()
-        return
+
+@celery.task(queue="images_test")
+def process_event_image(telegram_id: str | int, collection_name: str, description: str, image_name: str, upload_id: str):
+    """Запускает фоновую задачу на сохранение загруженного изображения события в
+    директорию коллекции и создание метаданных NFT.
+
+    :param telegram_id: Идентификатор автора события в телеграме
+    :param collection_name: Название коллекции
+    :param description: Описание NFT
+    :param image_name: Название изображения NFT
+    :param upload_id: Идентификатор загруженного изображения
+    """
+
+    print(f"Launching the task of processing the image {upload_id} for the collection {collection_name}...")
+
+    try:
+        process_upload(upload_id, get_nft_image_path(collection_name, telegram_id, image_name))
+        create_metadata(telegram_id=telegram_id,
+                        collection_name=collection_name,
+                        collection_description=description,
+                        image_name=image_name)
 
     except Exception as e:
+        print(f"Error when processing the image {upload_id}: {e}")
+        raise
 
-        try:
-            raise self.retry(exc=e)
+    print(f"The image {upload_id} of the collection {collection_name} has been processed")
 
-        except MaxRetriesExceededError:
-            print(f"Error when trying to confirm the transaction {transaction_id}: {e}")
 
-            transaction.status = tasks_statuses.CRUSHED
-            session.commit()
+@celery.task(queue="mint_collection_test")
+def collection_mint_failed(request, exc, traceback, telegram_id: str | int):
+    """Отмечает минт коллекции автора неудавшимся. Вызывается при ошибке задачи, после
+    которой должен был начаться минт коллекции.
+
+    :param telegram_id: Идентификатор автора события в телеграме
+    """
+
+    print(f"The collection of the author with id {telegram_id} will not be minted: "
+          f"the task {request.id} failed with {exc!r}")
+
+    session = session_factory()
+
+    try:
+        author = author_by_tg_id(telegram_id=telegram_id, session=session)
+
+        if author is None:
+            print(f"Author with id {telegram_id} was not found")
+            return
+
+        author.collection_status = tasks_statuses.FAILED
+        session.commit()
+
+    except Exception as e:
+        print(f"Error when trying to mark the collection of the author with id {telegram_id} as failed: {e}")
 
     finally:
         session.close()
@@ -123,7 +275,7 @@ def collection_mint(self, telegram_id: str | int, collection_content_uri: str, n
             session.commit()
 
         except Exception as e:
-            raise (f"Error when trying to find an author with id {telegram_id}: {e}") from e
+            raise Exception(f"Error when trying to find an author with id {telegram_id}: {e}") from e
 
         collection = client.collection_mint_body(
             collection_content_uri=collection_content_uri,
@@ -138,7 +290,7 @@ def collection_mint(self, telegram_id: str | int, collection_content_uri: str, n
         print(f"Attempt {self.request.retries} / {MINT_ATTEMPS_CNT}...")
 
         try:
-            success = asyncio.run(client.deploy_collection(collection))
+            success = run_async(client.deploy_collection(collection))
 
             if success:
                 author.collection_status = tasks_statuses.MINTED
@@ -171,8 +323,9 @@ def collection_mint(self, telegram_id: str | int, collection_content_uri: str, n
 
 @celery.task(queue="mint_nft_test", bind=True, max_retries=MINT_ATTEMPS_CNT, default_retry_delay=MINT_RETRY_DELAY)
 def nft_mint(self, author_telegram_id: str | int, dest_wallet_address: str, collection_address: str, nft_meta: str):
-    """Запускает фоновую задачу на минт NFT в указанную коллекцию. При успешном минте
-    NFT запускает задачу на передачу NFT на указанный кошелек.
+    """Запускает фоновую задачу на минт NFT в указанную коллекцию. При `DIRECT_MINT`
+    NFT минтится сразу на указанный кошелек, иначе при успешном минте NFT запускается
+    задача на передачу NFT на указанный кошелек.
 
     :param author_telegram_id: Идентификатор автора события в телеграме
     :param dest_wallet_address: Адрес кошелька, на который будет отправлен сминченный
@@ -200,7 +353,7 @@ def nft_mint(self, author_telegram_id: str | int, dest_wallet_address: str, coll
             collection_status = author.collection_status
 
         except Exception as e:
-            raise (f"Error when trying to find an author with id {author_telegram_id}: {e}") from e
+            raise Exception(f"Error when trying to find an author with id {author_telegram_id}: {e}") from e
 
         if collection_status == tasks_statuses.FAILED:
             print(f"The collection with the address {collection_address} has not been minted. Canceling this task...")
@@ -208,17 +361,19 @@ def nft_mint(self, author_telegram_id: str | int, dest_wallet_address: str, coll
 
         # Откладывание задачи, если коллекция ещё не заминчена
         elif collection_status != tasks_statuses.MINTED:
-            raise self.retry(exc=f"Collection {collection_address} is still minting, retrying...")
+            raise self.retry(exc=Exception(f"Collection {collection_address} is still minting, retrying..."))
 
         # Минт NFT
         print(f"Minting NFT to the collection {collection_address} for wallet {dest_wallet_address}...")
         print(f"Attempt {self.request.retries} / {MINT_ATTEMPS_CNT}...")
 
         try:
-            nft_address = asyncio.run(client.deploy_one_item(
-                collection_address=collection_address,
-                nft_meta=nft_meta,
-            ))
+            nft_address = run_async(
+                client.deploy_one_item(
+                    collection_address=collection_address,
+                    nft_meta=nft_meta,
+                    owner_address=dest_wallet_address if DIRECT_MINT else None,
+                ))
 
             if nft_address is not None:
                 nft_address = address_to_friendly(nft_address)
@@ -227,12 +382,15 @@ def nft_mint(self, author_telegram_id: str | int, dest_wallet_address: str, coll
                       f"to the collection {collection_address}"
                       f"for the wallet {dest_wallet_address} was successful!")
 
+                if DIRECT_MINT:
+                    return
+
                 try:
                     sending_nft.delay(nft_address, dest_wallet_address)
 
                 except Exception as e:
-                    raise ("An error occurred when trying to add a task "
-                           f"to the queue for sending nft from collection {collection_address}: {e}") from e
+                    raise Exception("An error occurred when trying to add a task "
+                                    f"to the queue for sending nft from collection {collection_address}: {e}") from e
 
             else:
                 raise Exception(f"An unsuccessful attempt to mint NFT to the collection {collection_address})")
@@ -253,6 +411,180 @@ def nft_mint(self, author_telegram_id: str | int, dest_wallet_address: str, coll
         session.close()
 
 
+def enqueue_claim(author_telegram_id: str | int, dest_wallet_address: str, collection_address: str, nft_meta: str):
+    """Добавляет заявку на NFT в очередь коллекции и планирует её сброс.
+
+    Заявки копятся в течение `CLAIMS_BATCH_WINDOW` секунд или до `CLAIMS_BATCH_SIZE` штук,
+    после чего минтятся одним сообщением в задаче `batch_nft_mint`.
+
+    :param author_telegram_id: Идентификатор автора события в телеграме
+    :param dest_wallet_address: Адрес кошелька, на который будет отправлен сминченный
+        NFT
+    :param collection_address: Адрес коллекции, в которую будет сминчен NFT
+    :param nft_meta: URL нового NFT
+    """
+
+    collection_address = address_to_friendly(collection_address)
+
+    claim = {
+        "author_telegram_id": author_telegram_id,
+        "dest_wallet_address": address_to_friendly(dest_wallet_address),
+        "nft_meta": nft_meta,
+    }
+
+    queued_cnt = push_claim(collection_address, claim)
+
+    if queued_cnt >= CLAIMS_BATCH_SIZE:
+        flush_claims.delay(collection_address)
+
+    elif reserve_flush(collection_address, CLAIMS_BATCH_WINDOW):
+        flush_claims.apply_async(args=[collection_address], countdown=CLAIMS_BATCH_WINDOW)
+
+
+@celery.task(queue="mint_nft_test")
+def flush_claims(collection_address: str):
+    """Забирает накопленные заявки коллекции и запускает их минт одним батчем.
+
+    :param collection_address: Адрес коллекции, в которую будут сминчены NFT
+    """
+
+    # Снятие отметки до извлечения заявок: новая заявка либо попадет в этот батч,
+    # либо запланирует следующий сброс
+    release_flush(collection_address)
+
+    claims = pop_claims(collection_address, CLAIMS_BATCH_SIZE)
+
+    if not claims:
+        return
+
+    print(f"Collected {len(claims)} claims for the collection {collection_address}")
+
+    batch_nft_mint.delay(collection_address, claims)
+
+    if claims_cnt(collection_address) > 0 and reserve_flush(collection_address, CLAIMS_BATCH_WINDOW):
+        flush_claims.delay(collection_address)
+
+
+@celery.task(queue="mint_nft_test", bind=True, max_retries=MINT_ATTEMPS_CNT, default_retry_delay=MINT_RETRY_DELAY)
+def batch_nft_mint(self, collection_address: str, claims: list[dict]):
+    """Запускает фоновую задачу на минт батча NFT в указанную коллекцию. При `DIRECT_MINT`
+    каждый NFT минтится сразу на кошелек из его заявки, иначе при успешном минте
+    запускаются задачи на передачу каждого NFT.
+
+    :param collection_address: Адрес коллекции, в которую будут сминчены NFT
+    :param claims: Заявки с полями `author_telegram_id`, `dest_wallet_address` и
+        `nft_meta`
+    """
+
+    author_telegram_id = claims[0]["author_telegram_id"]
+
+    print(f"Launching the task of minting {len(claims)} NFTs into collection {collection_address}...")
+    session = session_factory()
+
+    try:
+
+        # Загрузка состояния минта коллекции из БД
+        try:
+            author = author_by_tg_id(telegram_id=author_telegram_id, session=session)
+
+            if author is None:
+                print(f"Author with id {author_telegram_id} was not found")
+                return
+
+            collection_status = author.collection_status
+
+        except Exception as e:
+            raise Exception(f"Error when trying to find an author with id {author_telegram_id}: {e}") from e
+
+        if collection_status == tasks_statuses.FAILED:
+            print(f"The collection with the address {collection_address} has not been minted. Canceling this task...")
+            return
+
+        # Откладывание задачи, если коллекция ещё не заминчена
+        elif collection_status != tasks_statuses.MINTED:
+
+            if self.request.retries >= self.max_retries:
+                print(f"The collection {collection_address} is still minting, returning the claims to the queue...")
+                restore_claims(collection_address, claims, self.request.id)
+                return
+
+            raise self.retry(exc=Exception(f"Collection {collection_address} is still minting, retrying..."))
+
+        print(f"Attempt {self.request.retries} / {MINT_ATTEMPS_CNT}...")
+
+        try:
+            # Идентификатор задачи сохраняется между попытками, поэтому повтор досылает
+            # только отсутствующие NFT уже отправленного батча, а не минтит его заново
+            nft_addresses = run_async(
+                client.deploy_batch_items(
+                    collection_address=collection_address,
+                    nft_metas=[claim["nft_meta"] for claim in claims],
+                    owner_addresses=[claim["dest_wallet_address"] for claim in claims] if DIRECT_MINT else None,
+                    batch_id=self.request.id,
+                ))
+
+            if nft_addresses is None:
+                raise Exception(f"An unsuccessful attempt to mint NFTs to the collection {collection_address}")
+
+            print(f"The minting of {len(nft_addresses)} NFTs to the collection {collection_address} was successful!")
+
+            if DIRECT_MINT:
+                return
+
+            for nft_address, claim in zip(nft_addresses, claims):
+                sending_nft.delay(address_to_friendly(nft_address), claim["dest_wallet_address"])
+
+        except Exception as e:
+
+            if self.request.retries >= self.max_retries:
+                print(f"The attempt to mint {len(claims)} NFTs to the collection {collection_address} was unsuccessful")
+                restore_claims(collection_address, claims, self.request.id)
+                return
+
+            self.retry(exc=e)
+
+    except Exception as e:
+        print(e)
+
+    finally:
+        session.close()
+
+
+def restore_claims(collection_address: str, claims: list[dict], batch_id: str):
+    """Возвращает в очередь коллекции заявки батча, NFT которых так и не появились.
+
+    Если батч отправлялся, в очередь возвращаются только заявки отсутствующих в
+    коллекции NFT. Если проверить это не удалось, заявки не возвращаются, чтобы не
+    сминтить NFT повторно, и выводятся в лог.
+
+    :param collection_address: Адрес коллекции, в которую минтились NFT
+    :param claims: Заявки батча
+    :param batch_id: Идентификатор батча
+    """
+
+    try:
+        from_index = run_async(client.batch_from_index(batch_id))
+
+        if from_index is None:
+            positions = range(len(claims))
+
+        else:
+            positions = run_async(client.missing_batch_items(collection_address, from_index, len(claims)))
+
+    except Exception as e:
+        print(f"Failed to check the batch {batch_id} of the collection {collection_address}, "
+              f"claims {claims} were not restored: {e}")
+        return
+
+    for position in positions:
+        push_claim(collection_address, claims[position])
+
+    print(f"Restored {len(positions)} claims to the queue of the collection {collection_address}")
+
+    if positions and reserve_flush(collection_address, CLAIMS_BATCH_WINDOW):
+        flush_claims.apply_async(args=[collection_address], countdown=CLAIMS_BATCH_WINDOW)
+
+
 @celery.task(queue="transfer_test", bind=True, max_retries=TRANSFER_ATTEMPS_CNT, default_retry_delay=TRANSFER_RETRY_DELAY)
 def sending_nft(self, nft_address: str, dest_wallet_address: str):
     """Запускает фоновую задачу на передачу NFT на указанный кошелек.
@@ -272,7 +604,7 @@ def sending_nft(self, nft_address: str, dest_wallet_address: str):
     print(f"Attempt {self.request.retries} / {TRANSFER_ATTEMPS_CNT}...")
 
     try:
-        success = asyncio.run(client.transfer_nft(
+        success = run_async(client.transfer_nft(
             nft_address=nft_address,
             new_owner_address=dest_wallet_address,
         ))
@@ -0,0 +1,173 @@
+from datetime import datetime
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from .db import Event, Author, Transaction, Telegram_User
+from .db import Subscriber_Event, Subscriber_Channel
+from .db import utc_now
+from .db import upsert_tg_users_statement
+
+
+async def add_database_entries(entries, session):
+    "Загружает записи в базу данных"
+
+    await stage_database_entries(entries, session)
+    await session.commit()
+
+
+async def stage_database_entries(entries, session):
+    """Отправляет записи в базу данных без фиксации транзакции, после чего у записей
+    заполнены сгенерированные сервером ключи. Записи сохраняются только после
+    `session.commit()` и отменяются, если сессия закрыта без него."""
+
+    if not isinstance(entries, list):
+        entries = [entries]
+
+    session.add_all(entries)
+    await session.flush()
+
+
+async def author_by_tg_id(telegram_id: str | int, session):
+    return await session.scalar(select(Author).filter_by(telegram_id=int(telegram_id)))
+
+
+async def subscriber_participated_events(telegram_id: str | int, session):
+    """Возвращает список id событий, в которых участвовал пользователь."""
+
+    results = await session.scalars(select(Subscriber_Event.participated_event).filter_by(telegram_id=telegram_id))
+    return list(results)
+
+
+async def subscriber_visited_channels(telegram_id: str | int, session):
+    """Возвращает список всех каналов, посещенных пользователем."""
+
+    results = await session.scalars(select(Subscriber_Channel.visited_channel).filter_by(telegram_id=telegram_id))
+    return list(results)
+
+
+async def add_visited_channel(telegram_id: str | int, channel: str, session):
+    """Добавляет канал в посещенные пользователем одним запросом, если его там еще нет."""
+
+    await session.execute(
+        pg_insert(Subscriber_Channel)
+        .values(telegram_id=int(telegram_id), visited_channel=channel)
+        .on_conflict_do_nothing(index_elements=["telegram_id", "visited_channel"])
+    )
+
+    await session.commit()
+
+
+async def event_claimants(event_id: int, session):
+    """Возвращает список id пользователей, получивших NFT события."""
+
+    results = await session.scalars(select(Subscriber_Event.telegram_id).filter_by(participated_event=event_id))
+    return list(results)
+
+
+async def record_claim(event_id: int, telegram_id: str | int, wallet_address: str, session):
+    """Записывает получение NFT события пользователем и увеличивает счетчик NFT события
+    одним запросом, без чтения строки события."""
+
+    session.add(Subscriber_Event(
+        telegram_id=telegram_id,
+        wallet_address=wallet_address,
+        participated_event=event_id,
+    ))
+
+    await session.execute(update(Event).where(Event.id == event_id).values(minted_nfts=Event.minted_nfts + 1))
+    await session.commit()
+
+
+async def remove_claim(event_id: int, telegram_id: str | int, session):
+    """Удаляет запись о получении NFT события пользователем и уменьшает счетчик NFT
+    события, например если заявку на NFT не удалось поставить в очередь."""
+
+    await session.execute(delete(Subscriber_Event).filter_by(participated_event=event_id, telegram_id=int(telegram_id)))
+    await session.execute(update(Event).where(Event.id == event_id).values(minted_nfts=Event.minted_nfts - 1))
+    await session.commit()
+
+
+async def event_by_id(event_id: int, session):
+    return await session.scalar(select(Event).filter_by(id=event_id))
+
+
+async def events_by_tg_id(telegram_id: str | int, session):
+    """Возвращает список событий, привязанных к id пользователя."""
+
+    events = await session.scalars(select(Event).filter_by(telegram_id=int(telegram_id)).order_by(Event.id))
+    return list(events)
+
+
+async def event_ids_by_tg_id(telegram_id: str | int, session):
+    """Возвращает список id событий, привязанных к id пользователя."""
+
+    return [event.id for event in await events_by_tg_id(telegram_id=telegram_id, session=session)]
+
+
+async def transaction_by_id(transaction_id: int, session):
+    return await session.scalar(select(Transaction).filter_by(id=transaction_id))
+
+
+async def tg_user_by_id(telegram_id: str | int, session):
+    return await session.scalar(select(Telegram_User).filter_by(id=int(telegram_id)))
+
+
+async def upsert_tg_user(telegram_id: str | int, username: str, session):
+    """Добавляет телеграм-пользователя или обновляет его `username` и `last_enter`
+    одним запросом, без предварительного чтения."""
+
+    await session.execute(upsert_tg_users_statement([{
+        "id": int(telegram_id),
+        "username": username,
+        "last_enter": utc_now(),
+    }]))
+
+    await session.commit()
+
+
+async def tg_users(session):
+    """Возвращает список всех телеграм-пользователей."""
+
+    users = await session.scalars(select(Telegram_User).filter(Telegram_User.id.isnot(None)))
+    return list(users)
+
+
+async def tg_user_ids(session, chunk_size: int = 1000, authors_only: bool = False, entered_since: datetime | None = None):
+    """Возвращает id телеграм-пользователей частями по `chunk_size` в порядке возрастания.
+
+    Каждая часть выбирается отдельным запросом по первичному ключу после последнего
+    полученного id, поэтому в памяти находится не больше одной части. Транзакция сессии
+    завершается после каждого запроса, и соединение возвращается в пул, пока часть
+    обрабатывается.
+
+    :param int chunk_size: Количество id в одной части.
+    :param bool authors_only: Только пользователи, являющиеся авторами событий.
+    :param datetime | None entered_since: Только пользователи, заходившие в бота не
+        раньше указанного времени (UTC).
+    :rtype: AsyncIterator[list[int]]
+    """
+    query = select(Telegram_User.id).order_by(Telegram_User.id).limit(chunk_size)
+
+    if authors_only:
+        query = query.where(Telegram_User.id.in_(select(Author.telegram_id)))
+
+    if entered_since is not None:
+        query = query.where(Telegram_User.last_enter >= entered_since)
+
+    last_id = None
+
+    while True:
+        chunk_query = query if last_id is None else query.where(Telegram_User.id > last_id)
+        ids = list(await session.scalars(chunk_query))
+
+        # Рассылка идет часами, поэтому соединение не должно простаивать в открытой транзакции
+        await session.commit()
+
+        if ids:
+            yield ids
+
+        if len(ids) < chunk_size:
+            return
+
+        last_id = ids[-1]
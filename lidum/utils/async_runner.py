@@ -0,0 +1,109 @@
+import os
+import asyncio
+import threading
+from collections.abc import Callable, Awaitable
+
+
+class AsyncRunner:
+    """Долгоживущий цикл событий для выполнения корутин из синхронного кода.
+
+    Цикл событий запускается в отдельном потоке при первом вызове `run` и живет до
+    вызова `stop`, поэтому клиенты, привязанные к циклу (пул TonlibClient, Redis,
+    наблюдатель подтверждений), создаются один раз на процесс. Задачи celery,
+    выполняемые в потоках воркера, передают свои корутины в этот цикл и ждут
+    результата, так что в одном процессе одновременно выполняется до `max_concurrency`
+    операций в блокчейне.
+
+    После fork процесса цикл родителя недоступен, поэтому в дочернем процессе цикл
+    создается заново.
+
+    :param int max_concurrency: Максимальное количество одновременно выполняемых корутин.
+    :param Callable[[], Awaitable] | None on_stop: Корутина, выполняемая в цикле перед его
+        остановкой, например закрытие клиентов.
+
+    Examples:
+    ```python
+    runner = AsyncRunner(max_concurrency=ASYNC_TASKS_LIMIT, on_stop=client.close)
+
+    nft_address = runner.run(client.deploy_one_item(collection_address, nft_meta))
+    ```
+    """
+
+    def __init__(self, max_concurrency: int, on_stop: Callable[[], Awaitable] | None = None):
+
+        self.max_concurrency = max_concurrency
+        self.on_stop = on_stop
+
+        self._pid = None
+        self._loop = None
+        self._thread = None
+        self._semaphore = None
+        self._lock = threading.Lock()
+
+    def run(self, coro: Awaitable):
+        """Выполняет корутину в цикле событий процесса и возвращает её результат.
+
+        Блокирует вызывающий поток до завершения корутины.
+        """
+        return self.submit(coro).result()
+
+    def submit(self, coro: Awaitable):
+        """Передает корутину в цикл событий процесса, не дожидаясь её завершения.
+
+        Из другого цикла событий результат можно ожидать через `asyncio.wrap_future`.
+
+        :rtype: concurrent.futures.Future
+        """
+        loop = self._ensure_loop()
+        return asyncio.run_coroutine_threadsafe(self._limited(coro), loop)
+
+    def stop(self):
+        """Выполняет `on_stop` и останавливает цикл событий."""
+
+        if self._loop is None or self._pid != os.getpid():
+            return
+
+        if self.on_stop is not None:
+
+            try:
+                asyncio.run_coroutine_threadsafe(self.on_stop(), self._loop).result()
+
+            except Exception as e:
+                print(f"Error when stopping the event loop: {e}")
+
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+        self._loop = None
+        self._thread = None
+
+    async def _limited(self, coro: Awaitable):
+        async with self._semaphore:
+            return await coro
+
+    def _ensure_loop(self):
+        """Запускает цикл событий, если он еще не запущен в текущем процессе."""
+
+        with self._lock:
+
+            if self._loop is not None and self._pid == os.getpid():
+                return self._loop
+
+            loop = asyncio.new_event_loop()
+            started = threading.Event()
+
+            def serve():
+                asyncio.set_event_loop(loop)
+                self._semaphore = asyncio.Semaphore(self.max_concurrency)
+                started.set()
+                loop.run_forever()
+                loop.close()
+
+            self._thread = threading.Thread(target=serve, name="lidum-event-loop", daemon=True)
+            self._thread.start()
+            started.wait()
+
+            self._pid = os.getpid()
+            self._loop = loop
+
+            return loop
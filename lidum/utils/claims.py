@@ -0,0 +1,53 @@
+import json
+
+from redis import Redis
+
+from ..config import REDIS_ADDRESS
+
+redis = Redis.from_url(REDIS_ADDRESS)
+
+
+def claims_key(collection_address: str):
+    return f"lidum:claims:{collection_address}"
+
+
+def flush_key(collection_address: str):
+    return f"lidum:claims:{collection_address}:flush"
+
+
+def push_claim(collection_address: str, claim: dict):
+    """Добавляет заявку на NFT в очередь коллекции и возвращает длину очереди."""
+
+    return redis.rpush(claims_key(collection_address), json.dumps(claim))
+
+
+def pop_claims(collection_address: str, count: int):
+    """Извлекает из очереди коллекции до `count` заявок."""
+
+    claims = redis.lpop(claims_key(collection_address), count)
+
+    if claims is None:
+        return []
+
+    return [json.loads(claim) for claim in claims]
+
+
+def claims_cnt(collection_address: str):
+    """Возвращает количество заявок в очереди коллекции."""
+
+    return redis.llen(claims_key(collection_address))
+
+
+def reserve_flush(collection_address: str, window: int):
+    """Отмечает, что сброс очереди коллекции уже запланирован.
+
+    :return: True, если сброс ещё не был запланирован.
+    :rtype: bool
+    """
+    return bool(redis.set(flush_key(collection_address), 1, nx=True, ex=window * 2))
+
+
+def release_flush(collection_address: str):
+    """Снимает отметку о запланированном сбросе очереди коллекции."""
+
+    redis.delete(flush_key(collection_address))
@@ -0,0 +1,265 @@
+import json
+import heapq
+import random
+import argparse
+from os import makedirs
+from math import log, prod
+from os.path import split, splitext
+from concurrent.futures import ProcessPoolExecutor
+
+from .path import get_nft_image_path, get_nft_metadata_path
+from .metadata import create_collection_metadata
+from .nft_generation import layers_index, load_layer_bank
+from ..config import NFT_LAYERS_PATH
+
+# Пространства комбинаций не больше этого размера выбираются перебором всех комбинаций
+ENUMERATION_LIMIT = 1_000_000
+
+
+class CombinationSampler:
+    """Выбор уникальных комбинаций слоев с учетом весов вариантов.
+
+    Комбинация — тип NFT и вариант каждого его слоя — кодируется числом в смешанной
+    системе счисления, а выданные комбинации отмечаются в битовом массиве. Небольшие
+    пространства комбинаций перебираются целиком со взвешенной выборкой без повторений,
+    в больших пространствах варианты выбираются послойно с отбрасыванием повторов.
+
+    :param list index: Структура директории слоев из `layers_index`.
+    :param dict[str, float] | None weights: Веса типов NFT (`"type1"`) и вариантов слоев
+        (`"type1/layer 1/1.png"`). По умолчанию вес равен 1, вариант с нулевым весом не
+        выбирается.
+    """
+
+    def __init__(self, index: list, weights: dict[str, float] | None = None):
+
+        weights = weights or {}
+
+        self.index = index
+        self.type_weights = [weights.get(nft_type, 1) for nft_type, _ in index]
+        self.variant_weights = [[[weights.get(f"{nft_type}/{layer}/{variant}", 1)
+                                  for variant in variants]
+                                 for layer, variants in layers]
+                                for nft_type, layers in index]
+
+        self.type_sizes = [prod(len(variants) for _, variants in layers) for _, layers in index]
+        self.offsets = [sum(self.type_sizes[:i]) for i in range(len(self.type_sizes))]
+        self.total = sum(self.type_sizes)
+
+        self.issued = bytearray((self.total + 7) // 8)
+        self.issued_cnt = 0
+
+    def encode(self, type_index: int, variants: list[int]):
+        """Возвращает номер комбинации."""
+
+        number = 0
+
+        for (_, layer_variants), variant in zip(self.index[type_index][1], variants):
+            number = number * len(layer_variants) + variant
+
+        return self.offsets[type_index] + number
+
+    def decode(self, number: int):
+        """Возвращает тип NFT и варианты слоев комбинации по её номеру."""
+
+        type_index = max(i for i, offset in enumerate(self.offsets) if offset <= number)
+        number -= self.offsets[type_index]
+
+        variants = []
+
+        for _, layer_variants in reversed(self.index[type_index][1]):
+            number, variant = divmod(number, len(layer_variants))
+            variants.append(variant)
+
+        return type_index, variants[::-1]
+
+    def is_issued(self, number: int):
+        return bool(self.issued[number >> 3] & (1 << (number & 7)))
+
+    def mark(self, number: int):
+        """Отмечает комбинацию как выданную."""
+
+        if not self.is_issued(number):
+            self.issued[number >> 3] |= 1 << (number & 7)
+            self.issued_cnt += 1
+
+    def weight(self, number: int):
+        """Возвращает вероятность комбинации при послойном выборе."""
+
+        type_index, variants = self.decode(number)
+
+        weight = self.type_weights[type_index] / sum(self.type_weights)
+
+        for layer_weights, variant in zip(self.variant_weights[type_index], variants):
+            weight *= layer_weights[variant] / sum(layer_weights)
+
+        return weight
+
+    def sample(self, count: int):
+        """Возвращает номера `count` новых уникальных комбинаций и отмечает их выданными.
+
+        :raise ValueError: Если невыданных комбинаций с ненулевым весом меньше `count`.
+        """
+        if self.total <= ENUMERATION_LIMIT:
+            numbers = self._sample_enumerated(count)
+
+        else:
+            numbers = self._sample_layered(count)
+
+        for number in numbers:
+            self.mark(number)
+
+        return numbers
+
+    def _sample_enumerated(self, count: int):
+        """Взвешенная выборка без повторений по всем невыданным комбинациям."""
+
+        keys = []
+
+        for number in range(self.total):
+
+            if self.is_issued(number):
+                continue
+
+            weight = self.weight(number)
+
+            if weight > 0:
+                keys.append((log(1 - random.random()) / weight, number))
+
+        if len(keys) < count:
+            raise ValueError(f"Only {len(keys)} unique combinations are available, {count} requested")
+
+        return [number for _, number in heapq.nlargest(count, keys)]
+
+    def _sample_layered(self, count: int):
+        """Послойный выбор вариантов с отбрасыванием уже выданных комбинаций."""
+
+        numbers = set()
+        attempts = 0
+
+        while len(numbers) < count:
+            attempts += 1
+
+            if attempts > count * 100:
+                raise ValueError(f"Failed to find {count} unique combinations")
+
+            type_index = random.choices(range(len(self.index)), weights=self.type_weights)[0]
+
+            variants = [
+                random.choices(range(len(layer_weights)), weights=layer_weights)[0]
+                for layer_weights in self.variant_weights[type_index]
+            ]
+
+            number = self.encode(type_index, variants)
+
+            if not self.is_issued(number):
+                numbers.add(number)
+
+        return list(numbers)
+
+    def attributes(self, number: int):
+        """Возвращает атрибуты метаданных NFT для комбинации."""
+
+        type_index, variants = self.decode(number)
+        nft_type, layers = self.index[type_index]
+
+        attributes = [{"trait_type": "type", "value": nft_type}]
+
+        for (layer, layer_variants), variant in zip(layers, variants):
+            attributes.append({"trait_type": layer, "value": splitext(layer_variants[variant])[0]})
+
+        return attributes
+
+
+def generate_collection(telegram_id: str | int,
+                        collection_name: str,
+                        description: str,
+                        count: int,
+                        weights: dict[str, float] | None = None,
+                        processes: int | None = None):
+    """Генерирует `count` уникальных NFT коллекции и их метаданные.
+
+    Комбинации выбираются в основном процессе, а изображения и метаданные создаются
+    параллельно в пуле процессов, каждый из которых один раз загружает слои в память.
+
+    :param telegram_id: Идентификатор автора коллекции в телеграме.
+    :param collection_name: Название коллекции.
+    :param description: Описание NFT.
+    :param count: Количество NFT.
+    :param weights: Веса типов NFT и вариантов слоев, как в `CombinationSampler`.
+    :param processes: Количество процессов. По умолчанию, количество ядер процессора.
+    :return: Названия изображений сгенерированных NFT.
+    :rtype: list[str]
+    """
+    if count <= 0:
+        return []
+
+    sampler = CombinationSampler(layers_index(NFT_LAYERS_PATH), weights)
+    numbers = sampler.sample(count)
+
+    items = []
+
+    for item_index, number in enumerate(numbers):
+        image_name = f"{item_index}.png"
+        type_index, variants = sampler.decode(number)
+
+        items.append({
+            "type_index": type_index,
+            "variants": variants,
+            "image_path": get_nft_image_path(collection_name, telegram_id, image_name),
+            "meta_path": get_nft_metadata_path(collection_name, telegram_id, image_name),
+            "metadata": {
+                "name": f"{collection_name} #{item_index}",
+                "description": description + "\n\nCreated by @lidum_bot",
+                "image": get_nft_image_path(collection_name, telegram_id, image_name, True),
+                "attributes": sampler.attributes(number),
+            },
+        })
+
+    makedirs(split(items[0]["image_path"])[0], exist_ok=True)
+    makedirs(split(items[0]["meta_path"])[0], exist_ok=True)
+
+    with ProcessPoolExecutor(max_workers=processes, initializer=load_layer_bank) as executor:
+        list(executor.map(_render_item, items, chunksize=32))
+
+    create_collection_metadata(telegram_id=telegram_id, collection_name=collection_name, logo_name="0.png")
+
+    return [f"{item_index}.png" for item_index in range(count)]
+
+
+def _render_item(item: dict):
+    """Создает изображение и метаданные одного NFT в процессе пула."""
+
+    nft = load_layer_bank().render(item["type_index"], item["variants"])
+    nft.save(item["image_path"], "PNG")
+
+    with open(item["meta_path"], "w") as file:
+        json.dump(item["metadata"], file)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generation of a collection of unique NFTs")
+    parser.add_argument("--telegram-id", required=True)
+    parser.add_argument("--collection-name", required=True)
+    parser.add_argument("--description", default="")
+    parser.add_argument("--count", type=int, required=True)
+    parser.add_argument("--weights", help="Path to a JSON file with type and layer variant weights")
+    parser.add_argument("--processes", type=int)
+
+    args = parser.parse_args()
+
+    weights = None
+
+    if args.weights:
+        with open(args.weights) as file:
+            weights = json.load(file)
+
+    images = generate_collection(
+        telegram_id=args.telegram_id,
+        collection_name=args.collection_name,
+        description=args.description,
+        count=args.count,
+        weights=weights,
+        processes=args.processes,
+    )
+
+    print(f"{len(images)} NFTs of the collection {args.collection_name} have been generated")
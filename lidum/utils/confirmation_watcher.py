@@ -0,0 +1,198 @@
+import time
+import asyncio
+from collections.abc import Callable, Awaitable
+
+
+class _Waiter:
+    """Зарегистрированное ожидание условия в блокчейне."""
+
+    def __init__(self, check: Callable[[], Awaitable[bool]], future: asyncio.Future, timeout: int, backoff: float):
+        self.check = check
+        self.future = future
+        self.deadline = time.monotonic() + timeout
+        self.backoff = backoff
+        self.next_check = time.monotonic() + backoff
+
+
+class ConfirmationWatcher:
+    """Общий наблюдатель за подтверждением операций в блокчейне.
+
+    Задачи регистрируют ожидания вида "адрес X развернут" или "владелец NFT Y — Z" и
+    получают future вместо собственного цикла опроса. Ожидания группируются по
+    отслеживаемому адресу (кошелек приложения, коллекция): на каждом шаге для каждого
+    такого адреса запрашивается только состояние аккаунта, и условия ожиданий
+    проверяются, лишь когда у адреса появилась новая транзакция. Независимо от этого
+    каждое условие перепроверяется с экспоненциально растущим интервалом, поэтому
+    ожидание завершится, даже если отслеживаемый адрес не изменился.
+
+    :param TonClient client: Клиент для запросов к блокчейну.
+    :param float tick: Интервал между шагами наблюдателя в секундах.
+    :param float max_backoff: Максимальный интервал между перепроверками условия.
+    :param bool verbose: Выводить ли информацию о работе наблюдателя.
+
+    Examples:
+    ```python
+    watcher = ConfirmationWatcher(client)
+
+    deployed = await watcher.wait_deployed(nft_address, timeout=MINT_TIMEOUT, trigger_address=collection_address)
+    ```
+    """
+
+    def __init__(self, client, tick: float = 1, max_backoff: float = 8, verbose: bool = False):
+
+        self.client = client
+        self.tick = tick
+        self.max_backoff = max_backoff
+        self.verbose = verbose
+
+        self._loop = None
+        self._waiters = {}
+        self._last_lt = {}
+        self._wakeup = None
+        self._task = None
+
+    async def wait_deployed(self, address: str, timeout: int, trigger_address: str | None = None):
+        """Ожидает появления кода смарт-контракта по указанному адресу.
+
+        :param str address: Адрес смарт-контракта в raw или user-friendly.
+        :param int timeout: Время ожидания в секундах.
+        :param str | None trigger_address: Адрес, новая транзакция которого означает, что
+            условие пора перепроверить. Если не указан, условие только перепроверяется с
+            растущим интервалом.
+        :return: Развернут ли смарт-контракт до истечения времени ожидания.
+        :rtype: bool
+        """
+
+        async def check():
+            data = await self.client.raw_get_account_state(address)
+            return data is not None and data["code"] != ""
+
+        return await self._wait(trigger_address, check, timeout)
+
+    async def wait_all_deployed(self, addresses: list[str], timeout: int, trigger_address: str | None = None):
+        """Ожидает появления кода смарт-контрактов по всем указанным адресам.
+
+        :return: Развернуты ли все смарт-контракты до истечения времени ожидания.
+        :rtype: bool
+        """
+        results = await asyncio.gather(*[self.wait_deployed(address, timeout, trigger_address) for address in addresses])
+        return all(results)
+
+    async def wait_owner(self, nft_address: str, owner_address: str, timeout: int, trigger_address: str | None = None):
+        """Ожидает, пока владельцем NFT не станет указанный адрес.
+
+        :param str nft_address: Адрес NFT в raw или user-friendly.
+        :param str owner_address: Ожидаемый адрес владельца в user-friendly.
+        :param int timeout: Время ожидания в секундах.
+        :param str | None trigger_address: Адрес, новая транзакция которого означает, что
+            условие пора перепроверить.
+        :return: Сменился ли владелец до истечения времени ожидания.
+        :rtype: bool
+        """
+
+        async def check():
+            return await self.client.get_nft_owner(nft_address=nft_address) == owner_address
+
+        return await self._wait(trigger_address, check, timeout)
+
+    async def _wait(self, trigger_address: str | None, check: Callable[[], Awaitable[bool]], timeout: int):
+        self._bind_loop()
+
+        waiter = _Waiter(check=check, future=self._loop.create_future(), timeout=timeout, backoff=self.tick)
+        waiters = self._waiters.setdefault(trigger_address, [])
+        waiters.append(waiter)
+        self._wakeup.set()
+
+        try:
+            return await waiter.future
+
+        finally:
+            waiters.remove(waiter)
+
+            if not waiters and self._waiters.get(trigger_address) is waiters:
+                del self._waiters[trigger_address]
+                self._last_lt.pop(trigger_address, None)
+
+    def _bind_loop(self):
+        """Запускает наблюдателя в текущем цикле событий."""
+
+        loop = asyncio.get_running_loop()
+
+        if self._loop is loop:
+            return
+
+        self._loop = loop
+        self._waiters = {}
+        self._last_lt = {}
+        self._wakeup = asyncio.Event()
+        self._task = loop.create_task(self._watch())
+
+    async def _watch(self):
+
+        while True:
+
+            if not self._waiters:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+
+            try:
+                await self._step()
+
+            except Exception as e:
+                print(f"Error in the confirmation watcher: {e}")
+
+            await asyncio.sleep(self.tick)
+
+    async def _step(self):
+        """Проверяет отслеживаемые адреса и условия, которые пора перепроверить."""
+
+        for trigger_address, waiters in list(self._waiters.items()):
+            changed = trigger_address is not None and await self._has_new_transaction(trigger_address)
+            now = time.monotonic()
+
+            due = []
+
+            for waiter in list(waiters):
+
+                if waiter.future.done():
+                    continue
+
+                if now >= waiter.deadline:
+                    waiter.future.set_result(False)
+
+                elif changed or now >= waiter.next_check:
+                    due.append(waiter)
+
+            if not due:
+                continue
+
+            if self.verbose:
+                print(f"Checking {len(due)} pending confirmations...")
+
+            results = await asyncio.gather(*[waiter.check() for waiter in due], return_exceptions=True)
+
+            for waiter, result in zip(due, results):
+
+                if waiter.future.done():
+                    continue
+
+                if result is True:
+                    waiter.future.set_result(True)
+                    continue
+
+                waiter.backoff = min(waiter.backoff * 2, self.max_backoff)
+                waiter.next_check = time.monotonic() + waiter.backoff
+
+    async def _has_new_transaction(self, address: str):
+        """Проверяет, появилась ли у адреса новая транзакция с прошлого шага."""
+
+        data = await self.client.raw_get_account_state(address)
+
+        if data is None:
+            return False
+
+        lt = data["last_transaction_id"]["lt"]
+        last_lt = self._last_lt.get(address)
+        self._last_lt[address] = lt
+
+        return last_lt is not None and lt != last_lt
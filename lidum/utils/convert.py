@@ -1,4 +1,6 @@
+import base64
 from pathlib import Path
+from datetime import datetime, timezone
 
 from tonsdk.utils import to_nano, from_nano
 from tonsdk.contract import Address
@@ -49,3 +51,27 @@ def ton_from_nano(value: int):
     """Возвращает значение в тон."""
 
     return float(from_nano(value, "ton"))
+
+
+def utc_timestamp(value: datetime):
+    """Возвращает время в формате unix. Время без часового пояса считается временем UTC."""
+
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+
+    return value.timestamp()
+
+
+def hash_to_hex(value: str):
+    """Возвращает 32-байтный хэш в hex виде в нижнем регистре.
+
+    Хэш может быть задан в hex, как его возвращает Tonapi, или в base64, в том числе
+    url-safe и без выравнивания, как его сохраняет фронтенд.
+    """
+
+    if len(value) == 64:
+        return bytes.fromhex(value).hex()
+
+    value = value.strip().replace("-", "+").replace("_", "/")
+
+    return base64.b64decode(value + "=" * (-len(value) % 4), validate=True).hex()
@@ -1,4 +1,5 @@
 from typing import Any
+from functools import lru_cache
 
 from .. import fernet
 
@@ -7,5 +8,6 @@ def encrypt(msg: Any):
     return fernet.encrypt(str(msg).encode()).decode()
 
 
+@lru_cache(maxsize=4096)
 def decrypt(msg: str):
     return fernet.decrypt(msg.encode()).decode()
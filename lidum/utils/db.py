@@ -1,6 +1,7 @@
 from datetime import datetime, timezone
 
-from sqlalchemy.dialects.postgresql import JSON
+from sqlalchemy import case
+from sqlalchemy.dialects.postgresql import JSON, insert
 
 from . import tasks_statuses
 from .. import db
@@ -8,15 +9,35 @@ from .hash import sha256_hash
 from .convert import address_to_raw, address_to_friendly
 
 
+def utc_now():
+    """Возвращает текущее время UTC без часового пояса, как оно хранится в базе данных."""
+
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+# Максимальное количество параметров одного запроса PostgreSQL
+MAX_QUERY_PARAMS = 32767
+
+
 def add_database_entries(entries, session):
-    "Загружает записи в базу данных"
+    "Загружает записи в базу данных одной транзакцией"
 
     if not isinstance(entries, list):
         entries = [entries]
 
-    for entry in entries:
-        session.add(entry)
-        session.commit()
+    session.add_all(entries)
+    session.commit()
+
+
+def bulk_insert_chunks(rows: list[dict]):
+    """Разбивает строки на части, каждая из которых помещается в один запрос
+    `INSERT ... VALUES`."""
+
+    if not rows:
+        return []
+
+    chunk_size = max(1, MAX_QUERY_PARAMS // len(rows[0]))
+    return [rows[i:i + chunk_size] for i in range(0, len(rows), chunk_size)]
 
 
 def author_by_tg_id(telegram_id: str | int, session):
@@ -56,6 +77,30 @@ def transaction_by_id(transaction_id: int, session):
     return session.query(Transaction).filter_by(id=transaction_id).first()
 
 
+def unconfirmed_transactions(session):
+    """Возвращает транзакции с известным хэшем, статус которых еще не определен."""
+
+    return session.query(Transaction).filter(
+        Transaction.hash.isnot(None),
+        Transaction.status.in_([tasks_statuses.NEW, tasks_statuses.PENDING]),
+    ).all()
+
+
+def update_transactions_statuses(statuses: dict[int, str], session):
+    """Обновляет статусы транзакций одним запросом.
+
+    :param dict[int, str] statuses: Новые статусы по идентификаторам транзакций.
+    """
+
+    if not statuses:
+        return
+
+    session.query(Transaction).filter(Transaction.id.in_(statuses)).update(
+        {Transaction.status: case(statuses, value=Transaction.id)},
+        synchronize_session=False,
+    )
+
+
 def wallet_addresses_by_tg_id(telegram_id: str | int, session):
     """Возвращает список адресов кошельков по привязанному id пользователя."""
 
@@ -71,15 +116,43 @@ def tg_user_by_id(telegram_id: str | int, session):
     return session.query(Telegram_User).filter_by(id=int(telegram_id)).first()
 
 
-def authors_tg_ids(session):
-    """Возвращает список id авторов событий."""
+def upsert_tg_users_statement(users: list[dict]):
+    """Возвращает запрос, который одним выражением добавляет телеграм-пользователей или
+    обновляет `username` и `last_enter` уже существующих.
 
-    authors = session.query(Author).filter(Author.chat_id.isnot(None)).all()
+    :param list[dict] users: Пользователи вида `{"id": ..., "username": ..., "last_enter": ...}`
+        с уникальными id.
+    """
+    statement = insert(Telegram_User).values(users)
 
-    if authors is None:
-        return []
+    return statement.on_conflict_do_update(
+        index_elements=[Telegram_User.id],
+        set_={
+            "username": statement.excluded.username,
+            "last_enter": statement.excluded.last_enter,
+        },
+    )
+
+
+def upsert_tg_users(users: list[dict], session):
+    """Добавляет или обновляет телеграм-пользователей запросами по несколько тысяч
+    строк одной транзакцией."""
+
+    if not users:
+        return
+
+    # Все пользователи в одном запросе превысили бы ограничение PostgreSQL на
+    # количество параметров
+    for chunk in bulk_insert_chunks(users):
+        session.execute(upsert_tg_users_statement(chunk))
+
+    session.commit()
+
+
+def authors_tg_ids(session):
+    """Возвращает список id авторов событий."""
 
-    return [author.chat_id for author in authors]
+    return [telegram_id for telegram_id, in session.query(Author.telegram_id).all()]
 
 
 def tg_users(session):
@@ -94,7 +167,7 @@ class Author(db.Model):
     collection_name = db.Column(db.String(64), nullable=False)
     _collection_address = db.Column("collection_address", db.String(66), nullable=False)
     collection_status = db.Column(db.Text, nullable=False, default=tasks_statuses.NEW)
-    created_at = db.Column(db.DateTime, default=datetime.now(timezone.utc), nullable=False)
+    created_at = db.Column(db.DateTime, default=utc_now, nullable=False)
     _is_testnet = db.Column("is_testnet", db.Boolean, nullable=False)
 
     @property
@@ -116,6 +189,7 @@ class Author(db.Model):
 
 class Event(db.Model):
     __tablename__ = "events"
+    __table_args__ = (db.Index("ix_events_telegram_id_id", "telegram_id", "id"),)
 
     id = db.Column(db.BigInteger, primary_key=True, autoincrement=True)
     telegram_id = db.Column(db.BigInteger, db.ForeignKey("authors.telegram_id"), nullable=False)
@@ -125,13 +199,14 @@ class Event(db.Model):
     minted_nfts = db.Column(db.Integer, nullable=False, default=0)
     nfts_cnt = db.Column(db.Integer, nullable=False)
     image_name = db.Column(db.Text, nullable=False)
+    image_hash = db.Column(db.String(64), nullable=True)
     start_date = db.Column(db.String(16), nullable=False)
     end_date = db.Column(db.String(16), nullable=False)
     _password = db.Column("password", db.String(64), nullable=False)
     invites = db.Column(db.Integer, nullable=False)
     user_timezone = db.Column(db.SmallInteger, nullable=False)
     subscriptions = db.Column(JSON, nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.now(timezone.utc), nullable=False)
+    created_at = db.Column(db.DateTime, default=utc_now, nullable=False)
 
     @property
     def password(self):
@@ -144,12 +219,16 @@ class Event(db.Model):
 
 class Subscriber_Event(db.Model):
     __tablename__ = "subscriber_events"
+    __table_args__ = (
+        db.UniqueConstraint("telegram_id", "participated_event", name="subscriber_events_telegram_id_participated_event_key"),
+        db.Index("ix_subscriber_events_participated_event", "participated_event"),
+    )
 
     id = db.Column(db.BigInteger, primary_key=True, autoincrement=True)
     telegram_id = db.Column(db.BigInteger, db.ForeignKey("telegram_users.id"))
     _wallet_address = db.Column("wallet_address", db.String(66), nullable=False)
     participated_event = db.Column(db.BigInteger, db.ForeignKey("events.id"), nullable=False)
-    receipt_time = db.Column(db.DateTime, default=datetime.now(timezone.utc), nullable=False)
+    receipt_time = db.Column(db.DateTime, default=utc_now, nullable=False)
 
     @property
     def wallet_address(self):
@@ -162,6 +241,9 @@ class Subscriber_Event(db.Model):
 
 class Subscriber_Channel(db.Model):
     __tablename__ = "subscriber_channels"
+    __table_args__ = (
+        db.UniqueConstraint("telegram_id", "visited_channel", name="subscriber_channels_telegram_id_visited_channel_key"),
+    )
 
     id = db.Column(db.BigInteger, primary_key=True, autoincrement=True)
     telegram_id = db.Column(db.BigInteger, db.ForeignKey("telegram_users.id"))
@@ -177,7 +259,7 @@ class Transaction(db.Model):
     _destination_address = db.Column("destination_address", db.String(66), nullable=False)
     amount = db.Column(db.Float, nullable=False)
     status = db.Column(db.Text, nullable=False, default=tasks_statuses.NEW)
-    created_at = db.Column(db.DateTime, default=datetime.now(timezone.utc), nullable=False)
+    created_at = db.Column(db.DateTime, default=utc_now, nullable=False)
     _is_testnet = db.Column("is_testnet", db.Boolean, nullable=False)
 
     @property
@@ -229,7 +311,7 @@ class Telegram_User(db.Model):
 
     id = db.Column(db.BigInteger, primary_key=True)
     username = db.Column(db.String(32), nullable=False)
-    last_enter = db.Column(db.DateTime, default=datetime.now(timezone.utc), nullable=False)
+    last_enter = db.Column(db.DateTime, default=utc_now, nullable=False)
 
 
 class Referral(db.Model):
@@ -0,0 +1,75 @@
+import json
+import time
+from collections import OrderedDict
+
+from .redis_client import get_redis
+from ..config import EVENT_CACHE_TTL, EVENT_CACHE_SIZE
+from ..config import EVENT_CACHE_LOCAL_TTL
+
+# Локальный кэш процесса: id события -> (время истечения, данные события)
+_local_cache = OrderedDict()
+
+
+def _key(event_id: int):
+    return f"lidum:event:{event_id}:info"
+
+
+async def cached_event_info(event_id: int):
+    """Возвращает сохраненные данные события из локального кэша процесса или из Redis.
+
+    :return: Данные события, либо None, если их нет в кэше.
+    :rtype: dict | None
+    """
+    cached = _local_cache.get(event_id)
+
+    if cached is not None:
+        expires_at, event_info = cached
+
+        if expires_at > time.monotonic():
+            _local_cache.move_to_end(event_id)
+            return event_info
+
+        del _local_cache[event_id]
+
+    try:
+        event_info = await get_redis().get(_key(event_id))
+
+    except Exception as e:
+        print(f"Error when reading the cached info of the event {event_id}: {e}")
+        return None
+
+    if event_info is None:
+        return None
+
+    event_info = json.loads(event_info)
+    _store_local(event_id, event_info)
+
+    return event_info
+
+
+async def cache_event_info(event_id: int, event_info: dict):
+    """Сохраняет данные события в локальный кэш процесса и в Redis."""
+
+    _store_local(event_id, event_info)
+
+    try:
+        await get_redis().set(_key(event_id), json.dumps(event_info), ex=EVENT_CACHE_TTL)
+
+    except Exception as e:
+        print(f"Error when caching the info of the event {event_id}: {e}")
+
+
+async def invalidate_event_info(event_id: int):
+    """Удаляет данные события из кэша. Локальные кэши других процессов устаревают не
+    позже чем через `EVENT_CACHE_LOCAL_TTL` секунд."""
+
+    _local_cache.pop(event_id, None)
+    await get_redis().delete(_key(event_id))
+
+
+def _store_local(event_id: int, event_info: dict):
+    _local_cache[event_id] = (time.monotonic() + EVENT_CACHE_LOCAL_TTL, event_info)
+    _local_cache.move_to_end(event_id)
+
+    while len(_local_cache) > EVENT_CACHE_SIZE:
+        _local_cache.popitem(last=False)
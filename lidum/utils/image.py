@@ -1,16 +1,45 @@
+import os
 import base64
+import hashlib
+from uuid import uuid4
 from io import BytesIO
 from os import makedirs
-from os.path import split
+from os.path import join, split, isfile
 
 from PIL import Image
 
+from .media import original_path, store_original
+from .media import link_original, create_derivatives
+from ..config import UPLOADS_PATH
+
+# Сигнатуры поддерживаемых форматов изображений
+IMAGE_SIGNATURES = (b"\x89PNG\r\n\x1a\n", b"\xff\xd8\xff")
+
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+
+class UploadTooLargeError(Exception):
+    """Загружаемый файл превышает допустимый размер."""
+
+
+class InvalidImageError(Exception):
+    """Загружаемый файл не является изображением PNG или JPEG."""
+
 
 def decode_base64_image(image: str):
-    """Декодирует изображение, находящее в base64 строке."""
+    """Декодирует изображение, находящее в base64 строке.
+
+    :raise InvalidImageError: Если строка не является корректной base64 строкой.
+    """
 
     image = image.split(",")[1]
-    image = base64.b64decode(image)
+
+    # Алфавит проверяется при валидации запроса, но длина и выравнивание только здесь
+    try:
+        image = base64.b64decode(image, validate=True)
+
+    except ValueError as e:
+        raise InvalidImageError("The image must be a valid base64-encoded string") from e
 
     return image
 
@@ -24,3 +53,111 @@ def save_base64_image(image: bytes, image_path: str):
     # Сохранение пользовательского изображения
     image = Image.open(BytesIO(image))
     image.save(image_path)
+
+
+def upload_path(upload_id: str):
+    """Возвращает путь до загруженного изображения."""
+
+    return join(UPLOADS_PATH, upload_id)
+
+
+def is_uploaded(upload_id: str):
+    """Проверяет, что изображение загружено и еще не обработано, либо уже находится в
+    хранилище оригиналов."""
+
+    return isfile(upload_path(upload_id)) or isfile(original_path(upload_id))
+
+
+def save_upload(stream, max_size: int):
+    """Сохраняет изображение из потока во временный файл по частям, не загружая его в
+    память целиком.
+
+    Идентификатором изображения служит хэш его содержимого, поэтому повторно
+    загруженное изображение не сохраняется второй раз.
+
+    :param stream: Поток с содержимым изображения.
+    :param int max_size: Максимальный размер изображения в байтах.
+    :return: Идентификатор загруженного изображения.
+    :rtype: str
+
+    :raise UploadTooLargeError: Если изображение больше `max_size`.
+    :raise InvalidImageError: Если файл не является изображением PNG или JPEG.
+    """
+    makedirs(UPLOADS_PATH, exist_ok=True)
+
+    tmp_path = upload_path(f"{uuid4().hex}.tmp")
+    image_hash = hashlib.sha256()
+    size = 0
+
+    try:
+        with open(tmp_path, "wb") as file:
+
+            while chunk := stream.read(UPLOAD_CHUNK_SIZE):
+
+                if size == 0 and not chunk.startswith(IMAGE_SIGNATURES):
+                    raise InvalidImageError("The file must be a PNG or JPEG image")
+
+                size += len(chunk)
+
+                if size > max_size:
+                    raise UploadTooLargeError(f"The image must not exceed {max_size} bytes")
+
+                image_hash.update(chunk)
+                file.write(chunk)
+
+        if size == 0:
+            raise InvalidImageError("The file is empty")
+
+    except Exception:
+        os.remove(tmp_path)
+        raise
+
+    return _commit_upload(tmp_path, image_hash.hexdigest())
+
+
+def save_base64_upload(image: str):
+    """Декодирует изображение из base64 строки во временный файл.
+
+    :return: Идентификатор загруженного изображения.
+    :rtype: str
+
+    :raise InvalidImageError: Если файл не является изображением PNG или JPEG.
+    """
+    makedirs(UPLOADS_PATH, exist_ok=True)
+
+    image = decode_base64_image(image)
+
+    if not image:
+        raise InvalidImageError("The file is empty")
+
+    if not image.startswith(IMAGE_SIGNATURES):
+        raise InvalidImageError("The file must be a PNG or JPEG image")
+
+    tmp_path = upload_path(f"{uuid4().hex}.tmp")
+
+    with open(tmp_path, "wb") as file:
+        file.write(image)
+
+    return _commit_upload(tmp_path, hashlib.sha256(image).hexdigest())
+
+
+def process_upload(upload_id: str, image_path: str):
+    """Переносит загруженное изображение в хранилище оригиналов, размещает его в
+    директории коллекции и создает уменьшенные копии."""
+
+    store_original(upload_id, upload_path(upload_id))
+    link_original(upload_id, image_path)
+    create_derivatives(upload_id)
+
+
+def _commit_upload(tmp_path: str, upload_id: str):
+    """Переименовывает временный файл по хэшу содержимого, либо удаляет его, если такое
+    изображение уже есть в хранилище оригиналов."""
+
+    if isfile(original_path(upload_id)):
+        os.remove(tmp_path)
+
+    else:
+        os.replace(tmp_path, upload_path(upload_id))
+
+    return upload_id
@@ -0,0 +1,186 @@
+import time
+import asyncio
+
+from .redis_client import get_redis
+
+
+class _LiteserverStats:
+    """Статистика работы одного лайт-сервера."""
+
+    def __init__(self):
+        self.latency = 0.0
+        self.error_rate = 0.0
+        self.mc_seqno = 0
+
+
+class LiteserverScheduler:
+    """Планировщик выбора лайт-серверов по задержке, доле ошибок и отставанию.
+
+    Для каждого лайт-сервера хранится экспоненциальное скользящее среднее задержки и доли
+    ошибок, а также последний увиденный seqno мастерчейна. Запросы направляются сначала на
+    лайт-сервера с наименьшей оценкой. Лайт-сервера, доля ошибок которых превышает
+    `max_error_rate` или которые отстают более чем на `max_lag` блоков мастерчейна,
+    исключаются и используются только в последнюю очередь, пока фоновая проверка не
+    покажет, что они снова исправны.
+
+    Статистика периодически объединяется со статистикой других процессов через Redis,
+    поэтому все воркеры пользуются общими наблюдениями.
+
+    :param TonlibPool pool: Пул клиентов для фоновой проверки лайт-серверов.
+    :param str network: Название сети, используется в ключах Redis.
+    :param int max_lag: Допустимое отставание лайт-сервера в блоках мастерчейна.
+    :param float max_error_rate: Доля ошибок, при превышении которой лайт-сервер исключается.
+    :param int probe_interval: Интервал фоновой проверки всех лайт-серверов в секундах.
+    :param int sync_interval: Интервал синхронизации статистики через Redis в секундах.
+    :param float alpha: Вес нового наблюдения в скользящем среднем.
+    :param bool verbose: Выводить ли информацию о работе планировщика.
+    """
+
+    def __init__(self,
+                 pool,
+                 network: str,
+                 max_lag: int = 3,
+                 max_error_rate: float = 0.5,
+                 probe_interval: int = 30,
+                 sync_interval: int = 5,
+                 alpha: float = 0.3,
+                 verbose: bool = False):
+
+        self.pool = pool
+        self.network = network
+        self.max_lag = max_lag
+        self.max_error_rate = max_error_rate
+        self.probe_interval = probe_interval
+        self.sync_interval = sync_interval
+        self.alpha = alpha
+        self.verbose = verbose
+
+        self.ls_cnt = pool.ls_cnt
+        self.stats = [_LiteserverStats() for _ in range(self.ls_cnt)]
+
+        self._loop = None
+        self._tasks = []
+
+    def ranked(self):
+        """Возвращает индексы лайт-серверов от лучшего к худшему.
+
+        Исключенные лайт-сервера находятся в конце списка.
+
+        :rtype: list[int]
+        """
+        self._bind_loop()
+
+        return sorted(range(self.ls_cnt), key=lambda ls_index: (self.is_ejected(ls_index), self._score(ls_index)))
+
+    def record(self, ls_index: int, latency: float | None):
+        """Учитывает результат запроса к лайт-серверу.
+
+        :param int ls_index: Индекс лайт-сервера.
+        :param float | None latency: Время выполнения запроса в секундах, либо None, если
+            запрос завершился ошибкой.
+        """
+        stats = self.stats[ls_index]
+        alpha = self.alpha
+
+        if latency is None:
+            stats.error_rate = (1 - alpha) * stats.error_rate + alpha
+
+        else:
+            stats.error_rate = (1 - alpha) * stats.error_rate
+            stats.latency = latency if stats.latency == 0 else (1 - alpha) * stats.latency + alpha * latency
+
+    def is_ejected(self, ls_index: int):
+        """Проверяет, исключен ли лайт-сервер из числа приоритетных."""
+
+        stats = self.stats[ls_index]
+        max_seqno = max(ls_stats.mc_seqno for ls_stats in self.stats)
+
+        return stats.error_rate > self.max_error_rate or max_seqno - stats.mc_seqno > self.max_lag
+
+    def _score(self, ls_index: int):
+        stats = self.stats[ls_index]
+        return stats.latency * (1 + 4 * stats.error_rate)
+
+    def _bind_loop(self):
+        """Запускает фоновые задачи планировщика в текущем цикле событий."""
+
+        try:
+            loop = asyncio.get_running_loop()
+
+        except RuntimeError:
+            return
+
+        if self._loop is loop:
+            return
+
+        self._loop = loop
+        self._tasks = [loop.create_task(self._probe()), loop.create_task(self._sync())]
+
+    async def _probe(self):
+        """Периодически проверяет все лайт-сервера, включая исключенные."""
+
+        while True:
+            await asyncio.gather(*[self._probe_one(ls_index) for ls_index in range(self.ls_cnt)])
+
+            if self.verbose:
+                ejected = [ls_index for ls_index in range(self.ls_cnt) if self.is_ejected(ls_index)]
+                print(f"Liteservers ranking: {self.ranked()}, ejected: {ejected}")
+
+            await asyncio.sleep(self.probe_interval)
+
+    async def _probe_one(self, ls_index: int):
+        started = time.monotonic()
+
+        try:
+            async with self.pool.acquire(ls_index) as client:
+                info = await client.get_masterchain_info()
+
+            self.stats[ls_index].mc_seqno = int(info["last"]["seqno"])
+            self.record(ls_index, time.monotonic() - started)
+
+        except Exception as e:
+
+            if self.verbose:
+                print(f"The ls with the index {ls_index} failed the probe: {e}")
+
+            self.record(ls_index, None)
+
+    async def _sync(self):
+        """Периодически объединяет статистику с общей статистикой в Redis."""
+
+        while True:
+            await asyncio.sleep(self.sync_interval)
+
+            try:
+                await self._sync_once()
+
+            except Exception as e:
+                print(f"Error when synchronizing liteservers statistics: {e}")
+
+    async def _sync_once(self):
+        redis = get_redis()
+        keys = [f"lidum:ls:{self.network}:{ls_index}" for ls_index in range(self.ls_cnt)]
+
+        async with redis.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.hgetall(key)
+
+            shared = await pipe.execute()
+
+        async with redis.pipeline(transaction=False) as pipe:
+
+            for key, stats, remote in zip(keys, self.stats, shared):
+
+                if remote:
+                    stats.latency = (stats.latency + float(remote[b"latency"])) / 2
+                    stats.error_rate = (stats.error_rate + float(remote[b"error_rate"])) / 2
+                    stats.mc_seqno = max(stats.mc_seqno, int(remote[b"mc_seqno"]))
+
+                pipe.hset(key, mapping={
+                    "latency": stats.latency,
+                    "error_rate": stats.error_rate,
+                    "mc_seqno": stats.mc_seqno,
+                })
+                pipe.expire(key, self.probe_interval * 10)
+
+            await pipe.execute()
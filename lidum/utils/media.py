@@ -0,0 +1,119 @@
+import os
+import shutil
+from os import makedirs
+from os.path import join, split, isfile, splitext
+
+from PIL import Image
+
+from ..config import MEDIA_PATH, PROJECT_URL, PROJECT_ROOT
+from ..config import IMAGE_DERIVATIVE_WIDTHS
+
+# Форматы уменьшенных копий изображений в порядке предпочтения
+DERIVATIVE_FORMATS = ("avif", "webp")
+DERIVATIVE_QUALITY = 80
+
+
+def derivative_formats():
+    """Возвращает форматы уменьшенных копий, поддерживаемые установленным Pillow."""
+
+    Image.init()
+    return [image_format for image_format in DERIVATIVE_FORMATS if image_format.upper() in Image.SAVE]
+
+
+def original_path(image_hash: str):
+    """Возвращает абсолютный путь до оригинала изображения в хранилище."""
+
+    return join(PROJECT_ROOT, MEDIA_PATH, "originals", image_hash[:2], image_hash)
+
+
+def derivative_path(image_hash: str, width: int, image_format: str, return_url: bool = False):
+    """Возвращает абсолютный путь до уменьшенной копии изображения указанной ширины."""
+
+    base = PROJECT_URL if return_url else PROJECT_ROOT
+    return join(base, MEDIA_PATH, str(width), image_hash[:2], f"{image_hash}.{image_format}")
+
+
+def image_derivatives(image_hash: str):
+    """Возвращает ссылки на уменьшенные копии изображения вида `{формат: {ширина: URL}}`."""
+
+    return {
+        image_format: {str(width): derivative_path(image_hash, width, image_format, True) for width in IMAGE_DERIVATIVE_WIDTHS}
+        for image_format in derivative_formats()
+    }
+
+
+def store_original(image_hash: str, upload_file: str):
+    """Переносит загруженный файл в хранилище оригиналов, если изображения с таким хэшем
+    там еще нет, иначе удаляет загруженный файл как повтор."""
+
+    path = original_path(image_hash)
+
+    if isfile(path):
+        if isfile(upload_file):
+            os.remove(upload_file)
+
+        return path
+
+    makedirs(split(path)[0], exist_ok=True)
+    os.replace(upload_file, path)
+
+    return path
+
+
+def link_original(image_hash: str, image_path: str):
+    """Размещает оригинал изображения по пути `image_path` жесткой ссылкой, чтобы
+    повторно загруженные изображения не занимали место на диске.
+
+    Если формат оригинала не соответствует расширению `image_path`, изображение
+    сохраняется в нужном формате отдельным файлом.
+    """
+    path = original_path(image_hash)
+    makedirs(split(image_path)[0], exist_ok=True)
+
+    with Image.open(path) as image:
+        extension_format = Image.registered_extensions().get(splitext(image_path)[1].lower())
+
+        if extension_format != image.format:
+            image.save(image_path)
+            return
+
+    # Замена через временную ссылку, чтобы файл коллекции не пропадал для читателей
+    tmp_path = f"{image_path}.{os.getpid()}.tmp"
+
+    try:
+        os.link(path, tmp_path)
+
+    except OSError:
+        shutil.copyfile(path, tmp_path)
+
+    os.replace(tmp_path, image_path)
+
+
+def create_derivatives(image_hash: str):
+    """Создает отсутствующие уменьшенные копии оригинала изображения во всех ширинах и
+    форматах. Изображения меньше указанной ширины не увеличиваются."""
+
+    with Image.open(original_path(image_hash)) as image:
+        image.load()
+
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA")
+
+        for width in IMAGE_DERIVATIVE_WIDTHS:
+            resized = None
+
+            for image_format in derivative_formats():
+                path = derivative_path(image_hash, width, image_format)
+
+                if isfile(path):
+                    continue
+
+                if resized is None:
+                    resized = image.copy()
+                    resized.thumbnail((width, image.height), Image.LANCZOS)
+
+                makedirs(split(path)[0], exist_ok=True)
+
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                resized.save(tmp_path, image_format.upper(), quality=DERIVATIVE_QUALITY)
+                os.replace(tmp_path, path)
@@ -0,0 +1,71 @@
+from hashlib import sha256
+from functools import lru_cache
+
+from tonsdk.utils import Address
+from tonsdk.contract.token.nft import NFTItem
+
+# Длина дескрипторов ячейки данных NFT перед полем индекса
+_INDEX_OFFSET = 2
+_INDEX_SIZE = 8
+_HASH_SIZE = 32
+
+
+def nft_item_address(collection_address: str, index: int):
+    """Вычисляет адрес NFT по его индексу в коллекции без обращения к блокчейну.
+
+    Адрес NFT — хэш StateInit из кода `NFTItem.code` и ячейки данных с индексом и адресом
+    коллекции, как в методе `get_nft_address_by_index` контракта коллекции.
+
+    :param str collection_address: Адрес коллекции в raw или user-friendly.
+    :param int index: Индекс NFT в коллекции.
+    :return: Адрес NFT в user-friendly.
+    :rtype: str
+    """
+    item = NFTItem(index=index, collection_address=Address(collection_address))
+    return item.create_state_init()["address"].to_string(True, True, True)
+
+
+def nft_item_addresses(collection_address: str, from_index: int, count: int):
+    """Вычисляет адреса NFT с индексами от `from_index` до `from_index + count - 1`.
+
+    Ячейки StateInit разных NFT одной коллекции отличаются только индексом, поэтому их
+    представления строятся один раз, а для каждого индекса пересчитываются только два
+    хэша.
+
+    :param str collection_address: Адрес коллекции в raw или user-friendly.
+    :param int from_index: Индекс первого NFT.
+    :param int count: Количество NFT.
+    :return: Адреса NFT в user-friendly в порядке индексов.
+    :rtype: list[str]
+    """
+    workchain, data_prefix, data_suffix, state_init_prefix = _state_init_template(Address(collection_address).to_string())
+
+    addresses = []
+
+    for index in range(from_index, from_index + count):
+        data_hash = sha256(data_prefix + index.to_bytes(_INDEX_SIZE, "big") + data_suffix).digest()
+        state_init_hash = sha256(state_init_prefix + data_hash).digest()
+
+        addresses.append(Address(f"{workchain}:{state_init_hash.hex()}").to_string(True, True, True))
+
+    return addresses
+
+
+@lru_cache(maxsize=1024)
+def _state_init_template(collection_address: str):
+    """Возвращает неизменные части представлений ячеек StateInit NFT коллекции."""
+
+    collection_address = Address(collection_address)
+    state_init = NFTItem(index=0, collection_address=collection_address).create_state_init()
+
+    data_repr = bytes(state_init["data"].bytes_repr())
+    state_init_repr = bytes(state_init["state_init"].bytes_repr())
+
+    data_prefix = data_repr[:_INDEX_OFFSET]
+    data_suffix = data_repr[_INDEX_OFFSET + _INDEX_SIZE:]
+
+    # Хэш ячейки данных — последняя ссылка в представлении StateInit
+    state_init_prefix = state_init_repr[:-_HASH_SIZE]
+
+    # NFT создаются в базовом воркчейне независимо от воркчейна коллекции
+    return state_init["address"].wc, data_prefix, data_suffix, state_init_prefix
@@ -4,26 +4,114 @@ from os.path import join
 
 from PIL import Image
 
+from .hash import sha256_hash
 from ..config import NFT_LAYERS_PATH
 
+_layer_bank = None
 
-def get_random_nft():
-    """Смешивает случайные слои и возвращает NFT."""
 
-    nft_type_dir = join(NFT_LAYERS_PATH, random.choice(listdir(NFT_LAYERS_PATH)))
-    layers_dir = sorted([join(nft_type_dir, layer_dir) for layer_dir in listdir(nft_type_dir)])
+def layers_index(layers_path: str):
+    """Возвращает структуру директории слоев без загрузки изображений.
+
+    :param str layers_path: Путь до директории с типами NFT и их слоями.
+    :return: Список типов NFT вида `(тип, [(слой, [варианты слоя]), ...])`, все списки
+        отсортированы, слои указаны в порядке наложения.
+    :rtype: list[tuple[str, list[tuple[str, list[str]]]]]
+    """
+    index = []
+
+    for nft_type in sorted(listdir(layers_path)):
+        nft_type_dir = join(layers_path, nft_type)
+
+        layers = [(layer, sorted(listdir(join(nft_type_dir, layer)))) for layer in sorted(listdir(nft_type_dir))]
+        index.append((nft_type, layers))
+
+    return index
+
+
+class LayerBank:
+    """Декодированные слои NFT, загружаемые в память один раз.
+
+    Слои каждого типа NFT хранятся в порядке наложения, а варианты каждого слоя — уже
+    преобразованными в RGBA, поэтому при генерации NFT не требуется обращаться к диску и
+    декодировать PNG.
+
+    :param str layers_path: Путь до директории с типами NFT и их слоями.
+    """
+
+    def __init__(self, layers_path: str):
+
+        self.layers_path = layers_path
+        self.index = layers_index(layers_path)
+        self.nft_types = [self._load_type(nft_type, layers) for nft_type, layers in self.index]
+
+    def render(self, type_index: int, variants: list[int]):
+        """Смешивает указанные варианты слоев типа NFT и возвращает NFT.
+
+        :param int type_index: Индекс типа NFT.
+        :param list[int] variants: Индекс варианта для каждого слоя типа.
+        """
+        nft = None
+
+        for layer, variant in zip(self.nft_types[type_index], variants):
+
+            if nft is None:
+                nft = layer[variant]
+
+            else:
+                nft = Image.alpha_composite(nft, layer[variant])
+
+        return nft
 
-    nft = None
+    def random_combination(self):
+        """Возвращает случайный тип NFT и случайные варианты его слоев."""
 
-    for layer_dir in layers_dir:
+        type_index = random.randrange(len(self.nft_types))
+        variants = [random.randrange(len(layer)) for layer in self.nft_types[type_index]]
 
-        images = [join(layer_dir, image) for image in listdir(layer_dir)]
-        layer = Image.open(random.choice(images)).convert("RGBA")
+        return type_index, variants
 
-        if nft is None:
-            nft = layer
+    def combination_key(self, type_index: int, variants: list[int]):
+        """Возвращает ключ комбинации по названиям типа NFT, слоев и их вариантов."""
 
-        else:
-            nft = Image.alpha_composite(nft, layer)
+        nft_type, layers = self.index[type_index]
+        names = [f"{layer}/{layer_variants[variant]}" for (layer, layer_variants), variant in zip(layers, variants)]
+
+        return sha256_hash("|".join([nft_type, *names]))
+
+    def random_nft(self):
+        """Смешивает случайные варианты слоев случайного типа и возвращает NFT."""
+
+        return self.render(*self.random_combination())
+
+    def _load_type(self, nft_type: str, layers: list[tuple[str, list[str]]]):
+        """Возвращает декодированные варианты каждого слоя типа NFT."""
+
+        images = []
+
+        for layer, variants in layers:
+            layer_images = []
+
+            for variant in variants:
+                with Image.open(join(self.layers_path, nft_type, layer, variant)) as image:
+                    layer_images.append(image.convert("RGBA"))
+
+            images.append(layer_images)
+
+        return images
+
+
+def load_layer_bank():
+    """Загружает слои NFT в память, если они еще не загружены."""
+    global _layer_bank
+
+    if _layer_bank is None:
+        _layer_bank = LayerBank(NFT_LAYERS_PATH)
+
+    return _layer_bank
+
+
+def get_random_nft():
+    """Смешивает случайные слои и возвращает NFT."""
 
-    return nft
+    return load_layer_bank().random_nft()
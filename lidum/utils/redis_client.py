@@ -0,0 +1,36 @@
+import asyncio
+from weakref import WeakKeyDictionary
+
+from redis.asyncio import Redis
+
+from ..config import REDIS_ADDRESS
+
+_redis = WeakKeyDictionary()
+
+
+def get_redis():
+    """Возвращает асинхронный клиент Redis для текущего цикла событий.
+
+    Соединения клиента привязаны к циклу событий, в котором были открыты, поэтому для
+    каждого цикла создается один клиент с пулом соединений, общий для всех корутин цикла.
+    Обработчики Flask, задачи celery и бот выполняются в долгоживущих циклах, поэтому
+    клиент создается один раз на процесс. Перед остановкой цикла клиент закрывается
+    `close_redis`.
+    """
+    loop = asyncio.get_running_loop()
+    redis = _redis.get(loop)
+
+    if redis is None:
+        redis = Redis.from_url(REDIS_ADDRESS)
+        _redis[loop] = redis
+
+    return redis
+
+
+async def close_redis():
+    """Закрывает клиент Redis текущего цикла событий и его соединения."""
+
+    redis = _redis.pop(asyncio.get_running_loop(), None)
+
+    if redis is not None:
+        await redis.aclose()
@@ -0,0 +1,134 @@
+import os
+import threading
+from os import makedirs
+from os.path import join
+from collections import OrderedDict
+
+from ..config import RENDER_CACHE_PATH, RENDER_CACHE_DISK_SIZE
+from ..config import RENDER_CACHE_MEMORY_BYTES
+
+
+class RenderCache:
+    """Кэш закодированных в PNG изображений NFT по ключу комбинации слоев.
+
+    Последние изображения хранятся в памяти процесса, пока их суммарный размер не
+    превышает `memory_bytes`, остальные — в директории на диске, общей для всех процессов.
+    При превышении `disk_size` файлов с диска удаляется десятая часть самых старых
+    изображений.
+
+    :param str path: Директория для хранения изображений.
+    :param int memory_bytes: Суммарный размер изображений в памяти процесса в байтах.
+    :param int disk_size: Количество изображений на диске.
+    """
+
+    def __init__(self, path: str, memory_bytes: int, disk_size: int):
+
+        self.path = path
+        self.memory_bytes = memory_bytes
+        self.disk_size = disk_size
+
+        self._memory = OrderedDict()
+        self._memory_used = 0
+        self._memory_lock = threading.Lock()
+        self._disk_cnt = None
+
+        makedirs(path, exist_ok=True)
+
+    def get(self, key: str):
+        """Возвращает изображение из кэша, либо None."""
+
+        with self._memory_lock:
+            image = self._memory.get(key)
+
+            if image is not None:
+                self._memory.move_to_end(key)
+                return image
+
+        try:
+            with open(self._file(key), "rb") as file:
+                image = file.read()
+
+        except FileNotFoundError:
+            return None
+
+        self._remember(key, image)
+
+        return image
+
+    def put(self, key: str, image: bytes):
+        """Сохраняет изображение в памяти и на диске."""
+
+        self._remember(key, image)
+
+        # Запись через временный файл, чтобы другие процессы не прочитали его частично
+        tmp_file = f"{self._file(key)}.{os.getpid()}.tmp"
+
+        with open(tmp_file, "wb") as file:
+            file.write(image)
+
+        os.replace(tmp_file, self._file(key))
+
+        if self._disk_cnt is None:
+            self._disk_cnt = len(os.listdir(self.path))
+
+        self._disk_cnt += 1
+
+        if self._disk_cnt > self.disk_size:
+            self._evict()
+
+    def _file(self, key: str):
+        return join(self.path, f"{key}.png")
+
+    def _remember(self, key: str, image: bytes):
+
+        # Изображение больше всего кэша вытеснило бы остальные и все равно не поместилось бы
+        if len(image) > self.memory_bytes:
+            return
+
+        with self._memory_lock:
+            previous = self._memory.pop(key, None)
+
+            if previous is not None:
+                self._memory_used -= len(previous)
+
+            self._memory[key] = image
+            self._memory_used += len(image)
+
+            while self._memory_used > self.memory_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_used -= len(evicted)
+
+    def _evict(self):
+        """Удаляет с диска самые старые изображения."""
+
+        files = []
+
+        for entry in os.scandir(self.path):
+
+            if entry.name.endswith(".png"):
+                files.append((entry.stat().st_mtime, entry.path))
+
+        files.sort()
+
+        for _, path in files[:max(len(files) - self.disk_size * 9 // 10, 0)]:
+
+            try:
+                os.remove(path)
+
+            except FileNotFoundError:
+                pass
+
+        self._disk_cnt = len(os.listdir(self.path))
+
+
+_render_cache = None
+
+
+def get_render_cache():
+    """Возвращает кэш изображений NFT процесса."""
+    global _render_cache
+
+    if _render_cache is None:
+        _render_cache = RenderCache(RENDER_CACHE_PATH, RENDER_CACHE_MEMORY_BYTES, RENDER_CACHE_DISK_SIZE)
+
+    return _render_cache
@@ -1,9 +1,12 @@
+import re
 import base64
 from datetime import datetime
 
-from pydantic import Field, BaseModel, field_validator
+from pydantic import Field, BaseModel, field_validator, model_validator
 from tonsdk.utils import Address, InvalidAddressError
 
+BASE64_PATTERN = re.compile(r"[A-Za-z0-9+/]*={0,2}")
+
 
 class DropperPriceParams(BaseModel):
     nfts_cnt: int = Field(..., ge=0)
@@ -78,6 +81,20 @@ class AddVisitedChannelParams(BaseModel):
             raise ValueError("telegram_id must be convertible to integer")
 
 
+class EventSubscriptionsParams(BaseModel):
+    telegram_id: int
+    event_id: str
+
+    @field_validator("telegram_id", mode="before")
+    def convert_telegram_id(cls, value):
+
+        try:
+            return int(value)
+
+        except ValueError:
+            raise ValueError("telegram_id must be convertible to integer")
+
+
 class IsUserSubscribedParams(BaseModel):
     telegram_id: int
     channel: str = Field(..., pattern=r"^(https://t\.me/[A-Za-z0-9_]+|@[A-Za-z0-9_]+)$")
@@ -206,7 +223,8 @@ class CreateEventParams(BaseModel):
     collection_name: str = Field(..., max_length=16)
     nfts_cnt: int = Field(..., ge=0)
     image_name: str
-    image: str
+    image: str | None = Field(default=None)
+    upload_id: str | None = Field(default=None, pattern=r"^[0-9a-f]{64}$")
     start_date: str
     end_date: str
     password: str = Field(..., max_length=64)
@@ -238,18 +256,26 @@ class CreateEventParams(BaseModel):
     @field_validator("image", mode="before")
     def validate_base64_image(cls, value):
 
+        if value is None:
+            return value
+
         if not value.startswith(("data:image/jpeg;base64,", "data:image/png;base64,")):
             raise ValueError("image must start with a valid base64 prefix,"
                              "e.g., 'data:image/jpeg;base64,' or 'data:image/png;base64,'")
 
-        base64_data = value.split(",")[1]
+        # Проверка алфавита без декодирования: изображение декодируется один раз при сохранении
+        if not BASE64_PATTERN.fullmatch(value.split(",")[1]):
+            raise ValueError("image must be a valid base64-encoded string")
 
-        try:
-            base64.b64decode(base64_data, validate=True)
-            return value
+        return value
 
-        except (ValueError, base64.binascii.Error):
-            raise ValueError("image must be a valid base64-encoded string")
+    @model_validator(mode="after")
+    def validate_image_source(self):
+
+        if (self.image is None) == (self.upload_id is None):
+            raise ValueError("exactly one of image and upload_id must be provided")
+
+        return self
 
     @field_validator("start_date", "end_date", mode="before")
     def validate_datetime_format(cls, value):
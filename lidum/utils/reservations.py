@@ -0,0 +1,100 @@
+from .redis_client import get_redis
+
+# Результаты резервирования NFT события
+RESERVED = 1
+NFTS_LEFT = 0
+REPEAT_USER = -1
+NOT_LOADED = -2
+
+# Время хранения счетчиков события в Redis в секундах
+RESERVATIONS_TTL = 24 * 60 * 60
+
+# KEYS: остаток NFT, участники события. ARGV: id пользователя
+_RESERVE_SCRIPT = """
+if redis.call("SISMEMBER", KEYS[2], ARGV[1]) == 1 then
+    return -1
+end
+
+local left = redis.call("GET", KEYS[1])
+
+if not left then
+    return -2
+end
+
+if tonumber(left) <= 0 then
+    return 0
+end
+
+redis.call("DECR", KEYS[1])
+redis.call("SADD", KEYS[2], ARGV[1])
+
+return 1
+"""
+
+# KEYS: остаток NFT, участники события. ARGV: id пользователя
+_RELEASE_SCRIPT = """
+if redis.call("SREM", KEYS[2], ARGV[1]) == 1 then
+    redis.call("INCR", KEYS[1])
+end
+"""
+
+# KEYS: остаток NFT, участники события. ARGV: остаток NFT, время хранения, id участников
+_LOAD_SCRIPT = """
+if redis.call("EXISTS", KEYS[1]) == 1 then
+    return 0
+end
+
+redis.call("DEL", KEYS[2])
+
+for i = 3, #ARGV do
+    redis.call("SADD", KEYS[2], ARGV[i])
+end
+
+redis.call("SET", KEYS[1], ARGV[1], "EX", ARGV[2])
+redis.call("EXPIRE", KEYS[2], ARGV[2])
+
+return 1
+"""
+
+
+def _keys(event_id: int):
+    return [f"lidum:event:{event_id}:left", f"lidum:event:{event_id}:claimants"]
+
+
+async def reserve_nft(event_id: int, telegram_id: str | int):
+    """Атомарно резервирует NFT события за пользователем одним запросом к Redis.
+
+    :return: `RESERVED`, если NFT зарезервирован, `NFTS_LEFT`, если NFT закончились,
+        `REPEAT_USER`, если пользователь уже получил NFT этого события, или `NOT_LOADED`,
+        если счетчики события еще не загружены в Redis.
+    :rtype: int
+    """
+    return await get_redis().eval(_RESERVE_SCRIPT, 2, *_keys(event_id), int(telegram_id))
+
+
+async def release_nft(event_id: int, telegram_id: str | int):
+    """Отменяет резервирование NFT события за пользователем."""
+
+    await get_redis().eval(_RELEASE_SCRIPT, 2, *_keys(event_id), int(telegram_id))
+
+
+async def load_reservations(event_id: int, nfts_left: int, claimants: list[int]):
+    """Загружает в Redis остаток NFT события и его участников, если они еще не загружены.
+
+    :param int event_id: Идентификатор события.
+    :param int nfts_left: Количество NFT, которые еще можно получить.
+    :param list[int] claimants: Идентификаторы пользователей, уже получивших NFT.
+    """
+    await get_redis().eval(_LOAD_SCRIPT, 2, *_keys(event_id), max(nfts_left, 0), RESERVATIONS_TTL, *claimants)
+
+
+async def nfts_left(event_id: int):
+    """Возвращает остаток NFT события из Redis.
+
+    :return: Количество NFT, которые еще можно получить, либо None, если счетчики
+        события еще не загружены в Redis.
+    :rtype: int | None
+    """
+    left = await get_redis().get(_keys(event_id)[0])
+
+    return None if left is None else int(left)
@@ -16,3 +16,4 @@ NFT_GENERATING_ERROR = "NFT_GENERATING_ERROR"
 QUEUE_ERROR = "QUEUE_ERROR"
 BOT_ERROR = "BOT_ERROR"
 VALIDATE_ERROR = "VALIDATE_ERROR"
+UPLOAD_TOO_LARGE = "UPLOAD_TOO_LARGE"
@@ -0,0 +1,135 @@
+import argparse
+
+from sqlalchemy import text, inspect
+from sqlalchemy.schema import AddConstraint, UniqueConstraint
+
+# Ключ advisory-блокировки PostgreSQL, под которой выполняется миграция
+MIGRATION_LOCK_ID = 0x6C6964756D
+
+
+def migrate(engine, metadata, deduplicate: bool = False):
+    """Приводит схему существующей базы данных к моделям.
+
+    `db.create_all()` создает только отсутствующие таблицы, поэтому столбцы, индексы и
+    уникальные ограничения, добавленные в модели позже, создаются здесь. Миграция
+    запускается оператором командой `python -m lidum.utils.schema` и выполняется в одной
+    транзакции под advisory-блокировкой, поэтому одновременные запуски выполняются по
+    очереди. Повторный вызов ничего не меняет.
+
+    Повторяющиеся строки, мешающие созданию уникального ограничения, удаляются только при
+    `deduplicate=True`, остается самая ранняя из них.
+
+    :param engine: Движок базы данных.
+    :param metadata: Метаданные моделей, `db.metadata`.
+    :param bool deduplicate: Удалять ли повторяющиеся строки.
+    :return: Описания выполненных изменений.
+    :rtype: list[str]
+
+    :raise RuntimeError: Если в таблице есть повторяющиеся строки, а `deduplicate=False`.
+    """
+    changes = []
+
+    with engine.begin() as connection:
+        connection.execute(text("SELECT pg_advisory_xact_lock(:lock_id)"), {"lock_id": MIGRATION_LOCK_ID})
+
+        inspector = inspect(connection)
+        tables = set(inspector.get_table_names())
+
+        for table in metadata.sorted_tables:
+
+            if table.name not in tables:
+                continue
+
+            # Столбцы
+            columns = {column["name"] for column in inspector.get_columns(table.name)}
+
+            for column in table.columns:
+
+                if column.name in columns:
+                    continue
+
+                if not column.nullable:
+                    raise RuntimeError(f"The NOT NULL column {table.name}.{column.name} must be added manually")
+
+                column_type = column.type.compile(dialect=connection.dialect)
+                connection.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'))
+                changes.append(f"column {table.name}.{column.name}")
+
+            # Уникальные ограничения
+            constraints = {constraint["name"] for constraint in inspector.get_unique_constraints(table.name)}
+
+            for constraint in table.constraints:
+
+                if not isinstance(constraint, UniqueConstraint) or constraint.name in constraints:
+                    continue
+
+                columns = [column.name for column in constraint.columns]
+                duplicates_cnt = _duplicates_cnt(connection, table.name, columns)
+
+                if duplicates_cnt and not deduplicate:
+                    raise RuntimeError(f"The table {table.name} has {duplicates_cnt} duplicate rows by {', '.join(columns)}, "
+                                       "run the migration with --deduplicate to delete them")
+
+                if duplicates_cnt:
+                    _deduplicate(connection, table.name, columns)
+                    changes.append(f"deleted {duplicates_cnt} duplicate rows from {table.name}")
+
+                connection.execute(AddConstraint(constraint))
+                changes.append(f"constraint {constraint.name}")
+
+            # Индексы
+            indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+
+            for index in table.indexes:
+
+                if index.name not in indexes:
+                    index.create(connection)
+                    changes.append(f"index {index.name}")
+
+    return changes
+
+
+def _duplicates_cnt(connection, table_name: str, columns: list[str]):
+    """Возвращает количество строк, повторяющих более раннюю строку по значениям `columns`."""
+
+    return connection.execute(text(
+        f'SELECT COUNT(DISTINCT duplicate.id) FROM "{table_name}" AS duplicate JOIN "{table_name}" AS original '
+        f"ON duplicate.id > original.id AND {_duplicate_condition(columns)}"
+    )).scalar()
+
+
+def _deduplicate(connection, table_name: str, columns: list[str]):
+    """Удаляет строки, повторяющие более раннюю строку по значениям `columns`."""
+
+    connection.execute(text(
+        f'DELETE FROM "{table_name}" AS duplicate USING "{table_name}" AS original '
+        f"WHERE duplicate.id > original.id AND {_duplicate_condition(columns)}"
+    ))
+
+
+def _duplicate_condition(columns: list[str]):
+    return " AND ".join(f'duplicate."{column}" = original."{column}"' for column in columns)
+
+
+def explain(statement, session):
+    """Возвращает план выполнения запроса, например чтобы убедиться, что он использует
+    индекс, а не просматривает всю таблицу.
+
+    :rtype: str
+    """
+    compiled = statement.compile(dialect=session.bind.dialect, compile_kwargs={"literal_binds": True})
+    return "\n".join(row[0] for row in session.execute(text(f"EXPLAIN {compiled}")))
+
+
+if __name__ == "__main__":
+    from .. import db, get_app
+    from . import db as models  # noqa: F401 Регистрация моделей в метаданных
+
+    parser = argparse.ArgumentParser(description="Brings the schema of the existing database to the models")
+    parser.add_argument("--deduplicate", action="store_true", help="delete duplicate rows that prevent unique constraints")
+    args = parser.parse_args()
+
+    with get_app().app_context():
+        changes = migrate(db.engine, db.metadata, deduplicate=args.deduplicate)
+
+    print("\n".join(changes) if changes else "The database schema is up to date")
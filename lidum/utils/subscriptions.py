@@ -0,0 +1,73 @@
+import asyncio
+
+from .redis_client import get_redis
+from .telegram_api import TelegramAPIError
+from ..config import SUBSCRIPTION_CACHE_TTL
+from ..config import SUBSCRIPTION_NEGATIVE_CACHE_TTL
+
+# Статусы участника, означающие подписку на канал
+MEMBER_STATUSES = ("member", "administrator", "creator")
+
+
+def _key(telegram_id: int, channel: str):
+    return f"lidum:subscribed:{telegram_id}:{channel.lower()}"
+
+
+async def check_subscriptions(telegram_api, telegram_id: int, channels: list[str]):
+    """Проверяет подписку пользователя на каналы.
+
+    Сохраненные результаты берутся из Redis одним запросом, остальные каналы проверяются
+    через `getChatMember` одновременно. Наличие подписки хранится
+    `SUBSCRIPTION_CACHE_TTL` секунд, отсутствие — `SUBSCRIPTION_NEGATIVE_CACHE_TTL` секунд.
+
+    :param TelegramAPI telegram_api: Клиент Telegram Bot API.
+    :param int telegram_id: Идентификатор пользователя в телеграме.
+    :param list[str] channels: Юзернеймы каналов, начинающиеся с @.
+    :return: Подписан ли пользователь на каждый канал. Если подписку проверить не
+        удалось, вместо результата указывается описание ошибки.
+    :rtype: dict[str, bool | str]
+    """
+    redis = get_redis()
+    results = {}
+
+    if not channels:
+        return results
+
+    cached = await redis.mget([_key(telegram_id, channel) for channel in channels])
+
+    for channel, value in zip(channels, cached):
+
+        if value is not None:
+            results[channel] = value == b"1"
+
+    missing = [channel for channel in channels if channel not in results]
+
+    if not missing:
+        return results
+
+    members = await asyncio.gather(
+        *[telegram_api.call("getChatMember", chat_id=channel, user_id=telegram_id) for channel in missing],
+        return_exceptions=True,
+    )
+
+    async with redis.pipeline(transaction=False) as pipe:
+
+        for channel, member in zip(missing, members):
+
+            if isinstance(member, TelegramAPIError):
+                results[channel] = member.description
+                continue
+
+            if isinstance(member, Exception):
+                results[channel] = str(member)
+                continue
+
+            subscribed = member["status"] in MEMBER_STATUSES
+            results[channel] = subscribed
+
+            ttl = SUBSCRIPTION_CACHE_TTL if subscribed else SUBSCRIPTION_NEGATIVE_CACHE_TTL
+            pipe.set(_key(telegram_id, channel), int(subscribed), ex=ttl)
+
+        await pipe.execute()
+
+    return results
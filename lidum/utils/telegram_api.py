@@ -0,0 +1,115 @@
+import asyncio
+
+import aiohttp
+
+from .async_runner import AsyncRunner
+
+
+class TelegramAPIError(Exception):
+    """Ошибка, возвращенная Telegram Bot API.
+
+    :param int error_code: Код ошибки Telegram Bot API.
+    :param str description: Описание ошибки.
+    """
+
+    def __init__(self, error_code: int, description: str):
+        self.error_code = error_code
+        self.description = description
+        super().__init__(f"{error_code}: {description}")
+
+
+class TelegramAPI:
+    """Асинхронный клиент Telegram Bot API с пулом keep-alive соединений.
+
+    Сессия aiohttp привязана к циклу событий, поэтому запросы выполняются в отдельном
+    долгоживущем цикле событий, и клиент можно вызывать из любого цикла, а соединения
+    переиспользуются между запросами к приложению. При ответе 429
+    запрос повторяется через `retry_after` секунд, но не более `max_retries` раз.
+
+    :param str token: Токен бота.
+    :param str base_url: Адрес сервера Bot API. Для тестов можно указать локальный сервер.
+    :param float timeout: Общее время ожидания одного запроса в секундах.
+    :param int max_retries: Максимальное количество повторов запроса при ответе 429.
+    :param int pool_size: Максимальное количество одновременных соединений.
+
+    Examples:
+    ```python
+    telegram_api = TelegramAPI(token=BOT_TOKEN)
+
+    member = await telegram_api.call("getChatMember", chat_id=channel, user_id=telegram_id)
+    ```
+    """
+
+    def __init__(self,
+                 token: str,
+                 base_url: str = "https://api.telegram.org",
+                 timeout: float = 10,
+                 max_retries: int = 3,
+                 pool_size: int = 100):
+
+        self.url = f"{base_url.rstrip('/')}/bot{token}"
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.pool_size = pool_size
+
+        self._session = None
+        self._runner = AsyncRunner(max_concurrency=pool_size, on_stop=self.close)
+
+    async def call(self, method: str, files: dict[str, bytes] | None = None, **params):
+        """Выполняет метод Bot API и возвращает поле `result` ответа.
+
+        :param str method: Название метода Bot API.
+        :param dict[str, bytes] | None files: Файлы для загрузки по названиям полей.
+        :return: Результат выполнения метода.
+
+        :raise TelegramAPIError: Если Bot API вернул ошибку.
+        """
+        return await asyncio.wrap_future(self._runner.submit(self._request(method, files, params)))
+
+    async def close(self):
+        """Закрывает сессию и соединения клиента."""
+
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _request(self, method: str, files: dict[str, bytes] | None, params: dict):
+
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                connector=aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60),
+            )
+
+        for _ in range(self.max_retries + 1):
+
+            async with self._session.post(f"{self.url}/{method}", data=self._form(files, params)) as response:
+                data = await response.json(content_type=None)
+
+            if data.get("ok"):
+                return data["result"]
+
+            retry_after = data.get("parameters", {}).get("retry_after")
+
+            if data.get("error_code") != 429 or retry_after is None:
+                break
+
+            await asyncio.sleep(retry_after)
+
+        raise TelegramAPIError(data.get("error_code", response.status), data.get("description", "Unknown error"))
+
+    @staticmethod
+    def _form(files: dict[str, bytes] | None, params: dict):
+        """Возвращает тело запроса: обычную форму или multipart, если есть файлы."""
+
+        params = {key: str(value) for key, value in params.items() if value is not None}
+
+        if not files:
+            return params
+
+        form = aiohttp.FormData(params)
+
+        for name, content in files.items():
+            form.add_field(name, content, filename=name)
+
+        return form
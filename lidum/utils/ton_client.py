@@ -1,36 +1,57 @@
+import time
 import asyncio
 from os import makedirs
 from typing import Literal
+from functools import lru_cache
+from contextlib import asynccontextmanager
 
 import requests
 from pytonapi import Tonapi
-from pytonlib import TonlibClient
 from ton.utils import read_address
-from tonsdk.boc import Cell, Slice
+from tonsdk.boc import Cell, Slice, DictBuilder
 from tonsdk.utils import Address, b64str_to_bytes
-from pytonlib.tonlibjson import TonlibError
+from redis.exceptions import LockError
 from tonsdk.contract.token.nft import NFTItem, NFTCollection
+from tonsdk.contract.token.nft.nft_utils import serialize_uri
 
 from .wallet import LIDUM_WALLET, LIDUM_WALLET_ADDRESS
-from ..config import ROYALTY, LS_CONFIG, TONAPI_KEY
+from ..config import ROYALTY, LS_CONFIG, LS_MAX_LAG, TONAPI_KEY
 from ..config import MINT_TIMEOUT, ROYALTY_BASE, KEYSTORE_PATH
 from ..config import FORWARD_AMOUNT, TONLIB_TIMEOUT
-from ..config import TRANSFER_TIMEOUT, LS_CONFIG_TESTNET
-from ..config import NFT_TRANSFER_AMOUNT
+from ..config import TONLIB_POOL_SIZE, TRANSFER_TIMEOUT
+from ..config import LS_CONFIG_TESTNET, LS_MAX_ERROR_RATE
+from ..config import LS_PROBE_INTERVAL, NFT_TRANSFER_AMOUNT
+from ..config import TONLIB_IDLE_TIMEOUT
+from ..config import WALLET_CONFIRM_TIMEOUT
 from ..config import COLLECTION_TRANSFER_AMOUNT
 from ..config import NFT_TRANSFER_FORWARD_AMOUNT
+from ..config import TONLIB_HEALTH_CHECK_INTERVAL
+from .convert import address_to_friendly
+from .ton_pool import TonlibPool
+from .nft_address import nft_item_address, nft_item_addresses
+from .ls_scheduler import LiteserverScheduler
+from .redis_client import get_redis
+from .wallet_sequencer import WalletSequencer
+from .confirmation_watcher import ConfirmationWatcher
+
+# Время хранения индекса первого NFT отправленного батча, с запасом на все попытки его минта
+BATCH_TTL = 7 * 24 * 60 * 60
+
+
+def batch_key(batch_id: str):
+    return f"lidum:batch:{batch_id}:from_index"
 
 
 class TonClient:
     """Класс для взаимодействия с блокчейном TON через библиотеку pytonlib.
 
-    Этот класс переопределяет часть методов класса TonlibClient для автоматической инициализации и завершения клиента, а также
-    для автоматической смены доступных лайт-серверов в случае появления ошибок от конкретного лайт-сервера.
+    Этот класс переопределяет часть методов класса TonlibClient для работы через пул постоянно инициализированных клиентов,
+    а также для автоматической смены доступных лайт-серверов в случае появления ошибок от конкретного лайт-сервера.
 
     :param bool is_testnet: Использовать ли конфигурацию для сети TestNet.
 
     :param int | Literal["auto"] ls_index: Индекс лайтсервера для подключения. Если указано "auto",
-        будет автоматически переберать доступные лайт-сервера, начиная с нулевого. По умолчанию, `'auto'`.
+        лайт-сервера будут выбираться планировщиком по задержке, доле ошибок и отставанию. По умолчанию, `'auto'`.
 
     :param int ls_retry_cnt: Максимальное количество обходов всех лайт-серверов при отправке одного сообщения.
         Имеет эффект только при значении `ls_index='auto'`.
@@ -50,7 +71,11 @@ class TonClient:
         config_retry_cnt (int): Количество попыток получения конфигурация лайт-серверов.
         raw_method_retry_cnt (int): Количество попыток выполнения метода смарт-контракта.
         verbose (bool): Режим вывода информации.
-        client (TonlibClient): Экземпляр клиента TonlibClient для работы с блокчейном.
+        cur_ls_index (int): Индекс лайт-сервера, на котором был выполнен последний запрос.
+        pool (TonlibPool): Пул инициализированных клиентов TonlibClient для работы с блокчейном.
+        sequencer (WalletSequencer): Очередь отправки сообщений с кошелька приложения.
+        watcher (ConfirmationWatcher): Общий наблюдатель за подтверждением операций в блокчейне.
+        scheduler (LiteserverScheduler): Планировщик выбора лайт-серверов.
 
     Examples:
     ```python
@@ -81,15 +106,44 @@ class TonClient:
         self.config = self.get_config()
         self.ls_cnt = len(self.config["liteservers"])
 
+        self.cur_ls_index = ls_index if isinstance(ls_index, int) else 0
+
         makedirs(KEYSTORE_PATH, exist_ok=True)
 
-        self.client = TonlibClient(
-            ls_index=ls_index if isinstance(ls_index, int) else 0,
+        self.pool = TonlibPool(
             config=self.config,
             keystore=KEYSTORE_PATH,
             tonlib_timeout=TONLIB_TIMEOUT,
+            size=TONLIB_POOL_SIZE,
+            idle_timeout=TONLIB_IDLE_TIMEOUT,
+            health_check_interval=TONLIB_HEALTH_CHECK_INTERVAL,
+            verbose=verbose,
+        )
+
+        self.sequencer = WalletSequencer(
+            wallet=LIDUM_WALLET,
+            wallet_address=LIDUM_WALLET_ADDRESS,
+            client=self,
+            confirm_timeout=WALLET_CONFIRM_TIMEOUT,
+            verbose=verbose,
         )
 
+        self.watcher = ConfirmationWatcher(client=self, verbose=verbose)
+
+        self.scheduler = LiteserverScheduler(
+            pool=self.pool,
+            network="testnet" if is_testnet else "mainnet",
+            max_lag=LS_MAX_LAG,
+            max_error_rate=LS_MAX_ERROR_RATE,
+            probe_interval=LS_PROBE_INTERVAL,
+            verbose=verbose,
+        )
+
+    async def close(self):
+        """Закрывает все инициализированные клиенты пула."""
+
+        await self.pool.close()
+
     def get_config(self):
         """Возвращает список лайт-серверов для указанной сети.
 
@@ -129,16 +183,33 @@ class TonClient:
                                amount: str,
                                payload: Cell | str | bytes | None = None,
                                state_init: Cell | None = None):
-        """Отправляет сообщение в блокчейн через TonlibClient. В режиме "auto"
-        перебирает доступные лайт-сервера, если при отправке сообщения возникает ошибка
-        лайт-сервера. Производит полный перебор доступных лайт-серверов `ls_retry_cnt`
-        раз.
+        """Отправляет сообщение с кошелька приложения через очередь `sequencer`.
+        Сообщение подписывается seqno, которым владеет отправитель, и считается
+        отправленным после подтверждения этого seqno в блокчейне.
 
         :param str to_addr: Адрес смарт-контракта в raw или user-friendly для отправки
             на него сообщения.
-        :param str amount: Количество нанотон для отправки сообщения. :param Cell | str
-            | bytes | None payload: Полезная нагрузка, прикрепляемая к сообщению. :param
-            Cell | None state_init: Ячейка с инициализирующим сообщением.
+        :param str amount: Количество нанотон для отправки сообщения.
+        :param Cell | str | bytes | None payload: Полезная нагрузка, прикрепляемая к
+            сообщению.
+        :param Cell | None state_init: Ячейка с инициализирующим сообщением.
+        :return: Статус отправки сообщения.
+        :rtype: bool
+        """
+        return await self.sequencer.submit(
+            to_addr=to_addr,
+            amount=amount,
+            payload=payload,
+            state_init=state_init,
+        )
+
+    async def send_boc(self, boc: bytes):
+        """Отправляет подписанное внешнее сообщение в блокчейн через TonlibClient. В
+        режиме "auto" перебирает лайт-сервера от лучшего к худшему, если при отправке
+        сообщения возникает ошибка лайт-сервера. Производит полный перебор лайт-серверов
+        `ls_retry_cnt` раз.
+
+        :param bytes boc: Сериализованное внешнее сообщение.
         :return: Статус отправки сообщения.
         :rtype: bool
         """
@@ -147,49 +218,68 @@ class TonClient:
             if self.verbose:
                 print(f"Attempt to send a message {i + 1} / {self.ls_retry_cnt}...")
 
-            for ls_id in range(self.ls_cnt):
+            try:
+                await self.request("raw_send_message", serialized_boc=boc)
 
-                try:
-                    query = LIDUM_WALLET.create_transfer_message(to_addr=to_addr,
-                                                                 amount=amount,
-                                                                 seqno=await self.seqno,
-                                                                 payload=payload,
-                                                                 state_init=state_init)
+                if self.verbose:
+                    print(f"Sending a message to the light server with the index {self.cur_ls_index} was successful")
 
-                    if self.ls_index == "auto":
-                        self.client.ls_index = ls_id
+                return True
 
-                    if self.verbose:
-                        print(f"An attempt to send a message to the ls with the index {self.client.ls_index}")
+            except Exception as e:
 
-                    await self.client.init()
-                    await self.client.raw_send_message(query["message"].to_boc(False))
+                if self.verbose:
+                    print(f"An error occurred when sending a message: {e}")
 
-                    if self.verbose:
-                        print(f"Sending a message to the light server with the index {self.client.ls_index} was successful")
+                await asyncio.sleep(1)
 
-                    return True
+        if self.verbose:
+            print("Sending a message to the light servers was unsuccessful")
 
-                except TonlibError as e:
+        return False
 
-                    if self.verbose:
-                        print(f"An error occurred when sending a message on a ls with the index {self.client.ls_index}: {e}")
+    def liteservers(self):
+        """Возвращает индексы лайт-серверов в порядке обращения к ним.
 
-                    if self.ls_index != "auto":
+        :rtype: list[int]
+        """
+        if self.ls_index == "auto":
+            return self.scheduler.ranked()
 
-                        if self.verbose:
-                            print(
-                                f"Sending a message to the light server with the index {self.client.ls_index} was unsuccessful")
+        return [self.ls_index]
 
-                    await asyncio.sleep(1)
+    async def request(self, method: str, **kwargs):
+        """Выполняет метод TonlibClient на лучшем доступном лайт-сервере. При ошибке
+        лайт-сервера запрос повторяется на следующем лайт-сервере.
 
-                finally:
-                    await self.client.close()
+        :param str method: Название метода TonlibClient.
+        :return: Результат выполнения метода.
 
-        if self.verbose:
-            print(f"Sending a message to the light server with the index {self.client.ls_index} was unsuccessful")
+        :raise Exception: Если запрос завершился ошибкой на всех лайт-серверах.
+        """
+        error = None
 
-        return False
+        for ls_index in self.liteservers():
+            started = time.monotonic()
+
+            try:
+                async with self.pool.acquire(ls_index) as client:
+                    result = await getattr(client, method)(**kwargs)
+
+                self.scheduler.record(ls_index, time.monotonic() - started)
+                self.cur_ls_index = ls_index
+
+                return result
+
+            except Exception as e:
+
+                if self.verbose:
+                    print(f"An error occurred when executing {method} on a ls with the index {ls_index}: {e}")
+
+                self.scheduler.record(ls_index, None)
+                error = e
+
+        raise error
 
     async def raw_get_account_state(self, address: str):
         """Возвращает данные смарт-контракта.
@@ -210,20 +300,14 @@ class TonClient:
             ```
         """
         try:
-            await self.client.init()
-
             if self.verbose:
                 print(f"Getting the account state for the {address} address...")
 
-            data = await self.client.raw_get_account_state(address)
-            return data
+            return await self.request("raw_get_account_state", address=address)
 
         except Exception as e:
             print(f"Error receiving account state {address}: {e}")
 
-        finally:
-            await self.client.close()
-
     async def raw_run_method(self, address: str, method: str, stack_data: list[list[str | str | dict]]):
         """Запускает метод смарт-контракта.
 
@@ -249,14 +333,12 @@ class TonClient:
         """
         for i in range(self.run_method_retry_cnt):
             try:
-                await self.client.init()
-
                 if self.verbose:
                     print(f"Attemp to get stack data for a smart contract {address}"
                           f"via the {method} method with stack_data {stack_data}"
                           f"{i + 1} / {self.run_method_retry_cnt}...")
 
-                stack = await self.client.raw_run_method(address=address, method=method, stack_data=stack_data)
+                stack = await self.request("raw_run_method", address=address, method=method, stack_data=stack_data)
 
                 if "exit_code" not in stack or stack["exit_code"] != 0:
 
@@ -270,11 +352,8 @@ class TonClient:
 
             except Exception as e:
 
-                raise (f"Error when receiving stack data for a smart contract {address}"
-                       f"via the {method} method with stack_data {stack_data}: {e}") from e
-
-            finally:
-                await self.client.close()
+                raise Exception(f"Error when receiving stack data for a smart contract {address}"
+                                f"via the {method} method with stack_data {stack_data}: {e}") from e
 
         raise Exception(f"Exceeded the number of attempts to get stack data for a smart contract {address}"
                         f"via the {method} method with stack_data {stack_data}.")
@@ -283,20 +362,15 @@ class TonClient:
         """Возвращает список последних транзакций, связанных с кошельком приложения."""
 
         try:
-            await self.client.init()
-            data = await self.client.get_transactions(account=LIDUM_WALLET_ADDRESS,
-                                                      from_transaction_lt=0,
-                                                      from_transaction_hash=hash,
-                                                      limit=limit)
-
-            return data
+            return await self.request("get_transactions",
+                                      account=LIDUM_WALLET_ADDRESS,
+                                      from_transaction_lt=0,
+                                      from_transaction_hash=hash,
+                                      limit=limit)
 
         except Exception as e:
             print(f"Error in receiving transactions: {e}")
 
-        finally:
-            await self.client.close()
-
     async def collection_last_index(self, collection_address: str):
         """Возвращает индекс последнего элемента в коллекции.
 
@@ -412,37 +486,30 @@ class TonClient:
             return False
 
         # Ожидание появления пустой коллекции на кошельке
-        timeout_cnt = 0
-
         if self.verbose:
             print(f"Waiting for the end of the collection's minting with the address {collection_address}...")
 
-        while True:
-
-            if timeout_cnt > MINT_TIMEOUT:
-
-                if self.verbose:
-                    print(f"The waiting time for the end of the collection's minting has been exceeded {collection_address}!")
-
-                return False
+        deployed = await self.watcher.wait_deployed(collection_address, timeout=MINT_TIMEOUT)
 
-            data = await self.raw_get_account_state(collection_address)
+        if not deployed:
 
-            if data is not None and data["code"] != "":
+            if self.verbose:
+                print(f"The waiting time for the end of the collection's minting has been exceeded {collection_address}!")
 
-                if self.verbose:
-                    print(f"Collection {collection_address} has been successfully minted!")
+            return False
 
-                return True
+        if self.verbose:
+            print(f"Collection {collection_address} has been successfully minted!")
 
-            await asyncio.sleep(1)
-            timeout_cnt += 1
+        return True
 
-    async def deploy_one_item(self, collection_address: str, nft_meta: str):
+    async def deploy_one_item(self, collection_address: str, nft_meta: str, owner_address: str | None = None):
         """Минт одного NFT в существующую коллекцию.
 
         :param str collection_address: Адрес коллекции в raw или user-friendly.
         :param str nft_meta: URL этого NFT.
+        :param str | None owner_address: Адрес владельца нового NFT в raw или user-friendly.
+            Если не указан, NFT минтится на кошелек приложения.
         :return: Адрес сминченного NFT в user-friendly.
         :rtype: str
         """
@@ -450,128 +517,233 @@ class TonClient:
             print(f"Starting the deployment of the NFT with metadata {nft_meta}"
                   f"to the collection with the address {collection_address}...")
 
-        body = await self.nft_mint_body(
-            collection_address=collection_address,
-            nft_meta=nft_meta,
-        )
-
         if self.verbose:
             print("Defining a new NFT index and address...")
 
-        last_index = await self.collection_last_index(collection_address)
-        new_nft_address = await self.nft_address_by_index(collection_address, last_index)
-
-        if self.verbose:
-            print(f"The new NFT will have an index of {last_index} and an address of {new_nft_address}")
+        # Индекс читается из коллекции, поэтому минты в неё выполняются по одному
+        try:
+            async with self.mint_lock(collection_address):
+                last_index = await self.collection_last_index(collection_address)
+                new_nft_address = nft_item_address(collection_address, last_index)
 
-        sent = await self.raw_send_message(
-            to_addr=collection_address,
-            amount=NFT_TRANSFER_AMOUNT,
-            payload=body,
-        )
+                body = self.nft_mint_body(
+                    item_index=last_index,
+                    nft_meta=nft_meta,
+                    owner_address=owner_address,
+                )
 
-        if not sent:
+                if self.verbose:
+                    print(f"The new NFT will have an index of {last_index} and an address of {new_nft_address}")
 
-            if self.verbose:
-                print(f"Sending a message to mint an NFT with the address {new_nft_address}"
-                      f"to the collection {collection_address} was unsuccessful!")
+                sent = await self.raw_send_message(
+                    to_addr=collection_address,
+                    amount=NFT_TRANSFER_AMOUNT,
+                    payload=body,
+                )
 
-            return None
+                if not sent:
 
-        # Ожидание появления NFT в коллекции
-        timeout_cnt = 0
+                    if self.verbose:
+                        print(f"Sending a message to mint an NFT with the address {new_nft_address}"
+                              f"to the collection {collection_address} was unsuccessful!")
 
-        if self.verbose:
-            print(f"Waiting for the end of the NFT minting with the address {new_nft_address}...")
+                    return None
 
-        while timeout_cnt <= MINT_TIMEOUT:
+                # Ожидание появления NFT в коллекции
+                if self.verbose:
+                    print(f"Waiting for the end of the NFT minting with the address {new_nft_address}...")
+
+                # При минте на кошелек пользователя NFT считается сминченным, когда он им владеет
+                if owner_address is not None:
+                    deployed = await self.watcher.wait_owner(
+                        new_nft_address,
+                        address_to_friendly(owner_address),
+                        timeout=MINT_TIMEOUT,
+                        trigger_address=collection_address,
+                    )
+
+                else:
+                    deployed = await self.watcher.wait_deployed(
+                        new_nft_address,
+                        timeout=MINT_TIMEOUT,
+                        trigger_address=collection_address,
+                    )
+
+                if not deployed:
 
-            data = await self.raw_get_account_state(new_nft_address)
+                    if self.verbose:
+                        print(f"The waiting time for NFT minting with address {new_nft_address} has been exceeded!")
 
-            if data is not None and data["code"] != "":
+                    return None
 
                 if self.verbose:
                     print(f"The NFT with the address {new_nft_address} has been successfully minted.")
 
                 return new_nft_address
 
-            await asyncio.sleep(1)
-            timeout_cnt += 1
-
-        if self.verbose:
-            print(f"The waiting time for NFT minting with address {new_nft_address} has been exceeded!")
+        except LockError:
+            print(f"Failed to lock the collection {collection_address} for minting an NFT")
+            return None
 
-        return None
+    async def deploy_batch_items(self,
+                                 collection_address: str,
+                                 nft_metas: list[str],
+                                 owner_addresses: list[str] | None = None,
+                                 batch_id: str | None = None):
+        """Минт батча NFT в существующую коллекцию одним сообщением.
 
-    async def deploy_batch_items(self, collection_address: str, nfts_num: int, nft_meta: str):
-        """Минт батча NFT в существующую коллекцию.
+        Если указан `batch_id`, индекс первого NFT батча сохраняется в Redis до отправки
+        сообщения. Повторный вызов с тем же `batch_id` не читает новый индекс из коллекции,
+        а досылает только те NFT батча, которые ещё не появились в блокчейне.
 
         :param str collection_address: Адрес коллекции в raw или user-friendly.
-        :param int nfts_num: Количество NFT, которое нужно заминтить.
-        :param str nft_meta: URL этого NFT.
-        :return: Адрес сминченных NFT в user-friendly.
+        :param list[str] nft_metas: URL метаданных для каждого NFT батча.
+        :param list[str] | None owner_addresses: Адреса владельцев для каждого NFT батча.
+            Если не указаны, NFT минтятся на кошелек приложения.
+        :param str | None batch_id: Идентификатор батча, общий для всех попыток его минта.
+        :return: Адреса сминченных NFT в user-friendly в порядке `nft_metas`.
         :rtype: List[str]
         """
+        nfts_num = len(nft_metas)
+
         if self.verbose:
-            print(f"Starting the deployment of the NFTs with metadata {nft_meta}"
+            print(f"Starting the deployment of {nfts_num} NFTs"
                   f"to the collection with the address {collection_address}...")
 
-        body = await self.batch_mint_body(
-            collection_address=collection_address,
-            nfts_num=nfts_num,
-            nft_meta=nft_meta,
-        )
-
         if self.verbose:
             print("Defining a new NFT indexes and addresses...")
 
-        last_index = await self.collection_last_index(collection_address)
-        new_nft_addresses = []
+        # Индекс читается из коллекции, поэтому минты в неё выполняются по одному
+        try:
+            async with self.mint_lock(collection_address):
+                from_index = await self.batch_from_index(batch_id)
+                resending = from_index is not None
 
-        for i in range(nfts_num):
-            new_address = await self.nft_address_by_index(collection_address, last_index + i)
-            new_nft_addresses.append(new_address)
+                # Батч уже отправлялся: досылаются только отсутствующие NFT с прежними индексами
+                if resending:
+                    positions = await self.missing_batch_items(collection_address, from_index, nfts_num)
 
-        if self.verbose:
-            print(f"The new NFTs will have indexes {last_index} and addresses {new_nft_addresses}")
+                    if self.verbose:
+                        print(f"The batch {batch_id} was already sent from the index {from_index}, "
+                              f"{len(positions)} of {nfts_num} NFTs are missing")
 
-        sent = await self.raw_send_message(to_addr=collection_address,
-                                           amount=nfts_num * FORWARD_AMOUNT + NFT_TRANSFER_AMOUNT,
-                                           payload=body)
+                else:
+                    from_index = await self.collection_last_index(collection_address)
+                    positions = list(range(nfts_num))
 
-        if not sent:
+                new_nft_addresses = nft_item_addresses(collection_address, from_index, nfts_num)
 
-            if self.verbose:
-                print(f"Sending a message to mint the NFTs with addresses {new_nft_addresses}"
-                      f"to the collection {collection_address} was unsuccessful!")
+                if self.verbose:
+                    print(f"The new NFTs will have indexes {from_index} and addresses {new_nft_addresses}")
 
-            return None
+                if positions:
+                    body = self.batch_mint_body(
+                        item_indexes=[from_index + position for position in positions],
+                        nft_metas=[nft_metas[position] for position in positions],
+                        owner_addresses=owner_addresses and [owner_addresses[position] for position in positions],
+                    )
 
-        # Ожидание появления NFT в коллекции
-        timeout_cnt = 0
+                    if batch_id is not None and not resending:
+                        await get_redis().set(batch_key(batch_id), from_index, ex=BATCH_TTL)
 
-        if self.verbose:
-            print(f"Waiting for the end of the NFTs minting with addresses {new_nft_addresses}...")
+                    sent = await self.raw_send_message(to_addr=collection_address,
+                                                       amount=len(positions) * FORWARD_AMOUNT + NFT_TRANSFER_AMOUNT,
+                                                       payload=body)
 
-        while timeout_cnt <= MINT_TIMEOUT:
+                    if not sent:
 
-            for address in new_nft_addresses:
-                data = await self.raw_get_account_state(address)
+                        if self.verbose:
+                            print(f"Sending a message to mint the NFTs with addresses {new_nft_addresses}"
+                                  f"to the collection {collection_address} was unsuccessful!")
 
-                if data is not None and data["code"] == "":
-                    await asyncio.sleep(1)
-                    timeout_cnt += 1
-                    continue
+                        # Сообщение не ушло, поэтому следующая попытка может прочитать новый индекс
+                        if batch_id is not None and not resending:
+                            await get_redis().delete(batch_key(batch_id))
+
+                        return None
+
+                # Ожидание появления NFT в коллекции
+                if self.verbose:
+                    print(f"Waiting for the end of the NFTs minting with addresses {new_nft_addresses}...")
+
+                # При минте на кошельки пользователей NFT считаются сминченными, когда они ими владеют
+                if owner_addresses is not None:
+                    owned = await asyncio.gather(*[
+                        self.watcher.wait_owner(
+                            nft_address,
+                            address_to_friendly(owner_address),
+                            timeout=MINT_TIMEOUT,
+                            trigger_address=collection_address,
+                        ) for nft_address, owner_address in zip(new_nft_addresses, owner_addresses)
+                    ])
+                    deployed = all(owned)
+
+                else:
+                    deployed = await self.watcher.wait_all_deployed(
+                        new_nft_addresses,
+                        timeout=MINT_TIMEOUT,
+                        trigger_address=collection_address,
+                    )
+
+                if not deployed:
+
+                    if self.verbose:
+                        print(f"The waiting time for the NFTs minting with addresses {new_nft_addresses} has been exceeded!")
+
+                    return None
 
                 if self.verbose:
                     print(f"The NFTs with addresses {new_nft_addresses} has been successfully minted.")
 
                 return new_nft_addresses
 
-        if self.verbose:
-            print(f"The waiting time for the NFTs minting with addresses {new_nft_addresses} has been exceeded!")
+        except LockError:
+            print(f"Failed to lock the collection {collection_address} for minting NFTs")
+            return None
+
+    async def batch_from_index(self, batch_id: str | None):
+        """Возвращает индекс первого NFT батча, если сообщение с батчем уже отправлялось.
+
+        :param str | None batch_id: Идентификатор батча.
+        :return: Индекс первого NFT батча или None, если батч ещё не отправлялся.
+        :rtype: int | None
+        """
+        if batch_id is None:
+            return None
+
+        from_index = await get_redis().get(batch_key(batch_id))
+
+        return None if from_index is None else int(from_index)
+
+    async def missing_batch_items(self, collection_address: str, from_index: int, count: int):
+        """Возвращает позиции NFT батча, которые ещё не развернуты в коллекции.
+
+        Адрес каждого NFT берётся get-методом коллекции `get_nft_address_by_index`.
+
+        :param str collection_address: Адрес коллекции в raw или user-friendly.
+        :param int from_index: Индекс первого NFT батча в коллекции.
+        :param int count: Количество NFT в батче.
+        :return: Позиции отсутствующих NFT в батче.
+        :rtype: list[int]
+        :raise Exception: Если адрес или состояние NFT получить не удалось.
+        """
+
+        async def deployed(index: int):
+            nft_address = await self.nft_address_by_index(collection_address, index)
+
+            if nft_address is None:
+                raise Exception(f"Failed to get the address of the NFT {index} in the collection {collection_address}")
+
+            state = await self.raw_get_account_state(nft_address)
+
+            if state is None:
+                raise Exception(f"Failed to get the state of the NFT {nft_address}")
+
+            return state["code"] != ""
+
+        states = await asyncio.gather(*[deployed(from_index + position) for position in range(count)])
 
-        return None
+        return [position for position, is_deployed in enumerate(states) if not is_deployed]
 
     async def transfer_nft(self, nft_address: str, new_owner_address: str):
         """Переводит NFT с кошелька приложения на адрес пользователя.
@@ -628,31 +800,61 @@ class TonClient:
 
             return False
 
-        # Ожидание перевода NFT
-        timeout_cnt = 0
-
+        # Ожидание перевода NFT. Владелец меняется транзакцией самого NFT
         if self.verbose:
             print(f"Waiting for the end of the NFT transfer with the address {nft_address}...")
 
-        while timeout_cnt <= TRANSFER_TIMEOUT:
+        transferred = await self.watcher.wait_owner(
+            nft_address,
+            new_owner_address,
+            timeout=TRANSFER_TIMEOUT,
+            trigger_address=nft_address,
+        )
 
-            nft_owner = await self.get_nft_owner(nft_address=nft_address)
+        if not transferred:
 
-            if nft_owner == new_owner_address:
+            if self.verbose:
+                print(f"The waiting time for the transfer of NFT with address {nft_address}"
+                      f"to address {new_owner_address} has been exceeded!")
 
-                if self.verbose:
-                    print(f"The NFT with address {nft_address} has been successfully sent to address {new_owner_address}!")
+            return False
 
-                return True
+        if self.verbose:
+            print(f"The NFT with address {nft_address} has been successfully sent to address {new_owner_address}!")
 
-            await asyncio.sleep(1)
-            timeout_cnt += 1
+        return True
 
-        if self.verbose:
-            print(f"The waiting time for the transfer of NFT with address {nft_address}"
-                  f"to address {new_owner_address} has been exceeded!")
+    @asynccontextmanager
+    async def mint_lock(self, collection_address: str):
+        """Удерживает блокировку Redis для минта NFT в коллекцию.
 
-        return False
+        Блокировка удерживается от чтения индекса последнего элемента коллекции до
+        подтверждения минта, иначе параллельные минты получат одинаковые индексы и
+        сминтится только первый из них. Если блокировка истекла раньше подтверждения,
+        ошибка освобождения только логируется: сообщение уже отправлено, и результат
+        минта не должен теряться, иначе повтор сминтит те же NFT второй раз.
+
+        :param str collection_address: Адрес коллекции в raw или user-friendly.
+        :raise LockError: Если блокировку не удалось получить.
+        """
+        timeout = MINT_TIMEOUT + WALLET_CONFIRM_TIMEOUT * 3
+
+        lock = get_redis().lock(f"lidum:collection:{address_to_friendly(collection_address)}:mint",
+                                timeout=timeout,
+                                blocking_timeout=timeout)
+
+        if not await lock.acquire():
+            raise LockError(f"Unable to lock the collection {collection_address} for minting")
+
+        try:
+            yield
+
+        finally:
+            try:
+                await lock.release()
+
+            except LockError:
+                print(f"The mint lock of the collection {collection_address} expired before the mint was finished")
 
     def collection_mint_body(self, collection_content_uri: str, nft_item_content_base_uri: str):
         """Возвращает инициализированную ячейку с данными о коллекции.
@@ -676,42 +878,63 @@ class TonClient:
 
         return collection
 
-    async def nft_mint_body(self, collection_address: str, nft_meta: str):
+    def nft_mint_body(self, item_index: int, nft_meta: str, owner_address: str | None = None):
         """Возвращает инициализированную ячейку с данными о NFT.
 
-        :param str collection_address: Адрес коллекции в raw или user-friendly.
+        :param int item_index: Индекс нового NFT в коллекции.
         :param str nft_meta: URL метаданных этого NFT в формате JSON.
+        :param str | None owner_address: Адрес владельца NFT. По умолчанию, кошелек приложения.
         :return: Инициализированная ячейка с данными NFT.
         :rtype: Cell
         """
 
         body = NFTCollection().create_mint_body(
-            item_index=await self.collection_last_index(collection_address),
-            new_owner_address=Address(LIDUM_WALLET_ADDRESS),
+            item_index=item_index,
+            new_owner_address=Address(owner_address or LIDUM_WALLET_ADDRESS),
             item_content_uri=nft_meta,
             amount=FORWARD_AMOUNT,
         )
 
         return body
 
-    async def batch_mint_body(self, collection_address: str, nfts_num: int, nft_meta: str):
+    def batch_mint_body(self, item_indexes: list[int], nft_metas: list[str], owner_addresses: list[str] | None = None):
         """Возвращает инициализированную ячейку с данными о нескольких NFT.
 
-        :param str collection_address: Адрес коллекции в raw или user-friendly.
-        :param int nfts_num: Количество NFT, которое нужно сминтить.
-        :param str nft_meta: URL метаданных этих NFT в формате JSON. Для всех NFT
-            используется один файл метаданных.
+        В отличие от `NFTCollection.create_batch_mint_body`, индексы NFT не обязаны идти
+        подряд, что нужно для досылки отсутствующих NFT батча.
+
+        :param list[int] item_indexes: Индексы NFT в коллекции.
+        :param list[str] nft_metas: URL метаданных в формате JSON для каждого NFT.
+        :param list[str] | None owner_addresses: Адреса владельцев для каждого NFT. По
+            умолчанию, кошелек приложения.
         :return: Инициализированная ячейка с данными NFT.
         :rtype: Cell
         """
 
-        contents_and_owners = [(nft_meta, Address(LIDUM_WALLET_ADDRESS)) for _ in range(nfts_num)]
+        if owner_addresses is None:
+            owner_addresses = [LIDUM_WALLET_ADDRESS] * len(nft_metas)
 
-        body = NFTCollection().create_batch_mint_body(
-            from_item_index=await self.collection_last_index(collection_address),
-            contents_and_owners=contents_and_owners,
-            amount_per_one=FORWARD_AMOUNT,
-        )
+        deploy_list = DictBuilder(64)
+
+        for item_index, nft_meta, owner_address in zip(item_indexes, nft_metas, owner_addresses):
+            uri_content = Cell()
+            uri_content.bits.write_bytes(serialize_uri(nft_meta))
+
+            content = Cell()
+            content.bits.write_address(Address(owner_address))
+            content.refs.append(uri_content)
+
+            item = Cell()
+            item.bits.write_grams(FORWARD_AMOUNT)
+            item.refs.append(content)
+
+            deploy_list.store_cell(item_index, item)
+
+        # op::batch_deploy_nft_item
+        body = Cell()
+        body.bits.write_uint(2, 32)
+        body.bits.write_uint(0, 64)
+        body.refs.append(deploy_list.end_dict())
 
         return body
 
@@ -724,21 +947,47 @@ class TonClient:
         """
 
         try:
-            await self.client.init()
-
-            data = await self.client.raw_run_method(method="seqno", stack_data=[], address=LIDUM_WALLET_ADDRESS)
+            data = await self.request("raw_run_method", method="seqno", stack_data=[], address=LIDUM_WALLET_ADDRESS)
 
-            await self.client.close()
             return int(data["stack"][0][1], 16)
 
         except Exception as e:
             print(f"Error when getting seqno: {e}")
 
-        finally:
-            await self.client.close()
 
+@lru_cache(maxsize=2)
+def get_tonapi(is_testnet: bool):
+    """Возвращает общий клиент Tonapi для указанной сети."""
+
+    return Tonapi(api_key=TONAPI_KEY, is_testnet=is_testnet)
+
+
+def account_transactions(account: str, is_testnet: bool, since_utime: int, page_size: int = 100, max_pages: int = 10):
+    """Возвращает транзакции аккаунта от последней до первой, совершенной не раньше
+    `since_utime`. Транзакции запрашиваются страницами по `page_size` штук.
+
+    :param str account: Адрес аккаунта в raw или user-friendly.
+    :param bool is_testnet: Принадлежит ли аккаунт сети TestNet.
+    :param int since_utime: Время в формате unix, до которого требуются транзакции.
+    :param int page_size: Количество транзакций на странице.
+    :param int max_pages: Максимальное количество запрашиваемых страниц.
+    :return: Транзакции Tonapi.
+    :rtype: list[Transaction]
+    """
+    tonapi = get_tonapi(is_testnet)
+
+    transactions = []
+    before_lt = None
+
+    for _ in range(max_pages):
+        page = tonapi.blockchain.get_account_transactions(account_id=account, before_lt=before_lt, limit=page_size)
+        page = page.transactions
+
+        transactions.extend(transaction for transaction in page if transaction.utime >= since_utime)
+
+        if len(page) < page_size or page[-1].utime < since_utime:
+            break
 
-def get_transaction_data(hash: str, is_testnet: bool):
+        before_lt = page[-1].lt
 
-    tonapi = Tonapi(api_key=TONAPI_KEY, is_testnet=is_testnet)
-    return tonapi.blockchain.get_transaction_data(hash)
+    return transactions
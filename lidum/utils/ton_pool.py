@@ -0,0 +1,237 @@
+import time
+import asyncio
+from os import makedirs
+from os.path import join
+from contextlib import asynccontextmanager
+
+from pytonlib import TonlibClient, TonlibNoResponse
+from pytonlib import LiteServerTimeout
+
+# Ошибки соединения с лайт-сервером, после которых клиент закрывается. Ответ лайт-сервера
+# с ошибкой (TonlibError), например неудачное выполнение get-метода, к ним не относится
+CONNECTION_ERRORS = (TonlibNoResponse, LiteServerTimeout, asyncio.TimeoutError, TimeoutError, ConnectionError, RuntimeError)
+
+
+class _PooledClient:
+    """Инициализированный клиент TonlibClient вместе со служебными данными пула."""
+
+    def __init__(self, client: TonlibClient, slot: int, generation: int):
+        self.client = client
+        self.slot = slot
+        self.generation = generation
+        self.last_used = time.monotonic()
+        self.last_checked = time.monotonic()
+        self.broken = False
+
+
+class TonlibPool:
+    """Пул долгоживущих инициализированных клиентов TonlibClient.
+
+    Для каждого лайт-сервера хранится до `size` клиентов. Клиент инициализируется один раз
+    и переиспользуется между вызовами. Перед выдачей давно не проверявшийся клиент
+    проходит проверку запросом `get_masterchain_info`, а клиенты, простаивающие дольше
+    `idle_timeout`, закрываются фоновой задачей. Клиент, при работе с которым возникла
+    ошибка соединения, закрывается и при следующем обращении инициализируется заново.
+
+    Клиенты tonlib привязаны к циклу событий, в котором были инициализированы. Если пул
+    используется из нового цикла событий, клиенты предыдущего цикла отбрасываются.
+
+    :param dict config: Конфигурация лайт-серверов.
+    :param str keystore: Директория для хранилищ ключей клиентов.
+    :param int tonlib_timeout: Таймаут выполнения запросов tonlib в секундах.
+    :param int size: Максимальное количество клиентов на один лайт-сервер.
+    :param int idle_timeout: Время простоя в секундах, после которого клиент закрывается.
+    :param int health_check_interval: Интервал в секундах между проверками клиента.
+    :param bool verbose: Выводить ли информацию о работе пула.
+
+    Examples:
+    ```python
+    pool = TonlibPool(config=config, keystore="/path/to/keystore", tonlib_timeout=10)
+
+    async with pool.acquire(ls_index=0) as client:
+        state = await client.raw_get_account_state(address)
+    ```
+    """
+
+    def __init__(self,
+                 config: dict,
+                 keystore: str,
+                 tonlib_timeout: int,
+                 size: int = 1,
+                 idle_timeout: int = 300,
+                 health_check_interval: int = 30,
+                 verbose: bool = False):
+
+        self.config = config
+        self.keystore = keystore
+        self.tonlib_timeout = tonlib_timeout
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.verbose = verbose
+
+        self.ls_cnt = len(config["liteservers"])
+
+        self._loop = None
+        self._idle = {}
+        self._semaphores = {}
+        self._free_slots = {}
+        self._generation = 0
+        self._reaper = None
+
+    @asynccontextmanager
+    async def acquire(self, ls_index: int):
+        """Выдает инициализированный клиент для указанного лайт-сервера.
+
+        :param int ls_index: Индекс лайт-сервера в конфигурации.
+        :return: Инициализированный клиент TonlibClient.
+        :rtype: TonlibClient
+        """
+        self._bind_loop()
+
+        async with self._semaphores[ls_index]:
+            entry = await self._checkout(ls_index)
+
+            try:
+                yield entry.client
+
+            except CONNECTION_ERRORS:
+                entry.broken = True
+                raise
+
+            finally:
+                await self._checkin(ls_index, entry)
+
+    async def close(self):
+        """Закрывает все простаивающие клиенты пула и останавливает фоновую задачу."""
+
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+
+        idle, self._idle, self._loop = self._idle, {}, None
+
+        for ls_index, entries in idle.items():
+
+            while entries:
+                await self._close_entry(ls_index, entries.pop())
+
+    def _bind_loop(self):
+        """Привязывает пул к текущему циклу событий."""
+
+        loop = asyncio.get_running_loop()
+
+        if self._loop is loop:
+            return
+
+        if self._loop is not None and self.verbose:
+            print("The event loop has changed, tonlib clients of the previous loop are dropped")
+
+        self._loop = loop
+        self._generation += 1
+        self._idle = {ls_index: [] for ls_index in range(self.ls_cnt)}
+        self._semaphores = {ls_index: asyncio.Semaphore(self.size) for ls_index in range(self.ls_cnt)}
+        self._free_slots = {ls_index: list(range(self.size)) for ls_index in range(self.ls_cnt)}
+        self._reaper = loop.create_task(self._reap_idle())
+
+    async def _checkout(self, ls_index: int):
+        """Возвращает исправный клиент из пула или инициализирует новый."""
+
+        entries = self._idle[ls_index]
+
+        while entries:
+            entry = entries.pop()
+
+            if time.monotonic() - entry.last_checked < self.health_check_interval:
+                return entry
+
+            if await self._is_healthy(ls_index, entry):
+                return entry
+
+            await self._close_entry(ls_index, entry)
+
+        return await self._create_entry(ls_index)
+
+    async def _checkin(self, ls_index: int, entry: _PooledClient):
+        """Возвращает клиент в пул, либо закрывает его при ошибке."""
+
+        # Пул мог быть закрыт, пока клиент был занят
+        if entry.broken or self._loop is None:
+            await self._close_entry(ls_index, entry)
+            return
+
+        entry.last_used = time.monotonic()
+        self._idle[ls_index].append(entry)
+
+    async def _create_entry(self, ls_index: int):
+        """Инициализирует новый клиент для указанного лайт-сервера."""
+
+        # У каждого живого клиента tonlib должно быть собственное хранилище ключей. Клиентов
+        # лайт-сервера не больше `size`, поэтому хранилища переиспользуются по номеру слота
+        slot = self._free_slots[ls_index].pop()
+        keystore = join(self.keystore, f"ls_{ls_index}_{slot}")
+        makedirs(keystore, exist_ok=True)
+
+        if self.verbose:
+            print(f"Initializing a new tonlib client for the ls with the index {ls_index}...")
+
+        client = TonlibClient(
+            ls_index=ls_index,
+            config=self.config,
+            keystore=keystore,
+            tonlib_timeout=self.tonlib_timeout,
+        )
+
+        try:
+            await client.init()
+
+        except BaseException:
+            self._free_slots[ls_index].append(slot)
+            raise
+
+        return _PooledClient(client, slot, self._generation)
+
+    async def _close_entry(self, ls_index: int, entry: _PooledClient):
+
+        if self.verbose:
+            print(f"Closing the tonlib client for the ls with the index {ls_index}...")
+
+        try:
+            await entry.client.close()
+
+        except Exception as e:
+            print(f"Error when closing the tonlib client for the ls with the index {ls_index}: {e}")
+
+        # Слоты клиентов предыдущего цикла событий освобождаются при смене цикла
+        if entry.generation == self._generation and self._loop is not None:
+            self._free_slots[ls_index].append(entry.slot)
+
+    async def _is_healthy(self, ls_index: int, entry: _PooledClient):
+        """Проверяет, что клиент отвечает на запросы лайт-сервера."""
+
+        try:
+            await asyncio.wait_for(entry.client.get_masterchain_info(), timeout=self.tonlib_timeout)
+            entry.last_checked = time.monotonic()
+            return True
+
+        except Exception as e:
+
+            if self.verbose:
+                print(f"The tonlib client for the ls with the index {ls_index} failed the health check: {e}")
+
+            return False
+
+    async def _reap_idle(self):
+        """Периодически закрывает клиенты, простаивающие дольше `idle_timeout`."""
+
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+
+            now = time.monotonic()
+
+            for ls_index, entries in self._idle.items():
+                expired = [entry for entry in entries if now - entry.last_used > self.idle_timeout]
+                entries[:] = [entry for entry in entries if entry not in expired]
+
+                for entry in expired:
+                    await self._close_entry(ls_index, entry)
@@ -0,0 +1,90 @@
+import json
+from datetime import datetime
+
+from redis import Redis
+
+from .async_db import upsert_tg_user
+from .redis_client import get_redis
+from .db import utc_now
+from ..config import REDIS_ADDRESS, USER_TOUCH_WRITE_BEHIND
+
+# Накопленные входы пользователей: id пользователя -> username и время входа
+TOUCHES_KEY = "lidum:tg_users:touches"
+
+# Пользователи, которые уже были записаны в базу данных
+KNOWN_USERS_KEY = "lidum:tg_users:known"
+
+# KEYS: накопленные входы пользователей
+_POP_SCRIPT = """
+local touches = redis.call("HGETALL", KEYS[1])
+redis.call("DEL", KEYS[1])
+
+return touches
+"""
+
+redis = Redis.from_url(REDIS_ADDRESS)
+
+
+async def touch_tg_user(telegram_id: str | int, username: str, session):
+    """Записывает вход телеграм-пользователя.
+
+    По умолчанию пользователь добавляется или обновляется одним запросом к базе данных.
+    Если включен `USER_TOUCH_WRITE_BEHIND`, вход уже известного пользователя только
+    сохраняется в Redis и записывается в базу данных задачей `flush_user_touches` вместе
+    с остальными. Новый пользователь записывается в базу данных сразу, чтобы на него
+    можно было ссылаться из других таблиц.
+    """
+    if not USER_TOUCH_WRITE_BEHIND:
+        await upsert_tg_user(telegram_id=telegram_id, username=username, session=session)
+        return
+
+    telegram_id = int(telegram_id)
+    touch = json.dumps({"username": username, "last_enter": utc_now().isoformat()})
+
+    async with get_redis().pipeline(transaction=True) as pipe:
+        pipe.sadd(KNOWN_USERS_KEY, telegram_id)
+        pipe.hset(TOUCHES_KEY, telegram_id, touch)
+        is_new, _ = await pipe.execute()
+
+    if is_new:
+
+        try:
+            await upsert_tg_user(telegram_id=telegram_id, username=username, session=session)
+
+        except Exception:
+            await get_redis().srem(KNOWN_USERS_KEY, telegram_id)
+            raise
+
+
+def pop_touches():
+    """Атомарно извлекает накопленные входы пользователей.
+
+    :return: Пользователи вида `{"id": ..., "username": ..., "last_enter": ...}`.
+    :rtype: list[dict]
+    """
+    touches = redis.eval(_POP_SCRIPT, 1, TOUCHES_KEY)
+    users = []
+
+    for telegram_id, touch in zip(touches[::2], touches[1::2]):
+        touch = json.loads(touch)
+
+        users.append({
+            "id": int(telegram_id),
+            "username": touch["username"],
+            "last_enter": datetime.fromisoformat(touch["last_enter"]),
+        })
+
+    return users
+
+
+def restore_touches(users: list[dict]):
+    """Возвращает незаписанные входы пользователей в Redis, не перезаписывая более
+    новые."""
+
+    with redis.pipeline(transaction=False) as pipe:
+
+        for user in users:
+            touch = {"username": user["username"], "last_enter": user["last_enter"].isoformat()}
+            pipe.hsetnx(TOUCHES_KEY, user["id"], json.dumps(touch))
+
+        pipe.execute()
@@ -0,0 +1,174 @@
+import time
+import asyncio
+
+from tonsdk.boc import Cell
+
+from .redis_client import get_redis
+
+
+class WalletSequencer:
+    """Единственный отправитель внешних сообщений кошелька приложения.
+
+    Все сообщения кошелька ставятся в одну очередь и отправляются строго по одному: сообщение
+    подписывается текущим seqno, отправляется в блокчейн, после чего отправитель дожидается
+    увеличения seqno кошелька в блокчейне и только затем берет следующее сообщение. Между
+    процессами отправка сериализуется блокировкой в Redis, в котором также хранится последний
+    подтвержденный seqno, поэтому воркеры не отправляют сообщения с одинаковым seqno.
+
+    Внешнее сообщение кошелька действительно 60 секунд, поэтому `confirm_timeout` должен быть
+    больше этого времени: иначе неподтвержденное сообщение может примениться уже после того,
+    как его seqno будет занят следующим сообщением.
+
+    :param wallet: Кошелек tonsdk, которым подписываются сообщения.
+    :param str wallet_address: Адрес кошелька в user-friendly.
+    :param TonClient client: Клиент для отправки сообщений и получения seqno.
+    :param int confirm_timeout: Время ожидания подтверждения seqno в секундах.
+    :param float poll_interval: Интервал между проверками seqno в секундах.
+    :param int seqno_ttl: Время в секундах, в течение которого сохраненный seqno считается
+        актуальным без запроса в блокчейн.
+    :param bool verbose: Выводить ли информацию о работе отправителя.
+
+    Examples:
+    ```python
+    sequencer = WalletSequencer(wallet=LIDUM_WALLET, wallet_address=LIDUM_WALLET_ADDRESS, client=client)
+
+    sent = await sequencer.submit(to_addr=nft_address, amount=NFT_TRANSFER_AMOUNT, payload=body)
+    ```
+    """
+
+    def __init__(self,
+                 wallet,
+                 wallet_address: str,
+                 client,
+                 confirm_timeout: int = 90,
+                 poll_interval: float = 1,
+                 seqno_ttl: int = 60,
+                 verbose: bool = False):
+
+        self.wallet = wallet
+        self.wallet_address = wallet_address
+        self.client = client
+        self.confirm_timeout = confirm_timeout
+        self.poll_interval = poll_interval
+        self.seqno_ttl = seqno_ttl
+        self.verbose = verbose
+
+        self._lock_key = f"lidum:wallet:{wallet_address}:lock"
+        self._seqno_key = f"lidum:wallet:{wallet_address}:seqno"
+
+        self._loop = None
+        self._queue = None
+        self._worker = None
+
+    async def submit(self,
+                     to_addr: str,
+                     amount: int,
+                     payload: Cell | str | bytes | None = None,
+                     state_init: Cell | None = None):
+        """Ставит сообщение в очередь и ожидает его подтверждения в блокчейне.
+
+        :param str to_addr: Адрес получателя в raw или user-friendly.
+        :param int amount: Количество нанотон для отправки.
+        :param Cell | str | bytes | None payload: Полезная нагрузка сообщения.
+        :param Cell | None state_init: Ячейка с инициализирующим сообщением.
+        :return: Подтвержден ли seqno отправленного сообщения.
+        :rtype: bool
+        """
+        self._bind_loop()
+
+        future = self._loop.create_future()
+        await self._queue.put(((to_addr, amount, payload, state_init), future))
+
+        return await future
+
+    def _bind_loop(self):
+        """Запускает очередь и обработчик сообщений в текущем цикле событий."""
+
+        loop = asyncio.get_running_loop()
+
+        if self._loop is loop:
+            return
+
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._worker = loop.create_task(self._process_queue())
+
+    async def _process_queue(self):
+
+        while True:
+            message, future = await self._queue.get()
+
+            try:
+                result = await self._send(*message)
+
+            except Exception as e:
+                print(f"Error when sending a message from the wallet {self.wallet_address}: {e}")
+                result = False
+
+            if not future.done():
+                future.set_result(result)
+
+            self._queue.task_done()
+
+    async def _send(self, to_addr: str, amount: int, payload, state_init):
+        """Отправляет одно сообщение и дожидается увеличения seqno в блокчейне."""
+
+        redis = get_redis()
+
+        async with redis.lock(self._lock_key, timeout=self.confirm_timeout * 3):
+            seqno = await self._current_seqno()
+
+            if seqno is None:
+                return False
+
+            if self.verbose:
+                print(f"Sending a message to {to_addr} with the seqno {seqno}...")
+
+            query = self.wallet.create_transfer_message(to_addr=to_addr,
+                                                        amount=amount,
+                                                        seqno=seqno,
+                                                        payload=payload,
+                                                        state_init=state_init)
+
+            sent = await self.client.send_boc(query["message"].to_boc(False))
+
+            if sent and await self._wait_seqno(seqno + 1):
+                await redis.set(self._seqno_key, seqno + 1, ex=self.seqno_ttl)
+
+                if self.verbose:
+                    print(f"The seqno {seqno} of the wallet {self.wallet_address} has been confirmed")
+
+                return True
+
+            # Сохраненный seqno мог устареть, следующее сообщение получит его из блокчейна
+            await redis.delete(self._seqno_key)
+
+            if self.verbose:
+                print(f"The message with the seqno {seqno} has not been confirmed")
+
+            return False
+
+    async def _current_seqno(self):
+        """Возвращает seqno для следующего сообщения."""
+
+        seqno = await get_redis().get(self._seqno_key)
+
+        if seqno is not None:
+            return int(seqno)
+
+        return await self.client.seqno
+
+    async def _wait_seqno(self, target: int):
+        """Ожидает, пока seqno кошелька в блокчейне не достигнет `target`."""
+
+        deadline = time.monotonic() + self.confirm_timeout
+
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.poll_interval)
+
+            seqno = await self.client.seqno
+
+            if seqno is not None and seqno >= target:
+                return True
+
+        return False
@@ -1,37 +1,51 @@
 import os
 import json
+import asyncio
 from io import BytesIO
 from os.path import join
-from datetime import datetime, timezone
+from functools import wraps
 
-import requests
 from flask import jsonify, request, send_file
 from pydantic import ValidationError
 
-from . import client, get_app, get_loggers, get_session
-from .tasks import nft_mint, collection_mint
-from .tasks import process_transaction
-from .utils import return_codes
-from .config import BOT_TOKEN
+from . import client, get_app, get_loggers, get_async_session
+from .tasks import enqueue_claim, collection_mint
+from .tasks import process_event_image, collection_mint_failed
+from .utils import reservations, return_codes, tasks_statuses
+from .config import BOT_TOKEN, MAX_IMAGE_SIZE, TELEGRAM_API_URL
 from .utils.db import Drop, Event, Author, Transaction
-from .utils.db import Telegram_User, Subscriber_Event
-from .utils.db import Subscriber_Channel, event_by_id
-from .utils.db import tg_user_by_id, author_by_tg_id
-from .utils.db import transaction_by_id, add_database_entries
-from .utils.db import subscriber_visited_channels
-from .utils.db import subscriber_participated_events
 from .utils.hash import sha256_hash
 from .utils.path import get_nft_image_path
 from .utils.path import get_collection_metadata_path
-from .utils.image import save_base64_image, decode_base64_image
+from .utils.image import InvalidImageError, UploadTooLargeError
+from .utils.image import is_uploaded, save_upload
+from .utils.image import save_base64_upload
+from .utils.image import decode_base64_image
+from .utils.media import image_derivatives
 from .utils.price import get_drop_price, get_event_price
 from .utils.crypto import decrypt, encrypt
 from .utils.wallet import LIDUM_WALLET_ADDRESS
 from .utils.channel import get_channel_avatar
 from .utils.convert import to_json_ext, link_to_username
-from .utils.metadata import create_metadata
+from .utils.async_db import event_by_id, record_claim
+from .utils.async_db import remove_claim, author_by_tg_id
+from .utils.async_db import event_claimants, transaction_by_id
+from .utils.async_db import add_visited_channel
+from .utils.async_db import add_database_entries
+from .utils.async_db import stage_database_entries
+from .utils.async_db import subscriber_visited_channels
+from .utils.async_db import subscriber_participated_events
 from .utils.password import compare_passwords
-from .utils.nft_generation import get_random_nft
+from .utils.event_cache import cache_event_info
+from .utils.event_cache import cached_event_info
+from .utils.event_cache import invalidate_event_info
+from .utils.render_cache import get_render_cache
+from .utils.reservations import nfts_left, release_nft
+from .utils.reservations import reserve_nft, load_reservations
+from .utils.telegram_api import TelegramAPI, TelegramAPIError
+from .utils.user_touches import touch_tg_user
+from .utils.subscriptions import check_subscriptions
+from .utils.nft_generation import load_layer_bank
 from .utils.request_bodies import SendNFTParams, GetPriceParams
 from .utils.request_bodies import MakePostParams
 from .utils.request_bodies import UserInfoParams
@@ -46,14 +60,93 @@ from .utils.request_bodies import AddTransactionParams
 from .utils.request_bodies import IsUserSubscribedParams
 from .utils.request_bodies import AddVisitedChannelParams
 from .utils.request_bodies import TransactionStatusParams
+from .utils.request_bodies import EventSubscriptionsParams
 
 app = get_app()
-Session = get_session(app)[1]
 logger = get_loggers()[0]
+telegram_api = TelegramAPI(token=BOT_TOKEN, base_url=TELEGRAM_API_URL)
+
+# Слои NFT загружаются в память при запуске, а не при первом запросе
+load_layer_bank()
+
+
+def with_db_session(view):
+    """Передает обработчику асинхронную сессию базы данных в аргументе `session` и
+    закрывает её после формирования ответа."""
+
+    @wraps(view)
+    async def wrapper(*args, **kwargs):
+        async with get_async_session() as session:
+            return await view(*args, session=session, **kwargs)
+
+    return wrapper
+
+
+async def load_event_info(event_id: int, session):
+    """Возвращает данные события из кэша, либо из базы данных с сохранением в кэш.
+
+    Количество полученных NFT меняется с каждой заявкой, поэтому в кэш не попадает и
+    берётся из счетчика резервирований функцией `minted_nfts`.
+
+    :return: Данные события, либо None, если событие не найдено.
+    :rtype: dict | None
+    """
+    event_info = await cached_event_info(event_id)
+
+    if event_info is not None:
+        return event_info
+
+    event = await event_by_id(event_id=event_id, session=session)
+
+    if event is None:
+        return None
+
+    telegram_id = event.telegram_id
+    author = await author_by_tg_id(telegram_id=telegram_id, session=session)
+    collection_name = author.collection_name
+
+    event_info = {
+        "telegram_id": telegram_id,
+        "start_date": event.start_date,
+        "end_date": event.end_date,
+        "invites": event.invites,
+        "subscriptions": event.subscriptions,
+        "nfts_cnt": event.nfts_cnt,
+        "image_name": event.image_name,
+        "logo_url": get_nft_image_path(collection_name, telegram_id, event.image_name, True),
+        "logo_derivatives": image_derivatives(event.image_hash) if event.image_hash else {},
+        "collection_name": collection_name,
+        "collection_address": author.collection_address,
+        "event_name": event.event_name,
+        "description": event.event_description,
+        "transaction_id": event.transaction_id,
+        "empty_password": event.password == sha256_hash(""),
+        "user_timezone": event.user_timezone,
+    }
+
+    await cache_event_info(event_id, event_info)
+
+    return event_info
+
+
+async def minted_nfts(event_id: int, nfts_cnt: int, session):
+    """Возвращает количество полученных NFT события по счетчику резервирований в Redis.
+
+    Если счетчики события еще не загружены, они загружаются по участникам из БД.
+    """
+    left = await nfts_left(event_id)
+
+    if left is None:
+        claimants = await event_claimants(event_id=event_id, session=session)
+        await load_reservations(event_id, nfts_cnt - len(claimants), claimants)
+
+        return len(claimants)
+
+    return nfts_cnt - left
 
 
 @app.route("/api/dropper_price/", methods=["POST"])
-async def dropper_price():
+def dropper_price():
     """Возвращает цену за перевод указанного количества NFT на нулевой адрес."""
 
     params = DropperPriceParams(**request.get_json())
@@ -73,7 +166,8 @@ async def dropper_price():
 
 
 @app.route("/api/create_drop/", methods=["POST"])
-async def create_drop():
+@with_db_session
+async def create_drop(session):
     """Создание нового события на сжигание NFT."""
 
     params = CreateDropParams(**request.get_json())
@@ -84,8 +178,6 @@ async def create_drop():
     prizes = params.prizes
     price = params.price
 
-    session = Session()
-
     # Подготовка записи о новом дропе
     try:
         new_drop = Drop(
@@ -96,7 +188,7 @@ async def create_drop():
             price=price,
         )
 
-        add_database_entries(entries=new_drop, session=session)
+        await add_database_entries(entries=new_drop, session=session)
 
     except Exception as e:
         description = f"Error when trying to prepare an entry about a new drop: {e}"
@@ -107,7 +199,7 @@ async def create_drop():
 
 
 @app.route("/api/channel_avatar/", methods=["POST"])
-async def channel_avatar():
+def channel_avatar():
     """Обработчик запроса на получение аватара телеграм-канала."""
 
     params = ChannelAvatarParams(**request.get_json())
@@ -131,7 +223,8 @@ async def channel_avatar():
 
 
 @app.route("/api/check_password/", methods=["POST"])
-async def check_password():
+@with_db_session
+async def check_password(session):
     """Проверка введенного пользователем пароля."""
 
     params = CheckPasswordParams(**request.get_json())
@@ -139,12 +232,10 @@ async def check_password():
     event_id = params.event_id
     password = params.password
 
-    session = Session()
-
     # Поиск события в базе данных
     try:
         event_id = int(decrypt(event_id))
-        event = event_by_id(event_id=event_id, session=session)
+        event = await event_by_id(event_id=event_id, session=session)
 
         if event is None:
             description = f"Event with id = {event_id} was not found"
@@ -169,44 +260,25 @@ async def check_password():
 
 
 @app.route("/api/event_info/", methods=["POST"])
-async def event_info():
+@with_db_session
+async def event_info(session):
     """Возвращает данные о событии с указанным id."""
 
     params = EventInfoParams(**request.get_json())
 
     event_id = params.event_id
 
-    session = Session()
-
-    # Попытка получить данные события из БД
+    # Попытка получить данные события из кэша, либо из БД
     try:
         event_id = int(decrypt(event_id))
-        event = event_by_id(event_id=event_id, session=session)
+        event_info = await load_event_info(event_id, session)
 
-        if event is None:
+        if event_info is None:
             description = f"Event with id = {event_id} was not found"
             logger.error(description)
             return jsonify({"status": return_codes.NOT_FOUND, "description": description}), 404
 
-        telegram_id = event.telegram_id
-        collection_name = author_by_tg_id(telegram_id=telegram_id, session=session).collection_name
-
-        event_info = {
-            "start_date": event.start_date,
-            "end_date": event.end_date,
-            "invites": event.invites,
-            "subscriptions": event.subscriptions,
-            "minted_nfts": event.minted_nfts,
-            "nfts_cnt": event.nfts_cnt,
-            "image_name": event.image_name,
-            "logo_url": get_nft_image_path(collection_name, telegram_id, event.image_name, True),
-            "collection_name": collection_name,
-            "event_name": event.event_name,
-            "description": event.event_description,
-            "transaction_id": event.transaction_id,
-            "empty_password": event.password == sha256_hash(""),
-            "user_timezone": event.user_timezone,
-        }
+        event_info = {**event_info, "minted_nfts": await minted_nfts(event_id, event_info["nfts_cnt"], session)}
 
     except Exception as e:
         description = f"An error occurred while getting information about the event: {e}"
@@ -217,7 +289,8 @@ async def event_info():
 
 
 @app.route("/api/add_visited_channel/", methods=["POST"])
-async def add_visited_channel():
+@with_db_session
+async def add_visited_channel(session):
     """Добавляет в список посещенных каналов пользователя указанный канал."""
 
     params = AddVisitedChannelParams(**request.get_json())
@@ -225,22 +298,11 @@ async def add_visited_channel():
     telegram_id = params.telegram_id
     channel = params.channel
 
-    session = Session()
-
     # Запись посещенного канала в базу данных
     try:
-        visited_channels = subscriber_visited_channels(telegram_id=telegram_id, session=session)
-
         channel = link_to_username(channel)
 
-        if channel not in visited_channels:
-
-            new_channel = Subscriber_Channel(
-                telegram_id=telegram_id,
-                visited_channel=channel,
-            )
-
-            add_database_entries(entries=new_channel, session=session)
+        await add_visited_channel(telegram_id=telegram_id, channel=channel, session=session)
 
     except Exception as e:
         description = f"Error when trying to record a visited channel to a user with id {telegram_id}"
@@ -260,25 +322,8 @@ async def is_user_subscribed():
     channel = link_to_username(channel)
 
     try:
-        response = requests.post(
-            url=f"https://api.telegram.org/bot{BOT_TOKEN}/getChatMember",
-            params={
-                "chat_id": channel,
-                "user_id": telegram_id
-            },
-        )
-        if response.status_code != 200:
-            #Если бот не является админом канала, то в response.description должно быть "Bad Request: member list is inaccessible"
-            description = f"Error at requesting Telegram API: {response.json()['description']}"
-            return jsonify({"status": return_codes.BOT_ERROR, "description": description}), response.status_code
-
-        data = response.json()
-
-        if not data.get("ok"):
-            description = "Unknown error"
-            return jsonify({"status": return_codes.BOT_ERROR, "description": data.get("description", description)}), 400
-
-        member_status = data["result"]["status"]
+        member = await telegram_api.call("getChatMember", chat_id=channel, user_id=telegram_id)
+        member_status = member["status"]
 
         # Проверяем, является ли пользователь участником канала
         if member_status in ["member", "administrator", "creator"]:
@@ -286,41 +331,80 @@ async def is_user_subscribed():
         else:
             return jsonify({"status": return_codes.SUCCESS, "subscribed": False}), 200
 
+    except TelegramAPIError as e:
+        #Если бот не является админом канала, то в description должно быть "Bad Request: member list is inaccessible"
+        description = f"Error at requesting Telegram API: {e.description}"
+        return jsonify({"status": return_codes.BOT_ERROR, "description": description}), e.error_code
+
     except Exception as e:
         description = "An error occurred when getting chat member via bot"
         app.logger.error(f"{description}: {e}")
         return jsonify({"status": return_codes.VALIDATE_ERROR, "description": description}), 500
 
 
-@app.route("/api/user_info/", methods=["POST"])
-async def user_info():
-    """Возвращает данные из базы данных о пользователе."""
+@app.route("/api/event_subscriptions/", methods=["POST"])
+@with_db_session
+async def event_subscriptions(session):
+    """Проверяет подписку пользователя на все каналы из условий события."""
 
-    params = UserInfoParams(**request.get_json())
+    params = EventSubscriptionsParams(**request.get_json())
 
     telegram_id = params.telegram_id
-    username = params.username
     event_id = params.event_id
 
-    session = Session()
+    # Поиск условий события в кэше, либо в базе данных
+    try:
+        event_id = int(decrypt(event_id))
+        event_info = await cached_event_info(event_id)
+
+        if event_info is not None:
+            subscriptions = event_info["subscriptions"]
+
+        else:
+            event = await event_by_id(event_id=event_id, session=session)
+
+            if event is None:
+                description = f"Event with id = {event_id} was not found"
+                logger.error(description)
+                return jsonify({"status": return_codes.NOT_FOUND, "description": description}), 404
+
+            subscriptions = event.subscriptions
+
+    except Exception as e:
+        description = f"Error when trying to get data from the database: {e}"
+        logger.error(description)
+        return jsonify({"status": return_codes.DB_READING_ERROR, "description": description}), 500
 
-    # Поиск тг-пользователя в базе данных
     try:
-        tg_user = tg_user_by_id(telegram_id=telegram_id, session=session)
+        channels = [channel for channel in subscriptions.split(",") if channel]
+        results = await check_subscriptions(telegram_api, telegram_id, channels)
 
-        if tg_user is None:
-            new_tg_user = Telegram_User(
-                id=telegram_id,
-                username=username,
-            )
+    except Exception as e:
+        description = "An error occurred when getting chat members via bot"
+        logger.error(f"{description}: {e}")
+        return jsonify({"status": return_codes.BOT_ERROR, "description": description}), 500
 
-            add_database_entries(entries=new_tg_user, session=session)
+    return jsonify({
+        "status": return_codes.SUCCESS,
+        "subscriptions": results,
+        "subscribed": all(result is True for result in results.values()),
+    }), 200
 
-        else:
-            tg_user.last_enter = datetime.now(timezone.utc)
-            tg_user.username = username
 
-            session.commit()
+@app.route("/api/user_info/", methods=["POST"])
+@with_db_session
+async def user_info(session):
+    """Возвращает данные из базы данных о пользователе."""
+
+    params = UserInfoParams(**request.get_json())
+
+    telegram_id = params.telegram_id
+    username = params.username
+    event_id = params.event_id
+
+    # Запись входа тг-пользователя в базу данных
+    try:
+        await touch_tg_user(telegram_id=telegram_id, username=username, session=session)
 
     except Exception as e:
         description = f"Error when trying to add a new user with id {telegram_id} to the database"
@@ -329,7 +413,7 @@ async def user_info():
 
     # Поиск посещенных каналов в базе данных
     try:
-        channels = subscriber_visited_channels(telegram_id=telegram_id, session=session)
+        channels = await subscriber_visited_channels(telegram_id=telegram_id, session=session)
 
     except Exception as e:
         description = f"An error occurred when trying to find a list of visited channels by a user with id {telegram_id}"
@@ -338,7 +422,7 @@ async def user_info():
 
     # Поиск событий, в которых участвовал пользователь
     try:
-        participated_events = subscriber_participated_events(telegram_id=telegram_id, session=session)
+        participated_events = await subscriber_participated_events(telegram_id=telegram_id, session=session)
 
     except Exception as e:
         description = ("An error occurred when searching for a list of events"
@@ -363,7 +447,8 @@ async def user_info():
 
 
 @app.route("/api/get_price/", methods=["POST"])
-async def get_minter_price():
+@with_db_session
+async def get_minter_price(session):
     """Возвращает рассчитанную стоимость минта коллекции."""
 
     params = GetPriceParams(**request.get_json())
@@ -371,10 +456,8 @@ async def get_minter_price():
     telegram_id = params.telegram_id
     collection_images_cnt = params.collection_images_cnt
 
-    session = Session()
-
     try:
-        author = author_by_tg_id(telegram_id=telegram_id, session=session)
+        author = await author_by_tg_id(telegram_id=telegram_id, session=session)
 
         price = get_event_price(
             nfts_cnt=int(collection_images_cnt),
@@ -390,14 +473,29 @@ async def get_minter_price():
 
 
 @app.route("/api/random_nft/", methods=["GET"])
-async def get_rnd_image():
+def get_rnd_image():
     """Возвращает NFT из случайной комбинации слоёв."""
 
     try:
-        nft = get_random_nft()
-        nft_io = BytesIO()
-        nft.save(nft_io, "PNG")
-        nft_io.seek(0)
+        layer_bank = load_layer_bank()
+        combination = layer_bank.random_combination()
+        key = layer_bank.combination_key(*combination)
+
+        # Изображение комбинации не меняется, поэтому ключ комбинации служит ETag
+        if key in request.if_none_match:
+            response = app.response_class(status=304)
+            response.set_etag(key)
+            return response
+
+        render_cache = get_render_cache()
+        image = render_cache.get(key)
+
+        if image is None:
+            nft_io = BytesIO()
+            layer_bank.render(*combination).save(nft_io, "PNG")
+
+            image = nft_io.getvalue()
+            render_cache.put(key, image)
 
     except Exception as e:
         description = f"Error when trying to mix layers: {e}"
@@ -410,11 +508,12 @@ async def get_rnd_image():
             500,
         )
 
-    return send_file(nft_io, mimetype="image/png")
+    return send_file(BytesIO(image), mimetype="image/png", etag=key)
 
 
 @app.route("/api/add_transaction/", methods=["POST"])
-async def minter_transaction():
+@with_db_session
+async def minter_transaction(session):
     """Записывает новую транзакцию после создания события в базу данных."""
 
     params = AddTransactionParams(**request.get_json())
@@ -424,11 +523,9 @@ async def minter_transaction():
     # amount = params.amount
     event_id = params.event_id
 
-    session = Session()
-
     try:
         event_id = int(decrypt(event_id))
-        event = event_by_id(event_id=event_id, session=session)
+        event = await event_by_id(event_id=event_id, session=session)
 
         if event is None:
             description = f"The event with id {event_id} was not found"
@@ -443,45 +540,38 @@ async def minter_transaction():
         return jsonify({"status": return_codes.DB_WRITING_ERROR, "description": description}), 500
 
     try:
-        transaction = transaction_by_id(transaction_id=transaction_id, session=session)
+        transaction = await transaction_by_id(transaction_id=transaction_id, session=session)
 
         if transaction is None:
             description = f"The transaction with id {transaction_id} was not found"
             logger.error(description)
             return jsonify({"status": return_codes.NOT_FOUND, "description": description}), 404
 
+        # Статус транзакции определит периодическая задача sweep_transactions
         transaction.hash = transaction_hash
-        session.commit()
+        transaction.status = tasks_statuses.PENDING
+        await session.commit()
 
     except Exception as e:
         description = "Error when trying to write a transaction to the database"
         logger.error(f"{description}: {e}")
         return jsonify({"status": return_codes.DB_WRITING_ERROR, "description": description}), 500
 
-    try:
-        process_transaction.delay(transaction_id)
-
-    except Exception as e:
-        description = "Error when trying to add a transaction to the processing queue"
-        logger.error(f"{description}: {e}")
-        return jsonify({"status": return_codes.QUEUE_ERROR, "description": description}), 500
-
     return jsonify({"status": return_codes.SUCCESS, "transaction_id": transaction.id}), 200
 
 
 @app.route("/api/transaction_status/", methods=["POST"])
-async def transaction_status():
+@with_db_session
+async def transaction_status(session):
     """Возвращает статус транзации из базы данных."""
 
     params = TransactionStatusParams(**request.get_json())
 
     transaction_id = params.transaction_id
 
-    session = Session()
-
     # Попытка поиска в базе данных
     try:
-        transaction = transaction_by_id(transaction_id=transaction_id, session=session)
+        transaction = await transaction_by_id(transaction_id=transaction_id, session=session)
 
         if transaction is None:
             description = f"No transaction with id {transaction_id} was found"
@@ -499,7 +589,8 @@ async def transaction_status():
 
 
 @app.route("/api/author_info/", methods=["POST"])
-async def author_info():
+@with_db_session
+async def author_info(session):
     """Возвращает информацию об авторе."""
 
     params = AuthorInfoParams(**request.get_json())
@@ -507,25 +598,9 @@ async def author_info():
     telegram_id = params.telegram_id
     username = params.username
 
-    session = Session()
-
-    # Поиск тг-пользователя в базе данных
+    # Запись входа тг-пользователя в базу данных
     try:
-        tg_user = tg_user_by_id(telegram_id=telegram_id, session=session)
-
-        if tg_user is None:
-            new_tg_user = Telegram_User(
-                id=telegram_id,
-                username=username,
-            )
-
-            add_database_entries(entries=new_tg_user, session=session)
-
-        else:
-            tg_user.last_enter = datetime.now(timezone.utc)
-            tg_user.username = username
-
-            session.commit()
+        await touch_tg_user(telegram_id=telegram_id, username=username, session=session)
 
     except Exception as e:
         description = f"Error when trying to add a new user with id {telegram_id} to the database"
@@ -534,7 +609,7 @@ async def author_info():
 
     # Поиск пользователя в базе данных
     try:
-        author = author_by_tg_id(telegram_id=telegram_id, session=session)
+        author = await author_by_tg_id(telegram_id=telegram_id, session=session)
 
         if author is None:
             description = f"Author with id {telegram_id} was not found"
@@ -576,11 +651,7 @@ async def make_post():
         return jsonify({"status": return_codes.SERVER_ERROR, "description": description}), 500
 
     try:
-        requests.post(
-            url=f"https://api.telegram.org/bot{BOT_TOKEN}/sendPhoto",
-            params={"chat_id": telegram_id},
-            files={"photo": BytesIO(qrcode)},
-        )
+        await telegram_api.call("sendPhoto", chat_id=telegram_id, files={"photo": qrcode})
 
     except Exception as e:
         description = "An error occurred when sending a QR-code to the bot"
@@ -588,13 +659,11 @@ async def make_post():
         return jsonify({"status": return_codes.BOT_ERROR, "description": description}), 500
 
     try:
-        requests.post(
-            url=f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage",
-            params={
-                "chat_id": telegram_id,
-                "text": description,
-                "reply_markup": json.dumps(keyboard),
-            },
+        await telegram_api.call(
+            "sendMessage",
+            chat_id=telegram_id,
+            text=description,
+            reply_markup=json.dumps(keyboard),
         )
 
     except Exception as e:
@@ -606,14 +675,49 @@ async def make_post():
 
 
 @app.route("/api/get_wallet/", methods=["GET"])
-async def get_wallet():
+def get_wallet():
     """Возвращает адрес кошелька приложения."""
 
     return jsonify({"status": return_codes.SUCCESS, "wallet": LIDUM_WALLET_ADDRESS}), 200
 
 
+@app.route("/api/upload_image/", methods=["POST"])
+def upload_image():
+    """Принимает изображение события в теле запроса и сохраняет его во временный файл.
+    Полученный идентификатор передается в `upload_id` при создании события."""
+
+    if request.mimetype not in ("image/png", "image/jpeg"):
+        description = "The image must be sent with the image/png or image/jpeg content type"
+        logger.error(description)
+        return jsonify({"status": return_codes.VALIDATE_ERROR, "description": description}), 400
+
+    if request.content_length is not None and request.content_length > MAX_IMAGE_SIZE:
+        description = f"The image must not exceed {MAX_IMAGE_SIZE} bytes"
+        logger.error(description)
+        return jsonify({"status": return_codes.UPLOAD_TOO_LARGE, "description": description}), 413
+
+    try:
+        upload_id = save_upload(request.stream, MAX_IMAGE_SIZE)
+
+    except UploadTooLargeError as e:
+        logger.error(e)
+        return jsonify({"status": return_codes.UPLOAD_TOO_LARGE, "description": str(e)}), 413
+
+    except InvalidImageError as e:
+        logger.error(e)
+        return jsonify({"status": return_codes.VALIDATE_ERROR, "description": str(e)}), 400
+
+    except Exception as e:
+        description = "An error occurred when uploading an image to the server"
+        logger.error(f"{description}: {e}")
+        return jsonify({"status": return_codes.SERVER_WRITING_ERROR, "description": description}), 500
+
+    return jsonify({"status": return_codes.SUCCESS, "upload_id": upload_id}), 200
+
+
 @app.route("/api/create_event/", methods=["POST"])
-async def create_event():
+@with_db_session
+async def create_event(session):
     """Запись данных о новом событии и минт пустой коллекции."""
 
     params = CreateEventParams(**request.get_json())
@@ -626,6 +730,7 @@ async def create_event():
     nfts_cnt = params.nfts_cnt
     image_name = params.image_name
     image = params.image
+    upload_id = params.upload_id
     start_date = params.start_date
     end_date = params.end_date
     password = params.password
@@ -635,11 +740,34 @@ async def create_event():
     event_id = params.event_id
     invite = params.invite
 
-    session = Session()
+    # Сохранение изображения из base64 строки во временный файл
+    try:
+        if upload_id is None:
+            upload_id = await asyncio.to_thread(save_base64_upload, image)
+
+        elif not is_uploaded(upload_id):
+            description = f"The uploaded image {upload_id} was not found"
+            logger.error(description)
+            return jsonify({"status": return_codes.NOT_FOUND, "description": description}), 404
+
+    except InvalidImageError as e:
+        logger.error(e)
+        return jsonify({"status": return_codes.VALIDATE_ERROR, "description": str(e)}), 400
+
+    except Exception as e:
+        description = "An error occurred when uploading an image to the server"
+        logger.error(f"{description}: {e}")
+        return (
+            jsonify({
+                "status": return_codes.SERVER_WRITING_ERROR,
+                "description": description,
+            }),
+            500,
+        )
 
     # Проверка на наличие автора в БД
     try:
-        author = author_by_tg_id(telegram_id=telegram_id, session=session)
+        author = await author_by_tg_id(telegram_id=telegram_id, session=session)
 
         # Проверка соответствия сохраненного названия коллекции с полученным,
         # если автор уже есть в базе данных
@@ -674,7 +802,7 @@ async def create_event():
                 is_testnet=app.config["TESTNET"],
             )
 
-            add_database_entries(entries=new_author, session=session)
+            session.add(new_author)
 
     except Exception as e:
         description = f"Error when trying to prepare an entry about a new author with id {telegram_id}"
@@ -684,14 +812,14 @@ async def create_event():
     # Обработка транзакции за данное событие
     if event_id is not None:
         event_id = int(decrypt(str(event_id)))
-        event = event_by_id(event_id=event_id, session=session)
+        event = await event_by_id(event_id=event_id, session=session)
 
         if event is None:
             description = f"The event with id {event_id} was not found"
             logger.error(description)
             return jsonify({"status": return_codes.NOT_FOUND, "description": description}), 404
 
-        transaction = transaction_by_id(transaction_id=event.transaction_id, session=session)
+        transaction = await transaction_by_id(transaction_id=event.transaction_id, session=session)
 
         if transaction is None:
             description = f"The transaction of event with id {event_id} was not found."
@@ -712,6 +840,7 @@ async def create_event():
         event.event_name = event_name
         event.event_description = event_description
         event.image_name = image_name
+        event.image_hash = upload_id
         event.start_date = start_date
         event.end_date = end_date
         event.password = password
@@ -719,7 +848,6 @@ async def create_event():
         event.subscriptions = subscriptions
         event.user_timezone = user_timezone
 
-        session.commit()
         new_event = event
 
     # Создание записи о новой транзакции
@@ -732,7 +860,7 @@ async def create_event():
                 is_testnet=app.config["TESTNET"],
             )
 
-            add_database_entries(entries=new_transaction, session=session)
+            await stage_database_entries(entries=new_transaction, session=session)
 
         except Exception as e:
             description = "Error when trying to prepare an entry about a new transaction"
@@ -752,6 +880,7 @@ async def create_event():
                 event_name=event_name,
                 transaction_id=new_transaction.id,
                 image_name=image_name,
+                image_hash=upload_id,
                 nfts_cnt=nfts_cnt,
                 start_date=start_date,
                 end_date=end_date,
@@ -762,7 +891,7 @@ async def create_event():
                 user_timezone=user_timezone,
             )
 
-            add_database_entries(entries=new_event, session=session)
+            session.add(new_event)
 
         except Exception as e:
             description = "Error when trying to prepare an entry about a new event"
@@ -775,51 +904,35 @@ async def create_event():
                 500,
             )
 
-    # Загрузка изображения в директорию коллекции
+    # Сохранение автора, транзакции и события одной транзакцией. При ошибке на любом из
+    # предыдущих шагов сессия закрывается без фиксации и записи не сохраняются
     try:
-        image_path = get_nft_image_path(collection_name, telegram_id, image_name)
+        await session.commit()
 
-        image = decode_base64_image(image)
-        save_base64_image(image, image_path)
+        if event_id is not None:
+            await invalidate_event_info(event_id)
 
     except Exception as e:
-        description = "An error occurred when uploading an image to the server"
+        description = "Error when trying to save the event to the database"
         logger.error(f"{description}: {e}")
-        return (
-            jsonify({
-                "status": return_codes.SERVER_WRITING_ERROR,
-                "description": description,
-            }),
-            500,
-        )
+        return jsonify({"status": return_codes.DB_WRITING_ERROR, "description": description}), 500
 
-    # Создание метадаты для новых NFT
+    # Добавление задачи на обработку изображения и создание метадаты, а затем на минт
+    # пустой коллекции
+    # TODO: ЗАПУСКАТЬ МИНТ ПОСЛЕ ОПЛАТЫ
     try:
-        create_metadata(telegram_id, collection_name, event_description, image_name)
+        image_task = process_event_image.si(telegram_id, collection_name, event_description, image_name, upload_id)
 
-    except Exception as e:
-        description = "An error occurred when writing metadata"
-        logger.error(f"{description}: {e}")
-        return (
-            jsonify({
-                "status": return_codes.SERVER_WRITING_ERROR,
-                "description": description,
-            }),
-            500,
-        )
-
-    # Добавление задачи на минт пустой коллекции
-    # TODO: ЗАПУСКАТЬ ПОСЛЕ ОПЛАТЫ
-    try:
+        # Без изображения и метаданных коллекция не минтится, поэтому при ошибке обработки
+        # минт коллекции отмечается неудавшимся
         if author is None:
-            collection_mint.delay(
-                telegram_id,
-                collection_meta_path,
-                nft_item_content_base_uri,
-            )
+            image_task.link_error(collection_mint_failed.s(telegram_id))
+            image_task |= collection_mint.si(telegram_id, collection_meta_path, nft_item_content_base_uri)
+
+        await asyncio.to_thread(image_task.delay)
 
     except Exception as e:
-        description = "Error when trying to add a collection to the processing queue"
+        description = "Error when trying to add an image and a collection to the processing queue"
         logger.error(f"{description}: {e}")
         return jsonify({"status": return_codes.QUEUE_ERROR, "description": description}), 500
 
@@ -827,9 +940,10 @@ async def create_event():
 
 
 @app.route("/api/send_nft/", methods=["POST"])
-async def send_nft():
-    """Минтит NFT из события на кошелек приложения, а затем отправляет его
-    пользователю."""
+@with_db_session
+async def send_nft(session):
+    """Резервирует NFT события за пользователем и ставит заявку на него в очередь
+    батчевого минта."""
 
     params = SendNFTParams(**request.get_json())
 
@@ -837,98 +951,80 @@ async def send_nft():
     wallet_address = params.wallet_address
     event_id = params.event_id
 
-    session = Session()
-
-    # Поиск события в базе данных
+    # Поиск события в кэше, либо в базе данных
     try:
         event_id = int(decrypt(event_id))
-        event = event_by_id(event_id=event_id, session=session)
+        event_info = await load_event_info(event_id, session)
 
-        if event is None:
+        if event_info is None:
             description = f"Event with id {event_id} was not found"
             logger.error(description)
             return jsonify({"status": return_codes.NOT_FOUND, "description": description}), 404
 
-        author = author_by_tg_id(telegram_id=event.telegram_id, session=session)
-
-        image_name = event.image_name
-        minted_nfts = event.minted_nfts
-        nfts_cnt = event.nfts_cnt
-
-        collection_address = author.collection_address
-
     except Exception as e:
         description = "Error when trying to get data from the database"
         logger.error(f"{description}: {e}")
         return jsonify({"status": return_codes.DB_READING_ERROR, "description": description}), 500
 
-    # Поиск событий, в которых участвовал пользователь
+    # Атомарное резервирование NFT события за пользователем
     try:
-        participated_events = subscriber_participated_events(telegram_id=telegram_id, session=session)
+        reservation = await reserve_nft(event_id, telegram_id)
 
-    except Exception as e:
-        description = ("An error occurred when searching for a list of events"
-                       f"in which a user with id {telegram_id} participated.")
-        logger.error(f"{description}: {e}")
-        return jsonify({"status": return_codes.DB_WRITING_ERROR, "description": description}), 500
+        # Остаток считается по участникам из БД, так как счетчик в кэше может устареть
+        if reservation == reservations.NOT_LOADED:
+            claimants = await event_claimants(event_id=event_id, session=session)
+            await load_reservations(event_id, event_info["nfts_cnt"] - len(claimants), claimants)
 
-    # Проверки на актуальность события
-    try:
-        # Проверка на остаток NFT
-        if minted_nfts >= nfts_cnt:
-            description = "All NFTs from this event have already been received"
-            logger.error(description)
-            return jsonify({"status": return_codes.EVENT_NFTS_LEFT, "description": description}), 400
-
-        # Проверка на повторное участие пользователя в событии
-        if event_id in participated_events:
-            description = f"The user with id {telegram_id} has already received the NFT from this event"
-            logger.error(description)
-            return jsonify({"status": return_codes.REPEAT_USER, "description": description}), 400
+            reservation = await reserve_nft(event_id, telegram_id)
 
     except Exception as e:
         description = f"Error when trying to check the relevance of the event with id {event_id}"
         logger.error(f"{description}: {e}")
         return jsonify({"status": return_codes.SERVER_ERROR, "description": description}), 500
 
+    # Проверка на остаток NFT
+    if reservation == reservations.NFTS_LEFT:
+        description = "All NFTs from this event have already been received"
+        logger.error(description)
+        return jsonify({"status": return_codes.EVENT_NFTS_LEFT, "description": description}), 400
+
+    # Проверка на повторное участие пользователя в событии
+    if reservation == reservations.REPEAT_USER:
+        description = f"The user with id {telegram_id} has already received the NFT from this event"
+        logger.error(description)
+        return jsonify({"status": return_codes.REPEAT_USER, "description": description}), 400
+
+    # Запись в базу данных до постановки заявки в очередь, чтобы не минтить NFT без записи
     try:
-        nft_mint.delay(
-            event.telegram_id,
-            wallet_address,
-            collection_address,
-            to_json_ext(image_name),
-        )
+        await record_claim(event_id=event_id, telegram_id=telegram_id, wallet_address=wallet_address, session=session)
 
     except Exception as e:
-        description = "Error when trying to add a nft to the processing queue"
+        await release_nft(event_id, telegram_id)
+
+        description = "Error when trying to write data to the database"
         logger.error(f"{description}: {e}")
-        return jsonify({"status": return_codes.QUEUE_ERROR, "description": description}), 500
+        return jsonify({"status": return_codes.DB_WRITING_ERROR, "description": description}), 500
 
-    # Запись в базу данных
     try:
-        event.minted_nfts += 1
-
-        new_participated_event = Subscriber_Event(
-            telegram_id=telegram_id,
-            wallet_address=wallet_address,
-            participated_event=event_id,
+        await asyncio.to_thread(
+            enqueue_claim,
+            event_info["telegram_id"],
+            wallet_address,
+            event_info["collection_address"],
+            to_json_ext(event_info["image_name"]),
         )
 
-        add_database_entries(entries=new_participated_event, session=session)
-
     except Exception as e:
-        description = "Error when trying to write data to the database"
+        await remove_claim(event_id=event_id, telegram_id=telegram_id, session=session)
+        await release_nft(event_id, telegram_id)
+
+        description = "Error when trying to add a nft to the processing queue"
         logger.error(f"{description}: {e}")
-        return jsonify({"status": return_codes.DB_WRITING_ERROR, "description": description}), 500
+        return jsonify({"status": return_codes.QUEUE_ERROR, "description": description}), 500
 
     return jsonify({"status": return_codes.SUCCESS}), 200
 
 
-@app.teardown_appcontext
-def shutdown_session(exception=None):
-    Session.remove()
-
-
 def validate_params(data, required_params: dict):
     """Проверяет наличие и тип необходимых параметров в пришедшем запросе."""
 
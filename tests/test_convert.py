@@ -0,0 +1,38 @@
+import base64
+
+import pytest
+from tonsdk.boc import Cell
+
+from lidum.utils.convert import hash_to_hex
+
+# Внешнее сообщение перевода с кошелька v4r2, как его возвращает TON Connect
+EXTERNAL_MESSAGE_BOC = (
+    "te6cckEBAgEAswAB4YgBpuKHOE34WmY8I9Ktt/XMBWkiFhZgAXuh8b+vubMaKGwHHVx6UMQiGoCEEssjdnPGheP8acoNLscXKAZyLp1kqBSaoc7h"
+    "fFv/mcxNVUTL/Wjv5B4Xhq6QrbLPiCDQEzpgEU1NGLtWlmy4AAAAGAAcAQB6YgAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAACHc1lAA"
+    "AAAAAAAAAAAAAAAAAAAAAABsaWR1bRi1tiw=")
+
+# Хэш этого сообщения в виде, в котором Tonapi возвращает `in_msg.hash` транзакции
+EXTERNAL_MESSAGE_HASH = "69b56dd40ac0694b388f064ae438b71cb936cffeefe1673bb99e63b760d5e094"
+
+
+def test_frontend_boc_hash_matches_tonapi_message_hash():
+    # Фронтенд сохраняет bytesToBase64(Cell.oneFromBoc(boc).hash())
+    frontend_hash = base64.b64encode(Cell.one_from_boc(base64.b64decode(EXTERNAL_MESSAGE_BOC)).bytes_hash()).decode()
+
+    assert frontend_hash == "abVt1ArAaUs4jwZK5Di3HLk2z/7v4Wc7uZ5jt2DV4JQ="
+    assert hash_to_hex(frontend_hash) == hash_to_hex(EXTERNAL_MESSAGE_HASH) == EXTERNAL_MESSAGE_HASH
+
+
+@pytest.mark.parametrize("value", [
+    EXTERNAL_MESSAGE_HASH.upper(),
+    "abVt1ArAaUs4jwZK5Di3HLk2z_7v4Wc7uZ5jt2DV4JQ=",
+    "abVt1ArAaUs4jwZK5Di3HLk2z/7v4Wc7uZ5jt2DV4JQ",
+])
+def test_hash_encodings_are_normalized(value):
+    assert hash_to_hex(value) == EXTERNAL_MESSAGE_HASH
+
+
+@pytest.mark.parametrize("value", ["z" * 64, "abVt1ArAaUs4jwZK5Di3HLk2z!7v4Wc7uZ5jt2DV4JQ="])
+def test_invalid_hash_is_rejected(value):
+    with pytest.raises(ValueError):
+        hash_to_hex(value)
@@ -0,0 +1,62 @@
+import pytest
+from tonsdk.utils import Address
+
+from lidum.utils.nft_address import nft_item_address
+from lidum.utils.nft_address import nft_item_addresses
+
+COLLECTION_ADDRESSES = [
+    "0:" + "00" * 32,
+    "0:" + "5f" * 32,
+    "-1:" + "ff" * 32,
+    Address("0:" + "a1" * 32).to_string(True, True, True),
+]
+
+# Границы, на которых меняется количество значащих байтов индекса
+INDEXES = [0, 1, 2, 254, 255, 256, 257, 65534, 65535, 65536, 65537, 2**32 - 1, 2**32, 2**64 - 2]
+
+# Адреса, которые вернул get-метод `get_nft_address_by_index` коллекции NFTCollection из
+# tonsdk с кодом `NFTItem.code`, как её деплоит приложение. Метод выполнен эмулятором TVM
+# с адресом коллекции в c7, поэтому векторы не зависят от вычисления адреса в этом модуле
+GET_METHOD_VECTORS = [
+    ("0:e6baf8c694d46d1dbb4fde211dedb002952076dc37563b7fad1cf812f7917fa5", 0,
+     "0:e01b8a7fcebbf8588d3898859225540d8f27ff8f31d7a97f875539e206af5087"),
+    ("0:e6baf8c694d46d1dbb4fde211dedb002952076dc37563b7fad1cf812f7917fa5", 255,
+     "0:2b60463c48960d8fa572dbe320f0fdc3af75575d142d9573eb6772253d3e88e9"),
+    ("0:e6baf8c694d46d1dbb4fde211dedb002952076dc37563b7fad1cf812f7917fa5", 256,
+     "0:48f0d2386d2f2ee633a9ec692aa32416fbcd16181ac40b01da41ed8507759aca"),
+    ("0:e6baf8c694d46d1dbb4fde211dedb002952076dc37563b7fad1cf812f7917fa5", 2**32,
+     "0:f654c52163fb85e8847dd60e41124c42597c05956908ba3a4fb55a235844b5be"),
+    ("-1:e6baf8c694d46d1dbb4fde211dedb002952076dc37563b7fad1cf812f7917fa5", 1,
+     "0:3565b0baa6eb2c0151a5d4406062abb970909c13aaef2e3d7868aecdefd2a957"),
+    ("-1:e6baf8c694d46d1dbb4fde211dedb002952076dc37563b7fad1cf812f7917fa5", 65536,
+     "0:65cef7c44d75dd76ce58c8c3a9512495d0077720993d8a3ed3fc97e3e09b87d6"),
+]
+
+
+@pytest.mark.parametrize(("collection_address", "index", "nft_address"), GET_METHOD_VECTORS)
+def test_address_matches_get_method(collection_address, index, nft_address):
+    expected = Address(nft_address).to_string(True, True, True)
+
+    assert nft_item_address(collection_address, index) == expected
+    assert nft_item_addresses(collection_address, index, 1) == [expected]
+
+
+@pytest.mark.parametrize("collection_address", COLLECTION_ADDRESSES)
+@pytest.mark.parametrize("index", INDEXES)
+def test_single_address_matches_state_init(collection_address, index):
+    assert nft_item_addresses(collection_address, index, 1) == [nft_item_address(collection_address, index)]
+
+
+@pytest.mark.parametrize("collection_address", COLLECTION_ADDRESSES)
+@pytest.mark.parametrize("from_index", [250, 65530])
+def test_batch_across_byte_boundary_matches_state_init(collection_address, from_index):
+    expected = [nft_item_address(collection_address, index) for index in range(from_index, from_index + 12)]
+
+    assert nft_item_addresses(collection_address, from_index, 12) == expected
+
+
+def test_raw_and_friendly_collection_addresses_match():
+    raw_address = "0:" + "3c" * 32
+    friendly_address = Address(raw_address).to_string(True, True, True)
+
+    assert nft_item_addresses(raw_address, 255, 3) == nft_item_addresses(friendly_address, 255, 3)